@@ -99,6 +99,7 @@ class Offer(NamedTuple):
     pro_rata: bool = False
     size: int = 1
     tracing_id: bytes = random.randbytes(32)
+    nonce: int = 0
 
 
 Signature = namedtuple("Signature", ["v", "r", "s"], defaults=[0, ZERO_BYTES32, ZERO_BYTES32])
@@ -242,6 +243,7 @@ def sign_offer(offer: Offer, lender, verifying_contract: str) -> SignedOffer:
                 {"name": "pro_rata", "type": "bool"},
                 {"name": "size", "type": "uint256"},
                 {"name": "tracing_id", "type": "bytes32"},
+                {"name": "nonce", "type": "uint256"},
             ],
         },
         "primaryType": "Offer",
@@ -314,6 +316,7 @@ def create_offer_backend(signer: Account, **offer):
     filtered_offer["trait_hash"] = bytes.fromhex(filtered_offer.get("trait_hash", ZERO_BYTES32))
     filtered_offer["collection_key_hash"] = bytes.fromhex(filtered_offer["collection_key_hash"])
     filtered_offer["tracing_id"] = bytes.fromhex(filtered_offer["tracing_id"])
+    filtered_offer["nonce"] = int(filtered_offer.get("nonce", 0))
     _offer = Offer(**filtered_offer)
 
     verifying_contract = offer.get("p2p_contract")
@@ -334,6 +337,7 @@ def create_offer_backend(signer: Account, **offer):
         "size": _offer.size,
         "expiration": _offer.expiration,
         "tracing_id": _offer.tracing_id.hex(),
+        "nonce": str(_offer.nonce),
         "origination_fee_amount": str(_offer.origination_fee_amount),
         "broker_upfront_fee_amount": str(_offer.broker_upfront_fee_amount),
         "broker_settlement_fee_bps": _offer.broker_settlement_fee_bps,
@@ -380,6 +384,7 @@ def revoke_offer(signed_offer: dict, contract: str, *, sender):
     filtered_offer["trait_hash"] = bytes.fromhex(filtered_offer.get("trait_hash", ZERO_BYTES32))
     filtered_offer["collection_key_hash"] = bytes.fromhex(filtered_offer["collection_key_hash"])
     filtered_offer["tracing_id"] = bytes.fromhex(filtered_offer["tracing_id"])
+    filtered_offer["nonce"] = int(filtered_offer.get("nonce", 0))
 
     _offer = Offer(**filtered_offer)
     offer_signature = signed_offer.get("signature")
@@ -412,6 +417,7 @@ def create_loan(
     filtered_offer["trait_hash"] = bytes.fromhex(filtered_offer.get("trait_hash", ZERO_BYTES32))
     filtered_offer["collection_key_hash"] = bytes.fromhex(filtered_offer["collection_key_hash"])
     filtered_offer["tracing_id"] = bytes.fromhex(filtered_offer["tracing_id"])
+    filtered_offer["nonce"] = int(filtered_offer.get("nonce", 0))
     _offer = Offer(**filtered_offer)
     offer_signature = signed_offer.get("signature")
     _signed_offer = SignedOffer(
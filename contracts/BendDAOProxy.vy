@@ -83,6 +83,7 @@ struct Offer:
     pro_rata: bool
     size: uint256
     tracing_id: bytes32
+    nonce: uint256
 
 
 struct Signature:
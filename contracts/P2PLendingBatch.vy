@@ -0,0 +1,139 @@
+# @version 0.4.1
+
+"""
+@title P2PLendingBatch
+@author [Zharta](https://zharta.io/)
+@notice Batched views and operations over a P2PLendingNfts contract, allowing off-chain services to check many loans or
+    offers in a single call and lenders to revoke many offers in a single transaction.
+@dev P2PLendingNfts is close to the EIP-170 size limit, so the batched views live in this contract and read the public
+    getters of P2PLendingNfts. For the batched operations the contract must be authorized as a proxy in P2PLendingNfts,
+    which then identifies the caller by tx.origin, so they can only be called directly by an EOA.
+"""
+
+
+interface P2PLendingNfts:
+    def loans(loan_id: bytes32) -> bytes32: view
+    def revoked_offers(offer_id: bytes32) -> bool: view
+    def offer_count(tracing_id: bytes32) -> uint256: view
+    def lender_nonces(lender: address) -> uint256: view
+    def revoke_offer(offer: SignedOffer): nonpayable
+
+
+# Structs
+
+VIEW_BATCH_MAX_SIZE: constant(uint256) = 1024
+BATCH_MAX_SIZE: constant(uint256) = 32
+
+flag OfferType:
+    TOKEN
+    COLLECTION
+    TRAIT
+
+struct Offer:
+    principal: uint256
+    interest: uint256
+    payment_token: address
+    duration: uint256
+    origination_fee_amount: uint256
+    broker_upfront_fee_amount: uint256
+    broker_settlement_fee_bps: uint256
+    broker_address: address
+    offer_type: OfferType
+    token_id: uint256
+    token_range_min: uint256
+    token_range_max: uint256
+    collection_key_hash: bytes32
+    trait_hash: bytes32
+    expiration: uint256
+    lender: address
+    pro_rata: bool
+    size: uint256
+    tracing_id: bytes32
+    nonce: uint256
+
+struct Signature:
+    v: uint256
+    r: uint256
+    s: uint256
+
+struct SignedOffer:
+    offer: Offer
+    signature: Signature
+
+struct OfferStateRequest:
+    offer_id: bytes32
+    tracing_id: bytes32
+    size: uint256
+    lender: address
+    nonce: uint256
+
+struct OfferState:
+    revoked: bool
+    remaining: uint256
+
+
+p2p_lending_nfts: public(immutable(address))
+
+
+@deploy
+def __init__(_p2p_lending_nfts: address):
+    p2p_lending_nfts = _p2p_lending_nfts
+
+
+@view
+@external
+def loan_hashes(loan_ids: DynArray[bytes32, VIEW_BATCH_MAX_SIZE]) -> DynArray[bytes32, VIEW_BATCH_MAX_SIZE]:
+
+    """
+    @notice Get the stored hashes of several loans, as returned by `P2PLendingNfts.loans`.
+    @dev A loan is valid if its hash, `keccak256(abi_encode(loan))`, matches the stored one.
+    @param loan_ids The loan ids.
+    @return The hash of each loan, in the same order, or empty for loans that are not ongoing.
+    """
+
+    hashes: DynArray[bytes32, VIEW_BATCH_MAX_SIZE] = []
+    for loan_id: bytes32 in loan_ids:
+        hashes.append(staticcall P2PLendingNfts(p2p_lending_nfts).loans(loan_id))
+    return hashes
+
+
+@view
+@external
+def offer_states(offers: DynArray[OfferStateRequest, VIEW_BATCH_MAX_SIZE]) -> DynArray[OfferState, VIEW_BATCH_MAX_SIZE]:
+
+    """
+    @notice Get the state of several offers, as given by `P2PLendingNfts.revoked_offers`, `P2PLendingNfts.lender_nonces`
+        and `P2PLendingNfts.offer_count`.
+    @dev An offer can still be accepted if it isn't revoked and has remaining capacity (and hasn't expired).
+    @param offers The offer id, tracing id, size, lender and nonce of each offer.
+    @return The state of each offer, in the same order: whether it was revoked, either by itself or by a change of the
+        lender nonce, and how many loans can still be created from it.
+    """
+
+    states: DynArray[OfferState, VIEW_BATCH_MAX_SIZE] = []
+    for offer: OfferStateRequest in offers:
+        count: uint256 = staticcall P2PLendingNfts(p2p_lending_nfts).offer_count(offer.tracing_id)
+        states.append(OfferState(
+            revoked=(
+                staticcall P2PLendingNfts(p2p_lending_nfts).revoked_offers(offer.offer_id)
+                or offer.nonce != staticcall P2PLendingNfts(p2p_lending_nfts).lender_nonces(offer.lender)
+            ),
+            remaining=offer.size - min(count, offer.size)
+        ))
+    return states
+
+
+@external
+def revoke_offers(offers: DynArray[SignedOffer, BATCH_MAX_SIZE]):
+
+    """
+    @notice Revoke several offers in a single transaction.
+    @dev Each offer is revoked by `P2PLendingNfts.revoke_offer`, which checks that it belongs to the sender (tx.origin), is
+        signed by it, hasn't expired and wasn't revoked yet, and logs `OfferRevoked`. If any of the offers fails those
+        checks, none is revoked.
+    @param offers The signed offers to be revoked.
+    """
+
+    assert msg.sender == tx.origin, "not EOA"
+    for offer: SignedOffer in offers:
+        extcall P2PLendingNfts(p2p_lending_nfts).revoke_offer(offer)
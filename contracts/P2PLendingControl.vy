@@ -14,6 +14,7 @@
 struct CollectionStatus:
     contract: address
     trait_root: bytes32
+    trait_root_version: uint256
 
 struct CollectionContract:
     collection_key_hash: bytes32
@@ -22,6 +23,7 @@ struct CollectionContract:
 struct TraitRoot:
     collection_key_hash: bytes32
     root_hash: bytes32
+    version: uint256
 
 # Events
 
@@ -42,6 +44,13 @@ event OwnershipTransferred:
 # Global variables
 
 CHANGE_BATCH: constant(uint256) = 128
+MULTIPROOF_MAX_LEAVES: constant(uint256) = 32
+# a multiproof has at most 255 merge steps, so that the flags fit in a single word
+MULTIPROOF_MAX_SIZE: constant(uint256) = 256 - MULTIPROOF_MAX_LEAVES
+
+# trait tree formats, differing in how two nodes are merged into their parent
+TRAIT_ROOT_VERSION_XOR_MERGE: constant(uint256) = 0  # keccak256(keccak256(a) ^ keccak256(b))
+TRAIT_ROOT_VERSION_SORTED_PAIR: constant(uint256) = 1  # keccak256(min(a, b) ++ max(a, b))
 
 VERSION: public(constant(String[30])) = "P2PLendingControl.20241002"
 
@@ -54,7 +63,9 @@ contracts: public(HashMap[bytes32, address])
 # all valid (contract, trait, token_id) tuples are stored in the tree and the root
 # is stored in the contract for each collection.
 # The collection key is hashed and must match the collection key hash in the offer.
+# Each root has the version of the tree format, roots set before versioning are TRAIT_ROOT_VERSION_XOR_MERGE.
 trait_roots: public(HashMap[bytes32, bytes32])
+trait_root_versions: public(HashMap[bytes32, uint256])
 
 
 @deploy
@@ -110,11 +121,13 @@ def change_collections_contracts(collections: DynArray[CollectionContract, CHANG
 def change_collections_trait_roots(roots: DynArray[TraitRoot, CHANGE_BATCH]):
     """
     @notice Set trait roots
-    @param roots array of bytes32
+    @param roots array of TraitRoot, each with the version of its tree format
     """
     assert msg.sender == self.owner, "sender not owner"
     for r: TraitRoot in roots:
+        assert r.version <= TRAIT_ROOT_VERSION_SORTED_PAIR, "invalid root version"
         self.trait_roots[r.collection_key_hash] = r.root_hash
+        self.trait_root_versions[r.collection_key_hash] = r.version
 
     log TraitRootChanged(roots)
 
@@ -125,9 +138,88 @@ def get_collection_status(collection_key_hash: bytes32) -> CollectionStatus:
     """
     @notice Get the collection status
     @param collection_key_hash hash of the collection key
-    @return the contract address and traits root
+    @return the contract address, traits root and its version
     """
     return CollectionStatus(
         contract=self.contracts[collection_key_hash],
-        trait_root=self.trait_roots[collection_key_hash]
+        trait_root=self.trait_roots[collection_key_hash],
+        trait_root_version=self.trait_root_versions[collection_key_hash]
     )
+
+
+@external
+@view
+def get_collection_statuses(collection_key_hashes: DynArray[bytes32, CHANGE_BATCH]) -> DynArray[CollectionStatus, CHANGE_BATCH]:
+    """
+    @notice Get the status of several collections
+    @param collection_key_hashes hashes of the collection keys
+    @return the status of each collection, in the same order, see get_collection_status
+    """
+    statuses: DynArray[CollectionStatus, CHANGE_BATCH] = []
+    for key_hash: bytes32 in collection_key_hashes:
+        statuses.append(CollectionStatus(
+            contract=self.contracts[key_hash],
+            trait_root=self.trait_roots[key_hash],
+            trait_root_version=self.trait_root_versions[key_hash]
+        ))
+    return statuses
+
+
+@external
+@view
+def is_trait_multiproof_valid(
+    collection_key_hash: bytes32,
+    leaves: DynArray[bytes32, MULTIPROOF_MAX_LEAVES],
+    proof: DynArray[bytes32, MULTIPROOF_MAX_SIZE],
+    flags: uint256
+) -> bool:
+    """
+    @notice Check several leafs of a collection trait tree at once
+    @dev Nodes are merged in order, starting with the leafs and following with each computed node. For merge step i,
+        the bit i of the flags tells if the node is merged with the node following it (set) or with the next element
+        of the proof (not set). The leafs must be ordered by descending position in the tree, so that siblings are
+        always consecutive. The multiproof is valid if every node but the last computed one is merged and that one is
+        the trait root.
+    @param collection_key_hash hash of the collection key
+    @param leaves array of leafs, as keccak256(_abi_encode(collection_address, trait_hash, token_id))
+    @param proof array of the nodes not computed from the leafs
+    @param flags bitmap with one bit per merge step
+    @return true if the leafs are part of the collection trait tree
+    """
+    if len(leaves) == 0:
+        return False
+    sorted_pair: bool = self.trait_root_versions[collection_key_hash] == TRAIT_ROOT_VERSION_SORTED_PAIR
+
+    # the leafs and the computed nodes form a queue, consumed from pos as the nodes are merged
+    nodes: DynArray[bytes32, 2 * MULTIPROOF_MAX_LEAVES + MULTIPROOF_MAX_SIZE] = leaves
+    pos: uint256 = 0
+    proof_pos: uint256 = 0
+    remaining_flags: uint256 = flags
+    # pos and proof_pos are bound by the lengths of nodes and proof, so unchecked arithmetic is safe
+    for i: uint256 in range(len(leaves) + len(proof) - 1, bound=MULTIPROOF_MAX_LEAVES + MULTIPROOF_MAX_SIZE - 1):
+        if pos == len(nodes):
+            return False
+        node: bytes32 = nodes[pos]
+        sibling: bytes32 = empty(bytes32)
+        if remaining_flags & 1 != 0:
+            pos = unsafe_add(pos, 1)
+            if pos == len(nodes):
+                return False
+            sibling = nodes[pos]
+        else:
+            if proof_pos == len(proof):
+                return False
+            sibling = proof[proof_pos]
+            proof_pos = unsafe_add(proof_pos, 1)
+        pos = unsafe_add(pos, 1)
+        remaining_flags = remaining_flags >> 1
+        if not sorted_pair:
+            nodes.append(keccak256(abi_encode(convert(keccak256(node), uint256) ^ convert(keccak256(sibling), uint256))))
+        elif convert(node, uint256) < convert(sibling, uint256):
+            nodes.append(keccak256(abi_encode(node, sibling)))
+        else:
+            nodes.append(keccak256(abi_encode(sibling, node)))
+
+    if proof_pos != len(proof):
+        return False
+    return nodes[pos] == self.trait_roots[collection_key_hash]
@@ -40,12 +40,22 @@ interface DelegationRegistry:
 
 interface P2PLendingControl:
     def get_collection_status(collection_key_hash: bytes32) -> CollectionStatus: view
+    def is_trait_multiproof_valid(
+        collection_key_hash: bytes32,
+        leaves: DynArray[bytes32, BATCH_MAX_SIZE],
+        proof: DynArray[bytes32, MULTIPROOF_MAX_SIZE],
+        flags: uint256
+    ) -> bool: view
 
 # Structs
 
 PROOF_MAX_SIZE: constant(uint256) = 32
 MAX_FEES: constant(uint256) = 4
+BATCH_MAX_SIZE: constant(uint256) = 32
+MULTIPROOF_MAX_SIZE: constant(uint256) = 256 - BATCH_MAX_SIZE
+MAX_TRANSFERS: constant(uint256) = BATCH_MAX_SIZE * (MAX_FEES + 1)
 BPS: constant(uint256) = 10000
+TRAIT_ROOT_VERSION_SORTED_PAIR: constant(uint256) = 1
 
 flag FeeType:
     PROTOCOL_FEE
@@ -89,6 +99,7 @@ struct Offer:
     pro_rata: bool
     size: uint256
     tracing_id: bytes32
+    nonce: uint256
 
 
 struct Signature:
@@ -118,9 +129,28 @@ struct Loan:
     delegate: address
 
 
+struct CreateLoanRequest:
+    offer: SignedOffer
+    collateral_token_id: uint256
+    collateral_proof: DynArray[bytes32, PROOF_MAX_SIZE]
+    delegate: address
+    borrower_broker_upfront_fee_amount: uint256
+    borrower_broker_settlement_fee_bps: uint256
+    borrower_broker: address
+
+struct WalletAmount:
+    wallet: address
+    amount: uint256
+
+struct ProtocolFees:
+    upfront_fee: uint256
+    settlement_fee: uint256
+    wallet: address
+
 struct CollectionStatus:
     contract: address
     trait_root: bytes32
+    trait_root_version: uint256
 
 struct PunkOffer:
     isForSale: bool
@@ -239,6 +269,10 @@ event PendingTransfersClaimed:
     _to: address
     amount: uint256
 
+event LenderNonceIncremented:
+    lender: address
+    nonce: uint256
+
 
 # Global variables
 
@@ -261,20 +295,21 @@ max_borrower_broker_settlement_fee: public(immutable(uint256))
 
 offer_count: public(HashMap[bytes32, uint256])
 revoked_offers: public(HashMap[bytes32, bool])
+lender_nonces: public(HashMap[address, uint256])
 
 authorized_proxies: public(HashMap[address, bool])
 pending_transfers: public(HashMap[address, uint256])
 
-VERSION: public(constant(String[30])) = "P2PLendingNfts.20241002"
+VERSION: public(constant(String[30])) = "P2PLendingNfts.20261018"
 
 ZHARTA_DOMAIN_NAME: constant(String[6]) = "Zharta"
 ZHARTA_DOMAIN_VERSION: constant(String[1]) = "1"
 
 DOMAIN_TYPE_HASH: constant(bytes32) = keccak256("EIP712Domain(string name,string version,uint256 chainId,address verifyingContract)")
-OFFER_TYPE_DEF: constant(String[413]) = "Offer(uint256 principal,uint256 interest,address payment_token,uint256 duration,uint256 origination_fee_amount," \
+OFFER_TYPE_DEF: constant(String[427]) = "Offer(uint256 principal,uint256 interest,address payment_token,uint256 duration,uint256 origination_fee_amount," \
                                         "uint256 broker_upfront_fee_amount,uint256 broker_settlement_fee_bps,address broker_address," \
                                         "uint256 offer_type,uint256 token_id,uint256 token_range_min,uint256 token_range_max,bytes32 collection_key_hash," \
-                                        "bytes32 trait_hash,uint256 expiration,address lender,bool pro_rata,uint256 size,bytes32 tracing_id)"
+                                        "bytes32 trait_hash,uint256 expiration,address lender,bool pro_rata,uint256 size,bytes32 tracing_id,uint256 nonce)"
 OFFER_TYPE_HASH: constant(bytes32) = keccak256(OFFER_TYPE_DEF)
 
 offer_sig_domain_separator: immutable(bytes32)
@@ -449,71 +484,65 @@ def create_loan(
     """
 
 
-    assert self._is_offer_signed_by_lender(offer, offer.offer.lender), "offer not signed by lender"
-    assert offer.offer.expiration > block.timestamp, "offer expired"
-    assert offer.offer.payment_token == payment_token, "invalid payment token"
-    assert offer.offer.origination_fee_amount <= offer.offer.principal, "origination fee gt principal"
-
-    collection_status: CollectionStatus = staticcall p2p_control.get_collection_status(offer.offer.collection_key_hash)
-    self._validate_token_ids(offer.offer, collateral_token_id, collection_status, collateral_proof)
-
-    fees: DynArray[Fee, MAX_FEES] = self._get_loan_fees(offer.offer, borrower_broker_upfront_fee_amount, borrower_broker_settlement_fee_bps, borrower_broker)
-    total_upfront_fees: uint256 = 0
-    for fee: Fee in fees:
-        total_upfront_fees += fee.upfront_amount
-
-    offer_id: bytes32 = self._compute_signed_offer_id(offer)
-    loan: Loan = Loan(
-        id=empty(bytes32),
-        offer_id=offer_id,
-        offer_tracing_id=offer.offer.tracing_id,
-        amount=offer.offer.principal,
-        interest=offer.offer.interest,
-        payment_token=offer.offer.payment_token,
-        maturity=block.timestamp + offer.offer.duration,
-        start_time=block.timestamp,
-        borrower=msg.sender if not self.authorized_proxies[msg.sender] else tx.origin,
-        lender=offer.offer.lender,
-        collateral_contract=collection_status.contract,
-        collateral_token_id=collateral_token_id,
-        fees=fees,
-        pro_rata=offer.offer.pro_rata,
-        delegate=delegate
+    return self._create_loan(
+        CreateLoanRequest(
+            offer=offer,
+            collateral_token_id=collateral_token_id,
+            collateral_proof=collateral_proof,
+            delegate=delegate,
+            borrower_broker_upfront_fee_amount=borrower_broker_upfront_fee_amount,
+            borrower_broker_settlement_fee_bps=borrower_broker_settlement_fee_bps,
+            borrower_broker=borrower_broker
+        ),
+        msg.sender if not self.authorized_proxies[msg.sender] else tx.origin,
+        staticcall p2p_control.get_collection_status(offer.offer.collection_key_hash),
+        self._get_protocol_fees()
     )
-    loan.id = self._compute_loan_id(loan)
-
-    assert self.loans[loan.id] == empty(bytes32), "loan already exists"
-    self._check_and_update_offer_state(offer)
-    self.loans[loan.id] = self._loan_state_hash(loan)
 
-    self._store_collateral(loan.borrower, loan.collateral_contract, loan.collateral_token_id)
-    self._transfer_funds(loan.lender, loan.borrower, loan.amount - total_upfront_fees + offer.offer.broker_upfront_fee_amount)
 
-    for fee: Fee in fees:
-        if fee.type != FeeType.ORIGINATION_FEE and fee.upfront_amount > 0:
-            self._transfer_funds(loan.lender, fee.wallet, fee.upfront_amount)
+@external
+def create_loans(
+    requests: DynArray[CreateLoanRequest, BATCH_MAX_SIZE],
+    trait_proof: DynArray[bytes32, MULTIPROOF_MAX_SIZE],
+    trait_proof_flags: uint256
+) -> DynArray[bytes32, BATCH_MAX_SIZE]:
 
-    if delegate != empty(address):
-        self._set_delegation(delegate, loan.collateral_contract, loan.collateral_token_id, True)
+    """
+    @notice Create several loans in a single transaction.
+    @dev Each request is processed as in `create_loan`, emitting one `LoanCreated` event per loan. The protocol fees and the status of each collection are loaded once and shared by the requests. The whole batch reverts if any of the loans can't be created.
+        Trait offer requests with an empty `collateral_proof` are verified together by a single multiproof against the trait root of their collection, sharing the internal nodes of their paths (see `P2PLendingControl.is_trait_multiproof_valid`). Those requests must all be for the same collection and ordered as the leaves of the multiproof.
+    @param requests The loan requests, each with the signed offer, the collateral and the borrower broker fees.
+    @param trait_proof The sibling nodes of the multiproof, if any request uses it.
+    @param trait_proof_flags The multiproof flags, as a bitmap with one bit per merge step.
+    @return The IDs of the created loans, in the same order as the requests.
+    """
 
-    log LoanCreated(
-        loan.id,
-        loan.amount,
-        loan.interest,
-        loan.payment_token,
-        loan.maturity,
-        loan.start_time,
-        loan.borrower,
-        loan.lender,
-        loan.collateral_contract,
-        loan.collateral_token_id,
-        loan.fees,
-        loan.pro_rata,
-        offer_id,
-        offer.offer.tracing_id,
-        delegate
-    )
-    return loan.id
+    borrower: address = msg.sender if not self.authorized_proxies[msg.sender] else tx.origin
+    protocol_fees: ProtocolFees = self._get_protocol_fees()
+    collection_key_hash: bytes32 = empty(bytes32)
+    collection_status: CollectionStatus = empty(CollectionStatus)
+    loan_ids: DynArray[bytes32, BATCH_MAX_SIZE] = []
+    trait_leaves: DynArray[bytes32, BATCH_MAX_SIZE] = []
+    trait_collection_key_hash: bytes32 = empty(bytes32)
+
+    for request: CreateLoanRequest in requests:
+        if len(loan_ids) == 0 or request.offer.offer.collection_key_hash != collection_key_hash:
+            collection_key_hash = request.offer.offer.collection_key_hash
+            collection_status = staticcall p2p_control.get_collection_status(collection_key_hash)
+        request_status: CollectionStatus = collection_status
+        if request.offer.offer.offer_type == OfferType.TRAIT and len(request.collateral_proof) == 0:
+            # the leaf is checked against the trait root by the multiproof after the loop
+            if len(trait_leaves) == 0:
+                trait_collection_key_hash = collection_key_hash
+            assert collection_key_hash == trait_collection_key_hash, "multiproof collection mismatch"
+            request_status.trait_root = keccak256(abi_encode(collection_status.contract, request.offer.offer.trait_hash, request.collateral_token_id))
+            trait_leaves.append(request_status.trait_root)
+        loan_ids.append(self._create_loan(request, borrower, request_status, protocol_fees))
+
+    if len(trait_leaves) > 0:
+        assert staticcall p2p_control.is_trait_multiproof_valid(trait_collection_key_hash, trait_leaves, trait_proof, trait_proof_flags), "proof invalid"
+
+    return loan_ids
 
 
 @external
@@ -524,39 +553,58 @@ def settle_loan(loan: Loan):
     @param loan The loan to be settled.
     """
 
-    assert self._is_loan_valid(loan), "invalid loan"
-    assert block.timestamp <= loan.maturity, "loan defaulted"
-    assert self._check_user(loan.borrower), "not borrower"
-
-    interest: uint256 = self._compute_settlement_interest(loan)
-    settlement_fees_total: uint256 = 0
+    borrower_amount: uint256 = 0
+    lender_amount: uint256 = 0
+    interest: uint256 = 0
     settlement_fees: DynArray[FeeAmount, MAX_FEES] = []
-    borrower_broker_fee_amount: uint256 = 0
-    settlement_fees, settlement_fees_total, borrower_broker_fee_amount = self._get_settlement_fees(loan, interest)
+    borrower_amount, lender_amount, interest, settlement_fees = self._settle_loan(loan)
 
-    self.loans[loan.id] = empty(bytes32)
-    self._reduce_offer_count(loan.offer_tracing_id)
+    self._receive_funds(loan.borrower, borrower_amount)
 
-    self._receive_funds(loan.borrower, loan.amount + interest + borrower_broker_fee_amount)
-
-    self._send_funds(loan.lender, loan.amount + interest - settlement_fees_total + borrower_broker_fee_amount)
+    payouts: DynArray[WalletAmount, MAX_TRANSFERS] = [WalletAmount(wallet=loan.lender, amount=lender_amount)]
     for fee: FeeAmount in settlement_fees:
-        self._send_funds(fee.wallet, fee.amount)
+        payouts.append(WalletAmount(wallet=fee.wallet, amount=fee.amount))
+    self._send_netted_funds(payouts)
 
-    self._transfer_collateral(loan.borrower, loan.collateral_contract, loan.collateral_token_id)
+    self._release_collateral(loan, interest, settlement_fees)
 
-    if loan.delegate != empty(address):
-        self._set_delegation(loan.delegate, loan.collateral_contract, loan.collateral_token_id, False)
 
-    log LoanPaid(
-        loan.id,
-        loan.borrower,
-        loan.lender,
-        loan.payment_token,
-        loan.amount,
-        interest,
-        settlement_fees
-    )
+@external
+def settle_loans(loans: DynArray[Loan, BATCH_MAX_SIZE]):
+
+    """
+    @notice Settle several loans in a single transaction.
+    @dev Funds are pulled once per borrower and paid once per receiving wallet, netting the amounts of all the settled loans. The collaterals are only transferred after all the funds are moved.
+    @param loans The loans to be settled.
+    """
+
+    receipts: DynArray[WalletAmount, MAX_TRANSFERS] = []
+    payouts: DynArray[WalletAmount, MAX_TRANSFERS] = []
+    interests: DynArray[uint256, BATCH_MAX_SIZE] = []
+    loans_settlement_fees: DynArray[DynArray[FeeAmount, MAX_FEES], BATCH_MAX_SIZE] = []
+
+    for loan: Loan in loans:
+        borrower_amount: uint256 = 0
+        lender_amount: uint256 = 0
+        interest: uint256 = 0
+        settlement_fees: DynArray[FeeAmount, MAX_FEES] = []
+        borrower_amount, lender_amount, interest, settlement_fees = self._settle_loan(loan)
+
+        receipts.append(WalletAmount(wallet=loan.borrower, amount=borrower_amount))
+        payouts.append(WalletAmount(wallet=loan.lender, amount=lender_amount))
+        for fee: FeeAmount in settlement_fees:
+            payouts.append(WalletAmount(wallet=fee.wallet, amount=fee.amount))
+        interests.append(interest)
+        loans_settlement_fees.append(settlement_fees)
+
+    receipts = self._net_amounts(receipts)
+    for receipt: WalletAmount in receipts:
+        self._receive_funds(receipt.wallet, receipt.amount)
+
+    self._send_netted_funds(payouts)
+
+    for i: uint256 in range(len(loans), bound=BATCH_MAX_SIZE):
+        self._release_collateral(loans[i], interests[i], loans_settlement_fees[i])
 
 
 @external
@@ -567,7 +615,7 @@ def claim_defaulted_loan_collateral(loan: Loan):
     @param loan The loan whose collateral is to be claimed. The loan maturity must have been passed.
     """
 
-    assert self._is_loan_valid(loan), "invalid loan"
+    self._validate_loan(loan)
     assert block.timestamp > loan.maturity, "loan not defaulted"
     assert self._check_user(loan.lender), "not lender"
 
@@ -608,36 +656,20 @@ def replace_loan(
     @return The ID of the new loan.
     """
 
-    assert self._is_loan_valid(loan), "invalid loan"
+    self._validate_ongoing_loan(loan)
     assert self._check_user(loan.borrower), "not borrower"
-    assert block.timestamp <= loan.maturity, "loan defaulted"
-
-    assert self._is_offer_signed_by_lender(offer, offer.offer.lender), "offer not signed by lender"
-    assert offer.offer.expiration > block.timestamp, "offer expired"
-    assert offer.offer.payment_token == payment_token, "invalid payment token"
-    assert offer.offer.origination_fee_amount <= offer.offer.principal, "origination fee gt principal"
-
-    collection_status: CollectionStatus = staticcall p2p_control.get_collection_status(offer.offer.collection_key_hash)
-    self._validate_token_ids(offer.offer, loan.collateral_token_id, collection_status, collateral_proof)
-    assert collection_status.contract == loan.collateral_contract, "collateral contract mismatch"
 
-    self._check_and_update_offer_state(offer)
-    self._reduce_offer_count(loan.offer_tracing_id)
-
-    principal_delta: int256 = convert(offer.offer.principal, int256) - convert(loan.amount, int256)
-    interest: uint256 = self._compute_settlement_interest(loan)
-
-    settlement_fees_total: uint256 = 0
+    interest: uint256 = 0
     settlement_fees: DynArray[FeeAmount, MAX_FEES] = []
+    settlement_fees_total: uint256 = 0
     borrower_broker_fee_amount: uint256 = 0
-    settlement_fees, settlement_fees_total, borrower_broker_fee_amount = self._get_settlement_fees(loan, interest)
+    interest, settlement_fees, settlement_fees_total, borrower_broker_fee_amount = self._close_replaced_loan(loan, offer, collateral_proof)
 
-    new_loan_fees: DynArray[Fee, MAX_FEES] = self._get_loan_fees(offer.offer, borrower_broker_upfront_fee_amount, borrower_broker_settlement_fee_bps, borrower_broker)
-    total_upfront_fees: uint256 = 0
-    for fee: Fee in new_loan_fees:
-        total_upfront_fees += fee.upfront_amount
+    principal_delta: int256 = convert(offer.offer.principal, int256) - convert(loan.amount, int256)
 
-    self.loans[loan.id] = empty(bytes32)
+    new_loan_fees: DynArray[Fee, MAX_FEES] = []
+    total_upfront_fees: uint256 = 0
+    new_loan_fees, total_upfront_fees = self._get_loan_fees(offer.offer, self._get_protocol_fees(), borrower_broker_upfront_fee_amount, borrower_broker_settlement_fee_bps, borrower_broker)
 
     borrower_delta: int256 = principal_delta - convert(total_upfront_fees + interest + borrower_broker_fee_amount, int256) + convert(offer.offer.broker_upfront_fee_amount, int256)
     current_lender_delta: uint256 = loan.amount + interest - settlement_fees_total + borrower_broker_fee_amount
@@ -646,46 +678,28 @@ def replace_loan(
     if borrower_delta < 0:
         self._receive_funds(loan.borrower, convert(-1 * borrower_delta, uint256))
 
+    payouts: DynArray[WalletAmount, MAX_TRANSFERS] = []
     if loan.lender != offer.offer.lender:
         self._receive_funds(offer.offer.lender, new_lender_delta_abs)
-        self._send_funds(loan.lender, current_lender_delta)
+        payouts.append(WalletAmount(wallet=loan.lender, amount=current_lender_delta))
     elif current_lender_delta > new_lender_delta_abs:
-        self._send_funds(loan.lender, current_lender_delta - new_lender_delta_abs)
+        payouts.append(WalletAmount(wallet=loan.lender, amount=current_lender_delta - new_lender_delta_abs))
     elif current_lender_delta < new_lender_delta_abs:
         self._receive_funds(loan.lender, new_lender_delta_abs - current_lender_delta)
 
     if borrower_delta > 0:
-        self._send_funds(loan.borrower, convert(borrower_delta, uint256))
-
-    for fee: FeeAmount in settlement_fees:
-        self._send_funds(fee.wallet, fee.amount)
+        payouts.append(WalletAmount(wallet=loan.borrower, amount=convert(borrower_delta, uint256)))
 
-    for fee: Fee in new_loan_fees:
-        if fee.type != FeeType.ORIGINATION_FEE and fee.upfront_amount > 0:
-            self._send_funds(fee.wallet, fee.upfront_amount)
+    self._send_netted_funds(self._add_fee_payouts(payouts, settlement_fees, new_loan_fees))
 
-    offer_id: bytes32 = self._compute_signed_offer_id(offer)
-    new_loan: Loan = Loan(
-        id=empty(bytes32),
-        offer_id=offer_id,
-        offer_tracing_id=offer.offer.tracing_id,
-        amount=offer.offer.principal,
-        interest=offer.offer.interest,
-        payment_token=offer.offer.payment_token,
-        maturity=block.timestamp + offer.offer.duration,
-        start_time=block.timestamp,
-        borrower=loan.borrower,
-        lender=offer.offer.lender,
-        collateral_contract=collection_status.contract,
-        collateral_token_id=loan.collateral_token_id,
-        fees=new_loan_fees,
-        pro_rata=offer.offer.pro_rata,
-        delegate=loan.delegate
+    new_loan: Loan = self._store_new_loan(
+        offer,
+        new_loan_fees,
+        loan.borrower,
+        loan.collateral_contract,
+        loan.collateral_token_id,
+        loan.delegate
     )
-    new_loan.id = self._compute_loan_id(new_loan)
-
-    assert self.loans[new_loan.id] == empty(bytes32), "loan already exists"
-    self.loans[new_loan.id] = self._loan_state_hash(new_loan)
 
     log LoanReplaced(
         new_loan.id,
@@ -704,8 +718,8 @@ def replace_loan(
         loan.amount,
         interest,
         settlement_fees,
-        offer_id,
-        offer.offer.tracing_id
+        new_loan.offer_id,
+        new_loan.offer_tracing_id
     )
 
     return new_loan.id
@@ -722,37 +736,22 @@ def replace_loan_lender(loan: Loan, offer: SignedOffer, collateral_proof: DynArr
     @return The ID of the new loan.
     """
 
-    assert self._is_loan_valid(loan), "invalid loan"
+    self._validate_ongoing_loan(loan)
     assert self._check_user(loan.lender), "not lender"
-    assert block.timestamp <= loan.maturity, "loan defaulted"
 
-    assert self._is_offer_signed_by_lender(offer, offer.offer.lender), "offer not signed by lender"
-    assert offer.offer.expiration > block.timestamp, "offer expired"
-    assert offer.offer.payment_token == payment_token, "invalid payment token"
-    assert offer.offer.origination_fee_amount <= offer.offer.principal, "origination fee gt principal"
     assert block.timestamp + offer.offer.duration >= loan.maturity, "maturity before loan maturity"
 
-    collection_status: CollectionStatus = staticcall p2p_control.get_collection_status(offer.offer.collection_key_hash)
-    self._validate_token_ids(offer.offer, loan.collateral_token_id, collection_status, collateral_proof)
-    assert collection_status.contract == loan.collateral_contract, "collateral contract mismatch"
-
-    self._check_and_update_offer_state(offer)
-    self._reduce_offer_count(loan.offer_tracing_id)
-
-    principal_delta: int256 = convert(offer.offer.principal, int256) - convert(loan.amount, int256)
-    interest: uint256 = self._compute_settlement_interest(loan)
-
-    settlement_fees_total: uint256 = 0
+    interest: uint256 = 0
     settlement_fees: DynArray[FeeAmount, MAX_FEES] = []
+    settlement_fees_total: uint256 = 0
     borrower_broker_fee_amount: uint256 = 0
-    settlement_fees, settlement_fees_total, borrower_broker_fee_amount = self._get_settlement_fees(loan, interest)
+    interest, settlement_fees, settlement_fees_total, borrower_broker_fee_amount = self._close_replaced_loan(loan, offer, collateral_proof)
 
-    new_loan_fees: DynArray[Fee, MAX_FEES] = self._get_loan_fees(offer.offer, 0, 0, empty(address))
-    total_upfront_fees: uint256 = 0
-    for fee: Fee in new_loan_fees:
-        total_upfront_fees += fee.upfront_amount
+    principal_delta: int256 = convert(offer.offer.principal, int256) - convert(loan.amount, int256)
 
-    self.loans[loan.id] = empty(bytes32)
+    new_loan_fees: DynArray[Fee, MAX_FEES] = []
+    total_upfront_fees: uint256 = 0
+    new_loan_fees, total_upfront_fees = self._get_loan_fees(offer.offer, self._get_protocol_fees(), 0, 0, empty(address))
 
     max_interest_delta: uint256 = self._compute_max_interest_delta(loan, offer.offer, interest, borrower_broker_fee_amount)
     borrower_compensation: uint256 = convert(max(convert(max_interest_delta, int256), convert(interest + borrower_broker_fee_amount, int256) - principal_delta), uint256)
@@ -763,11 +762,11 @@ def replace_loan_lender(loan: Loan, offer: SignedOffer, collateral_proof: DynArr
 
     assert borrower_delta >= 0, "borrower delta < 0"
 
+    payouts: DynArray[WalletAmount, MAX_TRANSFERS] = []
     if loan.lender != offer.offer.lender:
         assert current_lender_delta >= 0, "lender delta < 0"
         self._receive_funds(offer.offer.lender, new_lender_delta_abs)
-        if current_lender_delta > 0:
-            self._send_funds(loan.lender, convert(current_lender_delta, uint256))
+        payouts.append(WalletAmount(wallet=loan.lender, amount=convert(current_lender_delta, uint256)))
     else:
         lender_delta: int256 = current_lender_delta - convert(new_lender_delta_abs, int256)
 
@@ -778,37 +777,18 @@ def replace_loan_lender(loan: Loan, offer: SignedOffer, collateral_proof: DynArr
             self._receive_funds(loan.lender, convert(-1 * lender_delta, uint256))
 
     if borrower_delta > 0:
-        self._send_funds(loan.borrower, convert(borrower_delta, uint256))
+        payouts.append(WalletAmount(wallet=loan.borrower, amount=convert(borrower_delta, uint256)))
 
-    for fee: FeeAmount in settlement_fees:
-        self._send_funds(fee.wallet, fee.amount)
-
-    for fee: Fee in new_loan_fees:
-        if fee.type != FeeType.ORIGINATION_FEE and fee.upfront_amount > 0:
-            self._send_funds(fee.wallet, fee.upfront_amount)
+    self._send_netted_funds(self._add_fee_payouts(payouts, settlement_fees, new_loan_fees))
 
-    offer_id: bytes32 = self._compute_signed_offer_id(offer)
-    new_loan: Loan = Loan(
-        id=empty(bytes32),
-        offer_id=offer_id,
-        offer_tracing_id=offer.offer.tracing_id,
-        amount=offer.offer.principal,
-        interest=offer.offer.interest,
-        payment_token=offer.offer.payment_token,
-        maturity=block.timestamp + offer.offer.duration,
-        start_time=block.timestamp,
-        borrower=loan.borrower,
-        lender=offer.offer.lender,
-        collateral_contract=collection_status.contract,
-        collateral_token_id=loan.collateral_token_id,
-        fees=new_loan_fees,
-        pro_rata=offer.offer.pro_rata,
-        delegate=loan.delegate
+    new_loan: Loan = self._store_new_loan(
+        offer,
+        new_loan_fees,
+        loan.borrower,
+        loan.collateral_contract,
+        loan.collateral_token_id,
+        loan.delegate
     )
-    new_loan.id = self._compute_loan_id(new_loan)
-
-    assert self.loans[new_loan.id] == empty(bytes32), "loan already exists"
-    self.loans[new_loan.id] = self._loan_state_hash(new_loan)
 
     log LoanReplacedByLender(
         new_loan.id,
@@ -828,8 +808,8 @@ def replace_loan_lender(loan: Loan, offer: SignedOffer, collateral_proof: DynArr
         interest,
         settlement_fees,
         borrower_compensation,
-        offer_id,
-        offer.offer.tracing_id
+        new_loan.offer_id,
+        new_loan.offer_tracing_id
     )
 
     return new_loan.id
@@ -853,6 +833,22 @@ def revoke_offer(offer: SignedOffer):
     self._revoke_offer(offer_id, offer)
 
 
+@external
+def increment_lender_nonce(lender: address):
+
+    """
+    @notice Revoke all the offers of a lender at once, by incrementing its lender nonce.
+    @dev Offers are only valid while their nonce matches the lender nonce.
+    @param lender The lender whose offers are to be revoked.
+    """
+
+    assert self._check_user(lender), "not lender"
+
+    nonce: uint256 = self.lender_nonces[lender] + 1
+    self.lender_nonces[lender] = nonce
+    log LenderNonceIncremented(lender, nonce)
+
+
 @external
 def claim_pending_transfers():
     assert self.pending_transfers[msg.sender] > 0, "no pending transfers"
@@ -884,6 +880,174 @@ def onERC721Received(_operator: address, _from: address, _tokenId: uint256, _dat
 
 # Internal functions
 
+@internal
+def _create_loan(
+    request: CreateLoanRequest,
+    borrower: address,
+    collection_status: CollectionStatus,
+    protocol_fees: ProtocolFees
+) -> bytes32:
+    self._validate_offer(request.offer, request.collateral_token_id, collection_status, request.collateral_proof)
+
+    fees: DynArray[Fee, MAX_FEES] = []
+    total_upfront_fees: uint256 = 0
+    fees, total_upfront_fees = self._get_loan_fees(
+        request.offer.offer,
+        protocol_fees,
+        request.borrower_broker_upfront_fee_amount,
+        request.borrower_broker_settlement_fee_bps,
+        request.borrower_broker
+    )
+
+    self._check_and_update_offer_state(request.offer)
+    loan: Loan = self._store_new_loan(
+        request.offer,
+        fees,
+        borrower,
+        collection_status.contract,
+        request.collateral_token_id,
+        request.delegate
+    )
+
+    self._store_collateral(loan.borrower, loan.collateral_contract, loan.collateral_token_id)
+    self._transfer_funds(loan.lender, loan.borrower, loan.amount - total_upfront_fees + request.offer.offer.broker_upfront_fee_amount)
+
+    for fee: Fee in fees:
+        if fee.type != FeeType.ORIGINATION_FEE and fee.upfront_amount > 0:
+            self._transfer_funds(loan.lender, fee.wallet, fee.upfront_amount)
+
+    if request.delegate != empty(address):
+        self._set_delegation(request.delegate, loan.collateral_contract, loan.collateral_token_id, True)
+
+    log LoanCreated(
+        loan.id,
+        loan.amount,
+        loan.interest,
+        loan.payment_token,
+        loan.maturity,
+        loan.start_time,
+        loan.borrower,
+        loan.lender,
+        loan.collateral_contract,
+        loan.collateral_token_id,
+        loan.fees,
+        loan.pro_rata,
+        loan.offer_id,
+        loan.offer_tracing_id,
+        loan.delegate
+    )
+    return loan.id
+
+
+@internal
+def _settle_loan(loan: Loan) -> (uint256, uint256, uint256, DynArray[FeeAmount, MAX_FEES]):
+    self._validate_ongoing_loan(loan)
+    assert self._check_user(loan.borrower), "not borrower"
+
+    interest: uint256 = self._compute_settlement_interest(loan)
+    settlement_fees_total: uint256 = 0
+    settlement_fees: DynArray[FeeAmount, MAX_FEES] = []
+    borrower_broker_fee_amount: uint256 = 0
+    settlement_fees, settlement_fees_total, borrower_broker_fee_amount = self._get_settlement_fees(loan, interest)
+
+    self.loans[loan.id] = empty(bytes32)
+    self._reduce_offer_count(loan.offer_tracing_id)
+
+    return (
+        loan.amount + interest + borrower_broker_fee_amount,
+        loan.amount + interest - settlement_fees_total + borrower_broker_fee_amount,
+        interest,
+        settlement_fees
+    )
+
+
+@internal
+def _release_collateral(loan: Loan, interest: uint256, settlement_fees: DynArray[FeeAmount, MAX_FEES]):
+    self._transfer_collateral(loan.borrower, loan.collateral_contract, loan.collateral_token_id)
+
+    if loan.delegate != empty(address):
+        self._set_delegation(loan.delegate, loan.collateral_contract, loan.collateral_token_id, False)
+
+    log LoanPaid(
+        loan.id,
+        loan.borrower,
+        loan.lender,
+        loan.payment_token,
+        loan.amount,
+        interest,
+        settlement_fees
+    )
+
+
+@internal
+def _close_replaced_loan(
+    loan: Loan,
+    offer: SignedOffer,
+    collateral_proof: DynArray[bytes32, PROOF_MAX_SIZE]
+) -> (uint256, DynArray[FeeAmount, MAX_FEES], uint256, uint256):
+    collection_status: CollectionStatus = staticcall p2p_control.get_collection_status(offer.offer.collection_key_hash)
+    self._validate_offer(offer, loan.collateral_token_id, collection_status, collateral_proof)
+    assert collection_status.contract == loan.collateral_contract, "collateral contract mismatch"
+
+    self._check_and_update_offer_state(offer)
+    self._reduce_offer_count(loan.offer_tracing_id)
+    self.loans[loan.id] = empty(bytes32)
+
+    interest: uint256 = self._compute_settlement_interest(loan)
+    settlement_fees: DynArray[FeeAmount, MAX_FEES] = []
+    settlement_fees_total: uint256 = 0
+    borrower_broker_fee_amount: uint256 = 0
+    settlement_fees, settlement_fees_total, borrower_broker_fee_amount = self._get_settlement_fees(loan, interest)
+    return (interest, settlement_fees, settlement_fees_total, borrower_broker_fee_amount)
+
+
+@internal
+def _validate_offer(
+    offer: SignedOffer,
+    collateral_token_id: uint256,
+    collection_status: CollectionStatus,
+    collateral_proof: DynArray[bytes32, PROOF_MAX_SIZE]
+):
+    assert self._is_offer_signed_by_lender(offer, offer.offer.lender), "offer not signed by lender"
+    assert offer.offer.expiration > block.timestamp, "offer expired"
+    assert offer.offer.payment_token == payment_token, "invalid payment token"
+    assert offer.offer.origination_fee_amount <= offer.offer.principal, "origination fee gt principal"
+    self._validate_token_ids(offer.offer, collateral_token_id, collection_status, collateral_proof)
+
+
+@internal
+def _store_new_loan(
+    offer: SignedOffer,
+    fees: DynArray[Fee, MAX_FEES],
+    borrower: address,
+    collateral_contract: address,
+    collateral_token_id: uint256,
+    delegate: address
+) -> Loan:
+    loan: Loan = Loan(
+        id=empty(bytes32),
+        offer_id=self._compute_signed_offer_id(offer),
+        offer_tracing_id=offer.offer.tracing_id,
+        amount=offer.offer.principal,
+        interest=offer.offer.interest,
+        payment_token=offer.offer.payment_token,
+        maturity=block.timestamp + offer.offer.duration,
+        start_time=block.timestamp,
+        borrower=borrower,
+        lender=offer.offer.lender,
+        collateral_contract=collateral_contract,
+        collateral_token_id=collateral_token_id,
+        fees=fees,
+        pro_rata=offer.offer.pro_rata,
+        delegate=delegate
+    )
+    loan.id = self._compute_loan_id(loan)
+
+    assert self.loans[loan.id] == empty(bytes32), "loan already exists"
+    self.loans[loan.id] = self._loan_state_hash(loan)
+    return loan
+
+
 @pure
 @internal
 def _compute_loan_id(loan: Loan) -> bytes32:
@@ -907,7 +1071,7 @@ def _compute_signed_offer_id(offer: SignedOffer) -> bytes32:
 @internal
 def _check_and_update_offer_state(offer: SignedOffer):
     offer_id: bytes32 = self._compute_signed_offer_id(offer)
-    assert not self.revoked_offers[offer_id], "offer revoked"
+    assert not self.revoked_offers[offer_id] and offer.offer.nonce == self.lender_nonces[offer.offer.lender], "offer revoked"
 
     count: uint256 = self.offer_count[offer.offer.tracing_id]
     assert count < offer.offer.size, "offer fully utilized"
@@ -936,8 +1100,14 @@ def _reduce_offer_count(tracing_id: bytes32):
 
 @view
 @internal
-def _is_loan_valid(loan: Loan) -> bool:
-    return self.loans[loan.id] == self._loan_state_hash(loan)
+def _validate_loan(loan: Loan):
+    assert self.loans[loan.id] == self._loan_state_hash(loan), "invalid loan"
+
+@view
+@internal
+def _validate_ongoing_loan(loan: Loan):
+    self._validate_loan(loan)
+    assert block.timestamp <= loan.maturity, "loan defaulted"
 
 @pure
 @internal
@@ -963,24 +1133,37 @@ def _is_offer_signed_by_lender(signed_offer: SignedOffer, lender: address) -> bo
     ) == lender
 
 
+@view
 @internal
-def _get_loan_fees(offer: Offer, borrower_broker_upfront_fee_amount: uint256, borrower_broker_settlement_fee_bps: uint256, borrower_broker: address) -> DynArray[Fee, MAX_FEES]:
+def _get_protocol_fees() -> ProtocolFees:
+    return ProtocolFees(
+        upfront_fee=self.protocol_upfront_fee,
+        settlement_fee=self.protocol_settlement_fee,
+        wallet=self.protocol_wallet
+    )
+
+
+@internal
+def _get_loan_fees(
+    offer: Offer,
+    protocol_fees: ProtocolFees,
+    borrower_broker_upfront_fee_amount: uint256,
+    borrower_broker_settlement_fee_bps: uint256,
+    borrower_broker: address
+) -> (DynArray[Fee, MAX_FEES], uint256):
     fees: DynArray[Fee, MAX_FEES] = []
-    if offer.origination_fee_amount > 0:
-        assert offer.origination_fee_amount <= offer.principal, "origination fee gt principal"
-    if offer.broker_settlement_fee_bps > 0 or offer.broker_upfront_fee_amount > 0:
-        assert offer.broker_address != empty(address), "broker fee without address"
-    if borrower_broker_upfront_fee_amount > 0 or borrower_broker_settlement_fee_bps > 0:
-        assert borrower_broker != empty(address), "broker fee without address"
+    lender_broker_ok: bool = offer.broker_settlement_fee_bps == 0 and offer.broker_upfront_fee_amount == 0 or offer.broker_address != empty(address)
+    borrower_broker_ok: bool = borrower_broker_upfront_fee_amount == 0 and borrower_broker_settlement_fee_bps == 0 or borrower_broker != empty(address)
+    assert lender_broker_ok and borrower_broker_ok, "broker fee without address"
     assert offer.broker_settlement_fee_bps <= max_lender_broker_settlement_fee, "lender broker fee exceeds max"
     assert borrower_broker_settlement_fee_bps <= max_borrower_broker_settlement_fee, "borrower broker fee exceeds max"
-    assert self.protocol_settlement_fee + offer.broker_settlement_fee_bps <= BPS, "settlement fees gt principal"
+    assert protocol_fees.settlement_fee + offer.broker_settlement_fee_bps <= BPS, "settlement fees gt principal"
 
     fees.append(Fee(
         type=FeeType.PROTOCOL_FEE,
-        upfront_amount=self.protocol_upfront_fee * offer.principal // BPS,
-        interest_bps=self.protocol_settlement_fee,
-        wallet=self.protocol_wallet
+        upfront_amount=protocol_fees.upfront_fee * offer.principal // BPS,
+        interest_bps=protocol_fees.settlement_fee,
+        wallet=protocol_fees.wallet
     ))
     fees.append(Fee(
         type=FeeType.ORIGINATION_FEE,
@@ -1000,7 +1183,10 @@ def _get_loan_fees(offer: Offer, borrower_broker_upfront_fee_amount: uint256, bo
         interest_bps=borrower_broker_settlement_fee_bps,
         wallet=borrower_broker
     ))
-    return fees
+    total_upfront_fees: uint256 = 0
+    for fee: Fee in fees:
+        total_upfront_fees += fee.upfront_amount
+    return fees, total_upfront_fees
 
 @internal
 def _get_settlement_fees(loan: Loan, settlement_interest: uint256) -> (DynArray[FeeAmount, MAX_FEES], uint256, uint256):
@@ -1074,19 +1260,21 @@ def _store_erc721(_wallet: address, _collateralAddress: address, _tokenId: uint2
 
 @internal
 def _transfer_punk(_wallet: address, _collateralAddress: address, _tokenId: uint256):
-    assert self._punk_owner(_collateralAddress, _tokenId) == self, "collateral not owned by vault"
     extcall CryptoPunksMarket(_collateralAddress).transferPunk(_wallet, _tokenId)
 
 
 @internal
 def _transfer_erc721(_wallet: address, _collateralAddress: address, _tokenId: uint256):
-    assert self._erc721_owner(_collateralAddress, _tokenId) == self, "collateral not owned by vault"
     extcall IERC721(_collateralAddress).safeTransferFrom(self, _wallet, _tokenId, b"")
 
 
 @internal
 def _transfer_collateral(wallet: address, collateral_contract: address, token_id: uint256):
-    if self._is_punk(collateral_contract):
+    is_punk: bool = self._is_punk(collateral_contract)
+    owner: address = self._punk_owner(collateral_contract, token_id) if is_punk else self._erc721_owner(collateral_contract, token_id)
+    assert owner == self, "collateral not owned by vault"
+
+    if is_punk:
         self._transfer_punk(wallet, collateral_contract, token_id)
     else:
         self._transfer_erc721(wallet, collateral_contract, token_id)
@@ -1109,9 +1297,49 @@ def _send_funds(_to: address, _amount: uint256):
         self.pending_transfers[_to] += _amount
 
 
+@internal
+def _add_fee_payouts(
+    payouts: DynArray[WalletAmount, MAX_TRANSFERS],
+    settlement_fees: DynArray[FeeAmount, MAX_FEES],
+    upfront_fees: DynArray[Fee, MAX_FEES]
+) -> DynArray[WalletAmount, MAX_TRANSFERS]:
+    result: DynArray[WalletAmount, MAX_TRANSFERS] = payouts
+    for fee: FeeAmount in settlement_fees:
+        result.append(WalletAmount(wallet=fee.wallet, amount=fee.amount))
+    for fee: Fee in upfront_fees:
+        if fee.type != FeeType.ORIGINATION_FEE:
+            result.append(WalletAmount(wallet=fee.wallet, amount=fee.upfront_amount))
+    return result
+
+
+@pure
+@internal
+def _net_amounts(amounts: DynArray[WalletAmount, MAX_TRANSFERS]) -> DynArray[WalletAmount, MAX_TRANSFERS]:
+    netted: DynArray[WalletAmount, MAX_TRANSFERS] = []
+    for amount: WalletAmount in amounts:
+        if amount.amount == 0:
+            continue
+        found: bool = False
+        for i: uint256 in range(len(netted), bound=MAX_TRANSFERS):
+            if netted[i].wallet == amount.wallet:
+                netted[i].amount += amount.amount
+                found = True
+                break
+        if not found:
+            netted.append(amount)
+    return netted
+
+
+@internal
+def _send_netted_funds(payouts: DynArray[WalletAmount, MAX_TRANSFERS]):
+    netted_payouts: DynArray[WalletAmount, MAX_TRANSFERS] = self._net_amounts(payouts)
+    for payout: WalletAmount in netted_payouts:
+        self._send_funds(payout.wallet, payout.amount)
+
+
 @internal
 def _receive_funds(_from: address, _amount: uint256):
-    assert extcall IERC20(payment_token).transferFrom(_from, self, _amount), "transferFrom failed"
+    self._transfer_funds(_from, self, _amount)
 
 
 @internal
@@ -1160,14 +1388,13 @@ def _store_collateral(wallet: address, collateral_contract: address, token_id: u
     assert wallet != empty(address), "addr is the zero addr"
     assert collateral_contract != empty(address), "collat addr is the zero addr"
 
-    if self._is_punk(collateral_contract):
-        assert self._punk_owner(collateral_contract, token_id) == wallet, "collateral not owned by wallet"
-        assert self._is_punk_approved_for_vault(wallet, collateral_contract, token_id), "transfer is not approved"
-        self._store_punk(wallet, collateral_contract, token_id)
+    is_punk: bool = self._is_punk(collateral_contract)
+    assert (self._punk_owner(collateral_contract, token_id) if is_punk else self._erc721_owner(collateral_contract, token_id)) == wallet, "collateral not owned by wallet"
+    assert self._is_punk_approved_for_vault(wallet, collateral_contract, token_id) if is_punk else self._is_erc721_approved_for_vault(wallet, collateral_contract, token_id), "transfer is not approved"
 
+    if is_punk:
+        self._store_punk(wallet, collateral_contract, token_id)
     else:
-        assert self._erc721_owner(collateral_contract, token_id) == wallet, "collateral not owned by wallet"
-        assert self._is_erc721_approved_for_vault(wallet, collateral_contract, token_id), "transfer is not approved"
         self._store_erc721(wallet, collateral_contract, token_id)
 
 
@@ -1191,5 +1418,10 @@ def _validate_token_ids(
     else:
         _hash: bytes32 = keccak256(abi_encode(collection_status.contract, offer.trait_hash, collateral_token_id))
         for p: bytes32 in collateral_proof:
-            _hash = keccak256(abi_encode(convert(keccak256(_hash), uint256) ^ convert(keccak256(p), uint256)))
+            if collection_status.trait_root_version != TRAIT_ROOT_VERSION_SORTED_PAIR:
+                _hash = keccak256(abi_encode(convert(keccak256(_hash), uint256) ^ convert(keccak256(p), uint256)))
+            elif convert(_hash, uint256) < convert(p, uint256):
+                _hash = keccak256(abi_encode(_hash, p))
+            else:
+                _hash = keccak256(abi_encode(p, _hash))
         assert collection_status.trait_root == _hash, "proof invalid"
@@ -0,0 +1,284 @@
+# @version 0.4.1
+
+"""
+@title PackedLoanProxy
+@author [Zharta](https://zharta.io/)
+@notice Entry points for P2PLendingNfts that take loans in a compact encoding instead of the ABI-encoded Loan struct.
+@dev The proxy must be authorized in P2PLendingNfts, which then identifies the caller by tx.origin, so the entry points
+    can only be called directly by an EOA. The packed loan is decoded into the same Loan struct, so the loan commitment
+    stored in P2PLendingNfts is unchanged.
+    The packed layout (big endian) is:
+    | offset | size | field                                                       |
+    |--------|------|-------------------------------------------------------------|
+    | 0      | 32   | id                                                          |
+    | 32     | 32   | offer_id                                                    |
+    | 64     | 32   | offer_tracing_id                                            |
+    | 96     | 16   | amount                                                      |
+    | 112    | 16   | interest                                                    |
+    | 128    | 8    | maturity                                                    |
+    | 136    | 8    | start_time                                                  |
+    | 144    | 20   | borrower                                                    |
+    | 164    | 20   | lender                                                      |
+    | 184    | 20   | collateral_contract                                         |
+    | 204    | 32   | collateral_token_id                                         |
+    | 236    | 1    | flags: bit 0 pro_rata, bit 1 delegate, bits 4-7 fee mask    |
+    | 237    | 20   | delegate, only if the delegate flag is set                  |
+    | ...    | 38   | for each fee in the mask: upfront (16), bps (2), wallet (20) |
+    The payment token is not encoded, as it is always the P2PLendingNfts payment token. Loans always have one fee of
+    each type, ordered by type; fees with no amounts and no wallet are left out of the mask.
+"""
+
+
+interface P2PLendingNfts:
+    def settle_loan(loan: Loan): nonpayable
+    def claim_defaulted_loan_collateral(loan: Loan): nonpayable
+    def replace_loan(
+        loan: Loan,
+        offer: SignedOffer,
+        collateral_proof: DynArray[bytes32, PROOF_MAX_SIZE],
+        borrower_broker_upfront_fee_amount: uint256,
+        borrower_broker_settlement_fee_bps: uint256,
+        borrower_broker: address
+    ) -> bytes32: nonpayable
+    def replace_loan_lender(loan: Loan, offer: SignedOffer, collateral_proof: DynArray[bytes32, PROOF_MAX_SIZE]) -> bytes32: nonpayable
+    def payment_token() -> address: view
+
+
+# Structs
+
+PROOF_MAX_SIZE: constant(uint256) = 32
+MAX_FEES: constant(uint256) = 4
+PACKED_LOAN_HEADER_SIZE: constant(uint256) = 237
+PACKED_FEE_SIZE: constant(uint256) = 38
+PACKED_LOAN_MAX_SIZE: constant(uint256) = PACKED_LOAN_HEADER_SIZE + 20 + MAX_FEES * PACKED_FEE_SIZE
+
+FLAG_PRO_RATA: constant(uint256) = 1
+FLAG_DELEGATE: constant(uint256) = 2
+FEE_MASK_SHIFT: constant(uint256) = 4
+
+flag FeeType:
+    PROTOCOL_FEE
+    ORIGINATION_FEE
+    LENDER_BROKER_FEE
+    BORROWER_BROKER_FEE
+
+flag OfferType:
+    TOKEN
+    COLLECTION
+    TRAIT
+
+struct Fee:
+    type: FeeType
+    upfront_amount: uint256
+    interest_bps: uint256
+    wallet: address
+
+struct Offer:
+    principal: uint256
+    interest: uint256
+    payment_token: address
+    duration: uint256
+    origination_fee_amount: uint256
+    broker_upfront_fee_amount: uint256
+    broker_settlement_fee_bps: uint256
+    broker_address: address
+    offer_type: OfferType
+    token_id: uint256
+    token_range_min: uint256
+    token_range_max: uint256
+    collection_key_hash: bytes32
+    trait_hash: bytes32
+    expiration: uint256
+    lender: address
+    pro_rata: bool
+    size: uint256
+    tracing_id: bytes32
+    nonce: uint256
+
+struct Signature:
+    v: uint256
+    r: uint256
+    s: uint256
+
+struct SignedOffer:
+    offer: Offer
+    signature: Signature
+
+struct Loan:
+    id: bytes32
+    offer_id: bytes32
+    offer_tracing_id: bytes32
+    amount: uint256  # principal - origination_fee_amount
+    interest: uint256
+    payment_token: address
+    maturity: uint256
+    start_time: uint256
+    borrower: address
+    lender: address
+    collateral_contract: address
+    collateral_token_id: uint256
+    fees: DynArray[Fee, MAX_FEES]
+    pro_rata: bool
+    delegate: address
+
+
+p2p_lending_nfts: public(immutable(address))
+payment_token: public(immutable(address))
+
+
+@deploy
+def __init__(_p2p_lending_nfts: address):
+    p2p_lending_nfts = _p2p_lending_nfts
+    payment_token = staticcall P2PLendingNfts(_p2p_lending_nfts).payment_token()
+
+
+@external
+def settle_loan(packed_loan: Bytes[PACKED_LOAN_MAX_SIZE]):
+
+    """
+    @notice Settle a loan, see P2PLendingNfts.settle_loan.
+    @param packed_loan The packed loan to be settled.
+    """
+
+    assert msg.sender == tx.origin, "not EOA"
+    extcall P2PLendingNfts(p2p_lending_nfts).settle_loan(self._unpack_loan(packed_loan))
+
+
+@external
+def claim_defaulted_loan_collateral(packed_loan: Bytes[PACKED_LOAN_MAX_SIZE]):
+
+    """
+    @notice Claim defaulted loan collateral, see P2PLendingNfts.claim_defaulted_loan_collateral.
+    @param packed_loan The packed loan whose collateral is to be claimed.
+    """
+
+    assert msg.sender == tx.origin, "not EOA"
+    extcall P2PLendingNfts(p2p_lending_nfts).claim_defaulted_loan_collateral(self._unpack_loan(packed_loan))
+
+
+@external
+def replace_loan(
+    packed_loan: Bytes[PACKED_LOAN_MAX_SIZE],
+    offer: SignedOffer,
+    collateral_proof: DynArray[bytes32, PROOF_MAX_SIZE],
+    borrower_broker_upfront_fee_amount: uint256,
+    borrower_broker_settlement_fee_bps: uint256,
+    borrower_broker: address
+) -> bytes32:
+
+    """
+    @notice Replace an existing loan by accepting a new offer, see P2PLendingNfts.replace_loan.
+    @param packed_loan The packed loan to be replaced.
+    @param offer The new signed offer.
+    @param collateral_proof The proof of the collateral token id, for trait offers.
+    @param borrower_broker_upfront_fee_amount The upfront fee amount for the borrower broker.
+    @param borrower_broker_settlement_fee_bps The settlement fee basis points relative to the interest for the borrower broker.
+    @param borrower_broker The address of the borrower broker, if any.
+    @return The ID of the new loan.
+    """
+
+    assert msg.sender == tx.origin, "not EOA"
+    return extcall P2PLendingNfts(p2p_lending_nfts).replace_loan(
+        self._unpack_loan(packed_loan),
+        offer,
+        collateral_proof,
+        borrower_broker_upfront_fee_amount,
+        borrower_broker_settlement_fee_bps,
+        borrower_broker
+    )
+
+
+@external
+def replace_loan_lender(
+    packed_loan: Bytes[PACKED_LOAN_MAX_SIZE],
+    offer: SignedOffer,
+    collateral_proof: DynArray[bytes32, PROOF_MAX_SIZE]
+) -> bytes32:
+
+    """
+    @notice Replace a loan by the lender, see P2PLendingNfts.replace_loan_lender.
+    @param packed_loan The packed loan to be replaced.
+    @param offer The new signed offer.
+    @param collateral_proof The proof of the collateral token id, for trait offers.
+    @return The ID of the new loan.
+    """
+
+    assert msg.sender == tx.origin, "not EOA"
+    return extcall P2PLendingNfts(p2p_lending_nfts).replace_loan_lender(
+        self._unpack_loan(packed_loan),
+        offer,
+        collateral_proof
+    )
+
+
+@view
+@external
+def unpack_loan(packed_loan: Bytes[PACKED_LOAN_MAX_SIZE]) -> Loan:
+
+    """
+    @notice Decode a packed loan.
+    @param packed_loan The packed loan.
+    @return The decoded loan.
+    """
+
+    return self._unpack_loan(packed_loan)
+
+
+@view
+@internal
+def _unpack_loan(packed_loan: Bytes[PACKED_LOAN_MAX_SIZE]) -> Loan:
+    assert len(packed_loan) >= PACKED_LOAN_HEADER_SIZE, "invalid packed loan"
+    flags: uint256 = convert(slice(packed_loan, PACKED_LOAN_HEADER_SIZE - 1, 1), uint256)
+    fee_mask: uint256 = flags >> FEE_MASK_SHIFT
+
+    packed_size: uint256 = PACKED_LOAN_HEADER_SIZE
+    if flags & FLAG_DELEGATE != 0:
+        packed_size += 20
+    for i: uint256 in range(MAX_FEES):
+        if fee_mask & (1 << i) != 0:
+            packed_size += PACKED_FEE_SIZE
+    assert len(packed_loan) == packed_size, "invalid packed loan"
+
+    offset: uint256 = PACKED_LOAN_HEADER_SIZE
+    delegate: address = empty(address)
+    if flags & FLAG_DELEGATE != 0:
+        delegate = self._read_address(packed_loan, offset)
+        offset += 20
+
+    fees: DynArray[Fee, MAX_FEES] = []
+    for i: uint256 in range(MAX_FEES):
+        fee_type: FeeType = convert(1 << i, FeeType)
+        if fee_mask & (1 << i) == 0:
+            fees.append(Fee(type=fee_type, upfront_amount=0, interest_bps=0, wallet=empty(address)))
+        else:
+            fees.append(Fee(
+                type=fee_type,
+                upfront_amount=convert(slice(packed_loan, offset, 16), uint256),
+                interest_bps=convert(slice(packed_loan, offset + 16, 2), uint256),
+                wallet=self._read_address(packed_loan, offset + 18)
+            ))
+            offset += PACKED_FEE_SIZE
+
+    return Loan(
+        id=extract32(packed_loan, 0),
+        offer_id=extract32(packed_loan, 32),
+        offer_tracing_id=extract32(packed_loan, 64),
+        amount=convert(slice(packed_loan, 96, 16), uint256),
+        interest=convert(slice(packed_loan, 112, 16), uint256),
+        payment_token=payment_token,
+        maturity=convert(slice(packed_loan, 128, 8), uint256),
+        start_time=convert(slice(packed_loan, 136, 8), uint256),
+        borrower=self._read_address(packed_loan, 144),
+        lender=self._read_address(packed_loan, 164),
+        collateral_contract=self._read_address(packed_loan, 184),
+        collateral_token_id=extract32(packed_loan, 204, output_type=uint256),
+        fees=fees,
+        pro_rata=flags & FLAG_PRO_RATA != 0,
+        delegate=delegate
+    )
+
+
+@pure
+@internal
+def _read_address(data: Bytes[PACKED_LOAN_MAX_SIZE], offset: uint256) -> address:
+    return convert(convert(slice(data, offset, 20), bytes20), address)
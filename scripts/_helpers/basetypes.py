@@ -5,8 +5,10 @@ import json
 from collections.abc import Callable
 from dataclasses import dataclass, field
 from enum import Enum
+from threading import Lock
 from typing import Any
 
+from ape.api import ReceiptAPI, TransactionAPI
 from ape.contracts.base import ContractContainer, ContractInstance
 from ape_accounts.accounts import KeyfileAccount
 from rich import print as rprint
@@ -30,6 +32,8 @@ class DeploymentContext:
     config: dict[str, Any] = field(default_factory=dict)
     gas_func: Callable | None = None
     dryrun: bool = False
+    _next_nonce: int = field(default=0, init=False, repr=False)
+    _nonce_lock: Lock = field(default_factory=Lock, init=False, repr=False)
 
     def __getitem__(self, key):
         if key in self.contracts:
@@ -48,6 +52,22 @@ class DeploymentContext:
     def gas_options(self):
         return self.gas_func(self) if self.gas_func is not None else {}
 
+    def allocate_nonces(self, count: int = 1) -> int:
+        # first of count consecutive owner nonces, so that transactions sent concurrently never share a nonce. The
+        # owner nonce doesn't count pending transactions, so the nonces already allocated are tracked here
+        with self._nonce_lock:
+            nonce = max(self._next_nonce, self.owner.nonce)
+            self._next_nonce = nonce + count
+            return nonce
+
+    def release_nonces(self, start: int, end: int) -> bool:
+        # returns the unused nonces in [start, end), if none was allocated after them
+        with self._nonce_lock:
+            if self._next_nonce != end:
+                return False
+            self._next_nonce = start
+            return True
+
 
 @dataclass
 class ContractConfig:
@@ -85,6 +105,11 @@ class ContractConfig:
     def address(self):
         return self.contract.address if self.contract else None
 
+    def task_target(self) -> str:
+        # identifies the contract in run_by_contract, by address as contracts can be configured under several keys. Not
+        # deployed contracts, only in dry runs, are identified by their key
+        return self.address() or self.key
+
     def container_name(self):
         return self.container.contract_type.name if self.container else None
 
@@ -98,6 +123,13 @@ class ContractConfig:
         self.contract = self.container.at(address)
 
     def deploy(self, context: DeploymentContext):
+        txn = self.deploy_transaction(context)
+        if txn is not None:
+            self.deployed(context, context.owner.call(txn))
+        self.after_deploy(context)
+
+    def deploy_transaction(self, context: DeploymentContext) -> TransactionAPI | None:
+        # the deployment transaction, not signed nor sent, or None in dry runs
         if self.contract is not None:
             rprint(
                 f"[dark_orange bold]WARNING[/]: Deployment will override contract [blue bold]{self.key}[/] at {self.contract}"
@@ -111,12 +143,21 @@ class ContractConfig:
             f"Deploying [blue]{self.key}[/blue] <- {self.container_name()}.deploy({', '.join(str(a) for a in print_args)}, {kwargs_str})"  # noqa: E501
         )
 
-        if not context.dryrun:
-            deploy_args = self.container.constructor.encode_input(*self.deployment_args_values(context))
-            rprint(f"Deployment args for [blue]{self.key}[/]: [bright_black]{deploy_args.hex()}[/]")
+        if context.dryrun:
+            return None
+        deploy_args = self.container.constructor.encode_input(*self.deployment_args_values(context))
+        rprint(f"Deployment args for [blue]{self.key}[/]: [bright_black]{deploy_args.hex()}[/]")
+        return self.container.constructor.serialize_transaction(*self.deployment_args_values(context), **kwargs)
 
-            self.contract = self.container.deploy(*self.deployment_args_values(context), **kwargs)
-            self.abi_key = abi_key(self.contract.contract_type.dict()["abi"])
+    def deployed(self, context: DeploymentContext, receipt: ReceiptAPI):
+        if receipt.failed:
+            raise Exception(f"Deployment of contract {self} failed in transaction {receipt.txn_hash}")  # noqa: TRY002
+        self.contract = self.container.at(receipt.contract_address)
+        self.abi_key = abi_key(self.contract.contract_type.dict()["abi"])
+
+    def after_deploy(self, context: DeploymentContext):
+        # runs once the contracts deployed along with this one are deployed, also in dry runs
+        pass
 
 
 @dataclass
@@ -124,7 +165,7 @@ class MinimalProxy(ContractConfig):
     impl: str = ""
     factory_func: str = "create_proxy"
 
-    def deploy(self, context: DeploymentContext):
+    def deploy_transaction(self, context: DeploymentContext) -> TransactionAPI | None:
         if self.contract is not None:
             rprint(
                 f"[dark_orange bold]WARNING[/dark_orange bold]: Deployment will override contract [blue bold]{self.key}[/blue bold] at {self.contract}"  # noqa: E501
@@ -139,7 +180,12 @@ class MinimalProxy(ContractConfig):
             f"Deploying Proxy [blue]{self.key}[/blue] <- {self.impl}.{self.factory_func}({', '.join(str(a) for a in print_args)}, {kwargs_str})"  # noqa: E501
         )
 
-        if not context.dryrun:
-            tx = impl_contract.invoke_transaction(self.factory_func, *self.deployment_args_values(context), **kwargs)
-            self.contract = self.container.at(tx.return_value)
-            self.abi_key = abi_key(self.contract.contract_type.dict()["abi"])
+        if context.dryrun:
+            return None
+        return getattr(impl_contract, self.factory_func).as_transaction(*self.deployment_args_values(context), **kwargs)
+
+    def deployed(self, context: DeploymentContext, receipt: ReceiptAPI):
+        if receipt.failed:
+            raise Exception(f"Deployment of contract {self} failed in transaction {receipt.txn_hash}")  # noqa: TRY002
+        self.contract = self.container.at(receipt.return_value)
+        self.abi_key = abi_key(self.contract.contract_type.dict()["abi"])
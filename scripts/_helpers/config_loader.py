@@ -0,0 +1,85 @@
+import json
+from collections.abc import Iterable
+from functools import cache
+from pathlib import Path
+from tempfile import TemporaryFile
+from typing import Any
+
+from .basetypes import Environment, abi_key
+
+
+class ConfigLoader:
+    """
+    Reads the config files of an environment and chain and the abi files they refer to, parsing and hashing each file
+    once. Parsed configs and abis are shared between callers, which must copy them before making changes.
+    """
+
+    def __init__(self, env: Environment, chain: str):
+        self.env = env
+        self.chain = chain
+        self.config_dir = Path.cwd() / "configs" / env.name / chain
+        self._configs: dict[str, Any] = {}
+        self._abis: dict[str, list] = {}
+        self._abi_keys: dict[str, str] = {}
+
+    def load(self, name: str) -> Any:
+        if name not in self._configs:
+            with (self.config_dir / name).open(encoding="utf8") as f:
+                self._configs[name] = json.load(f)
+        return self._configs[name]
+
+    def store(self, name: str, config: Any):
+        with open(self.config_dir / name, "w") as f:
+            f.write(json.dumps(config, indent=4, sort_keys=True))
+        self._configs[name] = config
+
+    def store_entries(self, name: str, entries: Iterable[tuple[str, Any]]):
+        # writes the same file as store, but the entries are spooled to a temporary file as they arrive and copied in key
+        # order, so that only the keys are kept in memory
+        offsets = {}
+        with TemporaryFile() as spool:
+            for key, value in entries:
+                data = json.dumps(value, indent=4, sort_keys=True).replace("\n", "\n    ").encode()
+                offsets[key] = (spool.tell(), len(data))
+                spool.write(data)
+
+            with open(self.config_dir / name, "wb") as f:
+                f.write(b"{")
+                for i, key in enumerate(sorted(offsets)):
+                    start, length = offsets[key]
+                    spool.seek(start)
+                    f.write(b"," if i else b"")
+                    f.write(f"\n    {json.dumps(key)}: ".encode())
+                    f.write(spool.read(length))
+                f.write(b"\n}" if offsets else b"}")
+        self._configs.pop(name, None)
+
+    def abi(self, filename: str) -> list:
+        if filename not in self._abis:
+            with open(filename, "r") as f:
+                self._abis[filename] = json.load(f)
+        return self._abis[filename]
+
+    def abi_key(self, filename: str) -> str:
+        if filename not in self._abi_keys:
+            self._abi_keys[filename] = abi_key(self.abi(filename))
+        return self._abi_keys[filename]
+
+    def contract_abi(self, contract_type: Any) -> list:
+        # the abi of a compiled contract type, memoized by contract name alongside the abi files, as several contracts
+        # are usually deployed from the same type
+        key = f"contract:{contract_type.name}"
+        if key not in self._abis:
+            self._abis[key] = contract_type.dict()["abi"]
+        return self._abis[key]
+
+    def contract_abi_key(self, contract_type: Any) -> str:
+        key = f"contract:{contract_type.name}"
+        if key not in self._abi_keys:
+            self._abi_keys[key] = abi_key(self.contract_abi(contract_type))
+        return self._abi_keys[key]
+
+
+@cache
+def config_loader(env: Environment, chain: str) -> ConfigLoader:
+    return ConfigLoader(env, chain)
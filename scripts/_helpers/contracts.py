@@ -1,6 +1,7 @@
 import json
 from dataclasses import dataclass
 from hashlib import sha3_256
+from typing import Any
 
 from ape import project
 from ape.contracts.base import ContractContainer
@@ -10,10 +11,13 @@ from rich import print
 from rich.markup import escape
 
 from .basetypes import ContractConfig, DeploymentContext, abi_key
-from .transactions import check_owner, execute, execute_read
+from .trait_tree import TRAIT_ROOT_VERSION_XOR_MERGE
+from .transactions import check_owner, execute, execute_batched, execute_reads
 
 ZERO_ADDRESS = "0x" + "00" * 20
 ZERO_BYTES32 = "0x" + "00" * 32
+# P2PLendingControl.CHANGE_BATCH, max items per change_collections_* call
+CHANGE_BATCH = 128
 
 
 def calculate_abi_key(filename: str) -> str:
@@ -80,45 +84,58 @@ class P2PLendingControl(ContractConfig):
 
     @check_owner
     def set_trait_roots(self, context: DeploymentContext):
-        trait_roots = context[self.trait_roots_key]
+        trait_roots = {collection: self.get_trait_root(value) for collection, value in context[self.trait_roots_key].items()}
+        statuses = {} if context.dryrun else self.read_collection_statuses(context, list(trait_roots))
         roots_to_update = [
-            (self.get_collection_hash(collection), "0x" + root)
-            for collection, root in trait_roots.items()
-            if context.dryrun or self.root_needs_update(context, collection, root)
+            (self.get_collection_hash(collection), "0x" + root, version)
+            for collection, (root, version) in trait_roots.items()
+            if context.dryrun or self.root_needs_update(collection, root, version, statuses[collection])
         ]
         if roots_to_update:
-            execute(context, self.key, "change_collections_trait_roots", roots_to_update)
+            execute_batched(context, self.key, "change_collections_trait_roots", roots_to_update, batch_size=CHANGE_BATCH)
         else:
             print(f"Contract [blue]{escape(self.key)}[/] change_collections_trait_roots with no roots, skipping update")
 
         contracts_to_update = [
             (self.get_collection_hash(collection), contract)
-            for collection, root in trait_roots.items()
+            for collection, (root, _) in trait_roots.items()
             for contract in [context[collection].address() if "0x" + root != ZERO_BYTES32 else ZERO_ADDRESS]
-            if context.dryrun or self.contract_needs_update(context, collection, contract)
+            if context.dryrun or self.contract_needs_update(collection, contract, statuses[collection].contract)
         ]
         if contracts_to_update:
-            execute(context, self.key, "change_collections_contracts", contracts_to_update)
+            execute_batched(context, self.key, "change_collections_contracts", contracts_to_update, batch_size=CHANGE_BATCH)
         else:
             print(f"Contract [blue]{escape(self.key)}[/] change_collections_contracts with no contracts, skipping update")
 
-    def root_needs_update(self, context: DeploymentContext, collection: str, root: str) -> bool:
-        collection_hash = self.get_collection_hash(collection)
-        current_root = execute_read(context, self.key, "trait_roots", collection_hash)
-        # print(f"Current root for {collection} is {current_root.hex()}, new is {root}")
-        if current_root.hex() == "0x" + root:
+    def read_collection_statuses(self, context: DeploymentContext, collections: list[str]) -> dict[str, Any]:
+        # contract, trait root and version of each collection, read with one get_collection_statuses call per CHANGE_BATCH
+        # collections
+        collection_hashes = [self.get_collection_hash(collection) for collection in collections]
+        batches = [(collection_hashes[start : start + CHANGE_BATCH],) for start in range(0, len(collections), CHANGE_BATCH)]
+        statuses = [
+            status for batch in execute_reads(context, self.key, "get_collection_statuses", batches) for status in batch
+        ]
+        return dict(zip(collections, statuses))
+
+    def root_needs_update(self, collection: str, root: str, version: int, status: Any) -> bool:
+        if HexBytes(status.trait_root) == HexBytes(root) and status.trait_root_version == version:
             print(f"Contract [blue]{escape(self.key)}[/] trait root for {collection} is already {root}, skipping update")
             return False
         return True
 
-    def contract_needs_update(self, context: DeploymentContext, collection: str, contract: str) -> bool:
-        collection_hash = self.get_collection_hash(collection)
-        current_contract = execute_read(context, self.key, "contracts", collection_hash)
+    def contract_needs_update(self, collection: str, contract: str, current_contract: str) -> bool:
         if current_contract == contract:
             print(f"Contract [blue]{escape(self.key)}[/] contract for {collection} is already {contract}, skipping update")
             return False
         return True
 
+    @staticmethod
+    def get_trait_root(value: str | dict) -> tuple[str, int]:
+        # plain roots in the configs are built with the xor merge, see P2PLendingControl.TRAIT_ROOT_VERSION_XOR_MERGE
+        if isinstance(value, dict):
+            return value["root"], value["version"]
+        return value, TRAIT_ROOT_VERSION_XOR_MERGE
+
     @staticmethod
     def get_collection_hash(collection: str) -> str:
         return "0x" + sha3_256(collection.encode()).hexdigest()
@@ -264,8 +281,73 @@ class ArcadeProxy(ContractConfig):
         self.arcade_repayment_contract_key = arcade_repayment_contract_key
         self.arcade_loan_core_contract_key = arcade_loan_core_contract_key
 
-    def deploy(self, context: DeploymentContext):
-        super().deploy(context)
+    def after_deploy(self, context: DeploymentContext):
+        execute(
+            context,
+            self.p2p_contract_key,
+            "set_proxy_authorization",
+            self.contract.address if not context.dryrun else ZERO_ADDRESS,
+            True,  # noqa: FBT003
+        )
+
+
+@dataclass
+class PackedLoanProxy(ContractConfig):
+    def __init__(
+        self,
+        *,
+        key: str,
+        p2p_contract_key: str,
+        address: str | None = None,
+        abi_key: str | None = None,
+    ):
+        super().__init__(
+            key,
+            None,
+            project.PackedLoanProxy,
+            token=False,
+            abi_key=abi_key,
+            deployment_deps={p2p_contract_key},
+            deployment_args=[p2p_contract_key],
+        )
+        if address:
+            self.load_contract(address)
+        self.p2p_contract_key = p2p_contract_key
+
+    def after_deploy(self, context: DeploymentContext):
+        execute(
+            context,
+            self.p2p_contract_key,
+            "set_proxy_authorization",
+            self.contract.address if not context.dryrun else ZERO_ADDRESS,
+            True,  # noqa: FBT003
+        )
+
+
+@dataclass
+class P2PLendingBatch(ContractConfig):
+    def __init__(
+        self,
+        *,
+        key: str,
+        p2p_contract_key: str,
+        address: str | None = None,
+        abi_key: str | None = None,
+    ):
+        super().__init__(
+            key,
+            None,
+            project.P2PLendingBatch,
+            token=False,
+            abi_key=abi_key,
+            deployment_deps={p2p_contract_key},
+            deployment_args=[p2p_contract_key],
+        )
+        if address:
+            self.load_contract(address)
+        self.p2p_contract_key = p2p_contract_key
+
+    def after_deploy(self, context: DeploymentContext):
         execute(
             context,
             self.p2p_contract_key,
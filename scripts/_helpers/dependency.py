@@ -10,6 +10,7 @@ class DependencyManager:
         self.changed = changed
         self._build_dependencies()
         self._build_deployment_order()
+        self._build_deployment_levels()
         self._build_deployment_set()
 
     def _build_dependencies(self):
@@ -19,6 +20,9 @@ class DependencyManager:
         config_dependencies_set2 = {
             (c.key, v) for c in internal_contracts for k, v in c.config_dependencies(self.context).items()
         }
+        missing = sorted((c, dep) for dep, c in dep_dependencies_set if dep not in self.context)
+        if missing:
+            raise ValueError(f"Unknown deployment dependencies (contract, dependency): {missing}")
         self.deployment_dependencies = groupby_first(dep_dependencies_set, set(self.context.keys()))
         self.config_dependencies = groupby_first(config_dependencies_set1 | config_dependencies_set2, set(self.context.keys()))
 
@@ -49,6 +53,9 @@ class DependencyManager:
         internal_deployable_sorted = list(sorted_dependencies)
         self.deployment_order = internal_deployable_sorted
 
+    def _build_deployment_levels(self):
+        self.deployment_levels = dependency_levels(self.deployment_dependencies)
+
     def build_transaction_set(self) -> set[Callable]:
         tx_set = {tx for k, txs in self.transaction_set.items() for tx in txs}
         # workaround to deal with partial functions
@@ -58,17 +65,30 @@ class DependencyManager:
     def build_contract_deploy_set(self) -> list[ContractConfig]:
         return [self.context.contracts[k] for k in self.deployment_order if k in self.deployment_set]
 
+    def build_contract_deploy_levels(self) -> list[list[ContractConfig]]:
+        # contracts in the same level don't depend on each other, so they can be deployed concurrently
+        levels = [
+            [self.context.contracts[k] for k in sorted(level) if k in self.deployment_set] for level in self.deployment_levels
+        ]
+        return [level for level in levels if level]
+
 
 def topological_sort(dependencies: dict[str, set[str]]) -> list[str]:
+    # dependencies maps each node to the nodes depending on it, which are sorted after it
     nodes = set(dependencies.keys()) | {w for v in dependencies.values() for w in v}
     vis = dict.fromkeys(nodes, False)
+    visiting = set()
     stack = []
 
     def _dfs(n: str):
         vis[n] = True
-        for d in dependencies[n]:
+        visiting.add(n)
+        for d in dependencies.get(n, set()):
+            if d in visiting:
+                raise ValueError(f"Dependency cycle through {n} and {d}")
             if not vis[d]:
                 _dfs(d)
+        visiting.discard(n)
         stack.append(n)
 
     for d in vis:
@@ -77,6 +97,20 @@ def topological_sort(dependencies: dict[str, set[str]]) -> list[str]:
     return stack[::-1]
 
 
+def dependency_levels(dependencies: dict[str, set[str]]) -> list[set[str]]:
+    # nodes grouped by the length of the longest dependency path leading to them
+    nodes = set(dependencies.keys()) | {w for v in dependencies.values() for w in v}
+    level = dict.fromkeys(nodes, 0)
+    for n in topological_sort(dependencies):
+        for d in dependencies.get(n, set()):
+            level[d] = max(level[d], level[n] + 1)
+
+    levels = [set() for _ in range(max(level.values(), default=-1) + 1)]
+    for n, i in level.items():
+        levels[i].add(n)
+    return levels
+
+
 def groupby_first(tuples: set[tuple], extended_keys: set[str] | None = None) -> dict[str, set[str]]:
     res = defaultdict(set)
     for k in extended_keys or set():
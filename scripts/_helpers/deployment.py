@@ -1,9 +1,9 @@
-import json
 import logging
 import os
 import warnings
+from copy import deepcopy
 from enum import Enum
-from pathlib import Path
+from functools import partial
 from typing import Any
 
 from ape import accounts
@@ -14,7 +14,9 @@ from .basetypes import (
     DeploymentContext,
     Environment,
 )
+from .config_loader import config_loader
 from .dependency import DependencyManager
+from .transactions import run_by_contract, send_transactions, task_contract
 
 ENV = Environment[os.environ.get("ENV", "local")]
 
@@ -29,9 +31,7 @@ class Context(Enum):
 
 
 def load_contracts(env: Environment, chain: str) -> list[ContractConfig]:
-    config_file = Path.cwd() / "configs" / env.name / chain / "p2p.json"
-    with config_file.open(encoding="utf8") as f:
-        config = json.load(f)
+    config = config_loader(env, chain).load("p2p.json")
 
     return [
         contracts_module.__dict__[c["contract"]](
@@ -43,9 +43,8 @@ def load_contracts(env: Environment, chain: str) -> list[ContractConfig]:
 
 
 def store_contracts(env: Environment, chain: str, contracts: list[ContractConfig]):
-    config_file = Path.cwd() / "configs" / env.name / chain / "p2p.json"
-    with config_file.open(encoding="utf8") as f:
-        config = json.load(f)
+    loader = config_loader(env, chain)
+    config = deepcopy(loader.load("p2p.json"))
 
     contracts_dict = {c.key: c for c in contracts}
     for scope in ["common", "p2p", "proxies"]:
@@ -64,14 +63,11 @@ def store_contracts(env: Environment, chain: str, contracts: list[ContractConfig
                     addresses[prop_key[:-4]] = contracts_dict[prop_val].address()
             c["properties_addresses"] = addresses
 
-    with open(config_file, "w") as f:
-        f.write(json.dumps(config, indent=4, sort_keys=True))
+    loader.store("p2p.json", config)
 
 
 def load_nft_contracts(env: Environment, chain: str) -> list[ContractConfig]:
-    config_file = Path.cwd() / "configs" / env.name / chain / "collections.json"
-    with config_file.open(encoding="utf8") as f:
-        config = json.load(f)
+    config = config_loader(env, chain).load("collections.json")
 
     return [
         contracts_module.__dict__[c.get("contract_def", "ERC721")](
@@ -84,9 +80,7 @@ def load_nft_contracts(env: Environment, chain: str) -> list[ContractConfig]:
 
 
 def load_tokens(env: Environment, chain: str) -> list[ContractConfig]:
-    config_file = Path.cwd() / "configs" / env.name / chain / "tokens.json"
-    with config_file.open(encoding="utf8") as f:
-        config = json.load(f)
+    config = config_loader(env, chain).load("tokens.json")
 
     return [
         contracts_module.__dict__[c.get("contract_def", "ERC20External")](
@@ -97,18 +91,14 @@ def load_tokens(env: Environment, chain: str) -> list[ContractConfig]:
 
 
 def load_configs(env: Environment, chain: str) -> dict:
-    config_file = Path.cwd() / "configs" / env.name / chain / "p2p.json"
-    with config_file.open(encoding="utf8") as f:
-        config = json.load(f)
+    config = config_loader(env, chain).load("p2p.json")
 
     _configs = config.get("configs", {})
     return {f"configs.{k}": v for k, v in _configs.items()}
 
 
 def load_tracking(env: Environment, chain: str) -> dict:
-    config_file = Path.cwd() / "configs" / env.name / chain / "tracking.json"
-    with config_file.open(encoding="utf8") as f:
-        config = json.load(f)
+    config = config_loader(env, chain).load("tracking.json")
 
     return dict(config.items())
 
@@ -151,22 +141,34 @@ class DeploymentManager:
     def _save_state(self):
         store_contracts(self.env, self.chain, list(self.context.contracts.values()))
 
+    def _deploy_level(self, contracts: list[ContractConfig]):
+        # the contracts in a level are independent, so their deployments are sent together, see send_transactions
+        txns = [contract.deploy_transaction(self.context) for contract in contracts]
+        if not self.context.dryrun:
+            receipts = send_transactions(self.context, txns)
+            if len(receipts) < len(contracts):
+                raise Exception(f"Deployment of contracts {contracts[len(receipts) :]} not sent")  # noqa: TRY002
+            for contract, receipt in zip(contracts, receipts):
+                contract.deployed(self.context, receipt)
+
+        # follow up transactions of different contracts are independent, including the ones sent to the same contract, e.g.
+        # each proxy authorizing itself in P2PLendingNfts, so they are grouped by the deployed contract
+        run_by_contract([(contract.task_target(), partial(contract.after_deploy, self.context)) for contract in contracts])
+
     def deploy(self, changes: set[str], *, dryrun=False, save_state=True):
         self.owner.set_autosign(True) if self.env != Environment.local else None
         self.context.dryrun = dryrun
         dependency_manager = DependencyManager(self.context, changes)
-        contracts_to_deploy = dependency_manager.build_contract_deploy_set()
+        deploy_levels = dependency_manager.build_contract_deploy_levels()
         dependencies_tx = dependency_manager.build_transaction_set()
 
-        for contract in contracts_to_deploy:
-            if contract.deployable(self.context):
-                contract.deploy(self.context)
+        for level in deploy_levels:
+            self._deploy_level([contract for contract in level if contract.deployable(self.context)])
 
         if save_state and not dryrun:
             self._save_state()
 
-        for dependency_tx in dependencies_tx:
-            dependency_tx(self.context)
+        run_by_contract([(task_contract(tx), partial(tx, self.context)) for tx in dependencies_tx])
 
         if save_state and not dryrun:
             self._save_state()
@@ -0,0 +1,199 @@
+import json
+import os
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from decimal import Decimal
+from queue import Queue
+from threading import Event
+from typing import NamedTuple
+
+import boto3
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.config import Config
+
+SCAN_SEGMENTS = int(os.environ.get("SCAN_SEGMENTS", "8"))
+BATCH_GET_SIZE = 100
+BATCH_GET_MAX_ATTEMPTS = 8
+SERIALIZER = TypeSerializer()
+
+
+def dynamodb_client(max_connections: int = 10):
+    # the low level client is thread safe, unlike the resource tables. DYNAMODB_ENDPOINT allows using a local dynamodb
+    return boto3.client(
+        "dynamodb",
+        endpoint_url=os.environ.get("DYNAMODB_ENDPOINT"),
+        config=Config(retries={"mode": "adaptive", "max_attempts": 10}, max_pool_connections=max_connections),
+    )
+
+
+class IntDeserializer(TypeDeserializer):
+    # numbers are deserialized straight to int, so that items don't need a second pass to convert them from Decimal
+    def _deserialize_n(self, value):  # noqa: PLR6301
+        return int(Decimal(value))
+
+
+DESERIALIZER = IntDeserializer()
+
+
+def deserialize_item(item: dict) -> dict:
+    return {k: DESERIALIZER.deserialize(v) for k, v in item.items()}
+
+
+def scan_filter(filters: dict) -> dict:
+    if not filters:
+        return {}
+    return {
+        "FilterExpression": " AND ".join(f"#f{i} = :f{i}" for i in range(len(filters))),
+        "ExpressionAttributeNames": {f"#f{i}": k for i, k in enumerate(filters)},
+        "ExpressionAttributeValues": {f":f{i}": SERIALIZER.serialize(v) for i, v in enumerate(filters.values())},
+    }
+
+
+def scan_items(client, table: str, filters: dict | None = None, segments: int = SCAN_SEGMENTS) -> Iterator[dict]:
+    # the table segments are scanned in parallel and the items are yielded as their pages arrive, only the items
+    # matching all the filters (attribute equality) are returned by dynamodb
+    pages: Queue = Queue(maxsize=2 * segments)
+    stopped = Event()
+
+    def scan_segment(segment: int):
+        try:
+            paginator = client.get_paginator("scan")
+            for page in paginator.paginate(TableName=table, Segment=segment, TotalSegments=segments, **scan_filter(filters)):
+                if stopped.is_set():
+                    break
+                pages.put(page["Items"])
+        finally:
+            pages.put(None)
+
+    with ThreadPoolExecutor(max_workers=segments) as executor:
+        futures = [executor.submit(scan_segment, segment) for segment in range(segments)]
+        done = 0
+        try:
+            while done < segments:
+                items = pages.get()
+                if items is None:
+                    done += 1
+                    continue
+                for item in items:
+                    yield deserialize_item(item)
+        finally:
+            # unblock the segments still running if the consumer stops early
+            stopped.set()
+            while done < segments:
+                if pages.get() is None:
+                    done += 1
+        for future in futures:
+            future.result()
+
+
+class Update(NamedTuple):
+    description: str
+    table: str
+    key: dict
+    # attributes set to None are removed from the item
+    attributes: dict
+    # items keyed by a hash of their content, such as abis, only need to be written if missing
+    content_keyed: bool = False
+
+    def item_id(self) -> str:
+        return key_id(self.table, {k: SERIALIZER.serialize(v) for k, v in self.key.items()})
+
+    def item_attributes(self) -> dict:
+        return {k: v for k, v in self.attributes.items() if k not in self.key}
+
+
+def key_id(table: str, typed_key: dict) -> str:
+    return f"{table}:{json.dumps(typed_key, sort_keys=True)}"
+
+
+def read_items(client, updates: list[Update]) -> dict[str, dict]:
+    # current items, by item id, with only the attributes set by the updates
+    updates = list({update.item_id(): update for update in updates}.values())
+    items = {}
+    for i in range(0, len(updates), BATCH_GET_SIZE):
+        batch = updates[i : i + BATCH_GET_SIZE]
+        table_keys = {update.table: list(update.key) for update in batch}
+        table_attributes = {table: set(keys) for table, keys in table_keys.items()}
+        for update in batch:
+            if not update.content_keyed:
+                table_attributes[update.table].update(update.item_attributes())
+
+        request_items = {}
+        for table, attributes in table_attributes.items():
+            names = {f"#p{j}": attribute for j, attribute in enumerate(sorted(attributes))}
+            request_items[table] = {
+                "Keys": [
+                    {k: SERIALIZER.serialize(v) for k, v in update.key.items()} for update in batch if update.table == table
+                ],
+                "ProjectionExpression": ", ".join(names),
+                "ExpressionAttributeNames": names,
+            }
+
+        for attempt in range(BATCH_GET_MAX_ATTEMPTS):
+            response = client.batch_get_item(RequestItems=request_items)
+            for table, table_items in response["Responses"].items():
+                for item in table_items:
+                    items[key_id(table, {k: item[k] for k in table_keys[table]})] = item
+            request_items = response.get("UnprocessedKeys")
+            if not request_items:
+                break
+            time.sleep(min(0.05 * 2**attempt, 5))
+        else:
+            raise RuntimeError(f"unprocessed keys after {BATCH_GET_MAX_ATTEMPTS} attempts: {request_items}")
+
+    return items
+
+
+def changed_attributes(update: Update, item: dict | None) -> list[str]:
+    if item is None:
+        return list(update.item_attributes())
+    if update.content_keyed:
+        return []
+    return [
+        k for k, v in update.item_attributes().items() if (k in item if v is None else item.get(k) != SERIALIZER.serialize(v))
+    ]
+
+
+def update_item(client, update: Update):
+    attributes = update.item_attributes()
+    names = {f"#k{i}": k for i, k in enumerate(attributes)}
+    values = {f":v{i}": SERIALIZER.serialize(v) for i, v in enumerate(attributes.values()) if v is not None}
+    set_expression = ", ".join(f"#k{i}=:v{i}" for i in range(len(attributes)) if f":v{i}" in values)
+    remove_expression = ", ".join(f"#k{i}" for i in range(len(attributes)) if f":v{i}" not in values)
+    client.update_item(
+        TableName=update.table,
+        Key={k: SERIALIZER.serialize(v) for k, v in update.key.items()},
+        UpdateExpression=" ".join(
+            f"{action} {expression}"
+            for action, expression in [("SET", set_expression), ("REMOVE", remove_expression)]
+            if expression
+        ),
+        ExpressionAttributeNames=names,
+        **({"ExpressionAttributeValues": values} if values else {}),
+    )
+
+
+def run_updates(client, updates: list[Update], max_workers: int = 10):
+    # items are updated concurrently, the client retries throttled requests with backoff (adaptive retry mode)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(update_item, client, update): update for update in updates}
+        for future in as_completed(futures):
+            future.result()
+            print(f"updated {futures[future].description}")
+
+
+def publish(client, updates: list[Update], *, dry_run: bool, max_workers: int = 10) -> list[Update]:
+    # only the items whose attributes differ from the stored ones are written
+    items = read_items(client, updates)
+    changed = []
+    for update in updates:
+        attributes = changed_attributes(update, items.get(update.item_id()))
+        if attributes:
+            changed.append(update)
+            if dry_run:
+                print(f"would update {update.description}: {', '.join(attributes)}")
+    print(f"{len(changed)} of {len(updates)} items changed")
+    if not dry_run:
+        run_updates(client, changed, max_workers)
+    return changed
@@ -0,0 +1,397 @@
+import json
+import sqlite3
+from operator import itemgetter
+from pathlib import Path
+
+from eth_abi import decode, encode
+from eth_utils import keccak, to_checksum_address
+
+FEES = "(uint256,uint256,uint256,address)[]"
+FEE_AMOUNTS = "(uint256,uint256,address)[]"
+LOAN = f"(bytes32,bytes32,bytes32,uint256,uint256,address,uint256,uint256,address,address,address,uint256,{FEES},bool,address)"
+
+_REPLACED_HEAD = [
+    ("id", "bytes32"),
+    ("amount", "uint256"),
+    ("interest", "uint256"),
+    ("payment_token", "address"),
+    ("maturity", "uint256"),
+    ("start_time", "uint256"),
+    ("collateral_contract", "address"),
+    ("collateral_token_id", "uint256"),
+    ("borrower", "address"),
+    ("lender", "address"),
+    ("fees", FEES),
+    ("pro_rata", "bool"),
+    ("original_loan_id", "bytes32"),
+    ("paid_principal", "uint256"),
+    ("paid_interest", "uint256"),
+    ("paid_settlement_fees", FEE_AMOUNTS),
+]
+
+# P2PLendingNfts events changing the loans or the offers, none of them has indexed fields
+EVENTS = {
+    "LoanCreated": [
+        ("id", "bytes32"),
+        ("amount", "uint256"),
+        ("interest", "uint256"),
+        ("payment_token", "address"),
+        ("maturity", "uint256"),
+        ("start_time", "uint256"),
+        ("borrower", "address"),
+        ("lender", "address"),
+        ("collateral_contract", "address"),
+        ("collateral_token_id", "uint256"),
+        ("fees", FEES),
+        ("pro_rata", "bool"),
+        ("offer_id", "bytes32"),
+        ("offer_tracing_id", "bytes32"),
+        ("delegate", "address"),
+    ],
+    "LoanReplaced": [*_REPLACED_HEAD, ("offer_id", "bytes32"), ("offer_tracing_id", "bytes32")],
+    "LoanReplacedByLender": [
+        *_REPLACED_HEAD,
+        ("borrower_compensation", "uint256"),
+        ("offer_id", "bytes32"),
+        ("offer_tracing_id", "bytes32"),
+    ],
+    "LoanPaid": [
+        ("id", "bytes32"),
+        ("borrower", "address"),
+        ("lender", "address"),
+        ("payment_token", "address"),
+        ("paid_principal", "uint256"),
+        ("paid_interest", "uint256"),
+        ("paid_settlement_fees", FEE_AMOUNTS),
+    ],
+    "LoanCollateralClaimed": [
+        ("id", "bytes32"),
+        ("borrower", "address"),
+        ("lender", "address"),
+        ("collateral_contract", "address"),
+        ("collateral_token_id", "uint256"),
+    ],
+    "OfferRevoked": [
+        ("offer_id", "bytes32"),
+        ("lender", "address"),
+        ("collection_key_hash", "bytes32"),
+        ("offer_type", "uint256"),
+    ],
+    "LenderNonceIncremented": [
+        ("lender", "address"),
+        ("nonce", "uint256"),
+    ],
+}
+EVENT_TOPICS = {keccak(text=f"{name}({','.join(t for _, t in fields)})"): name for name, fields in EVENTS.items()}
+SETTLE_LOAN_SELECTOR = keccak(text=f"settle_loan({LOAN})")[:4]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    contract TEXT PRIMARY KEY,
+    block_number INTEGER NOT NULL,
+    block_hash BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blocks (
+    contract TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    hash BLOB NOT NULL,
+    PRIMARY KEY (contract, number)
+);
+CREATE TABLE IF NOT EXISTS loans (
+    contract TEXT NOT NULL,
+    id BLOB NOT NULL,
+    offer_id BLOB NOT NULL,
+    offer_tracing_id BLOB NOT NULL,
+    amount TEXT NOT NULL,
+    interest TEXT NOT NULL,
+    payment_token TEXT NOT NULL,
+    maturity INTEGER NOT NULL,
+    start_time INTEGER NOT NULL,
+    borrower TEXT NOT NULL,
+    lender TEXT NOT NULL,
+    collateral_contract TEXT NOT NULL,
+    collateral_token_id TEXT NOT NULL,
+    fees TEXT NOT NULL,
+    pro_rata INTEGER NOT NULL,
+    delegate TEXT,
+    loan_hash BLOB,
+    created_block INTEGER NOT NULL,
+    closed_block INTEGER,
+    closed_by TEXT
+);
+CREATE INDEX IF NOT EXISTS loans_id ON loans (contract, id);
+CREATE INDEX IF NOT EXISTS loans_borrower ON loans (contract, borrower) WHERE closed_block IS NULL;
+CREATE INDEX IF NOT EXISTS loans_lender ON loans (contract, lender) WHERE closed_block IS NULL;
+CREATE INDEX IF NOT EXISTS loans_closed_block ON loans (contract, closed_block);
+CREATE INDEX IF NOT EXISTS loans_created_block ON loans (contract, created_block);
+CREATE TABLE IF NOT EXISTS revoked_offers (
+    contract TEXT NOT NULL,
+    offer_id BLOB NOT NULL,
+    lender TEXT NOT NULL,
+    collection_key_hash BLOB NOT NULL,
+    offer_type INTEGER NOT NULL,
+    block_number INTEGER NOT NULL,
+    PRIMARY KEY (contract, offer_id)
+);
+CREATE INDEX IF NOT EXISTS revoked_offers_block ON revoked_offers (contract, block_number);
+CREATE TABLE IF NOT EXISTS lender_nonces (
+    contract TEXT NOT NULL,
+    lender TEXT NOT NULL,
+    nonce INTEGER NOT NULL,
+    block_number INTEGER NOT NULL,
+    PRIMARY KEY (contract, lender, nonce)
+);
+CREATE INDEX IF NOT EXISTS lender_nonces_block ON lender_nonces (contract, block_number);
+"""
+
+LOAN_COLUMNS = [
+    "id",
+    "offer_id",
+    "offer_tracing_id",
+    "amount",
+    "interest",
+    "payment_token",
+    "maturity",
+    "start_time",
+    "borrower",
+    "lender",
+    "collateral_contract",
+    "collateral_token_id",
+    "fees",
+    "pro_rata",
+    "delegate",
+]
+
+
+def decode_log(log: dict) -> tuple[str, dict] | None:
+    topics = log["topics"]
+    name = EVENT_TOPICS.get(bytes(topics[0])) if topics else None
+    if name is None:
+        return None
+    fields = EVENTS[name]
+    values = decode([t for _, t in fields], bytes(log["data"]))
+    return name, {k: to_checksum_address(v) if t == "address" else v for (k, t), v in zip(fields, values)}
+
+
+def loan_hash(loan: tuple) -> bytes:
+    # same as P2PLendingNfts.loans(loan.id), keccak256(abi_encode(loan))
+    return keccak(encode([LOAN], [loan]))
+
+
+def settle_loan_calldata(loan: tuple) -> bytes:
+    return SETTLE_LOAN_SELECTOR + encode([LOAN], [loan])
+
+
+class LoanIndex:
+    """
+    Loans of P2PLendingNfts contracts, rebuilt from their events and stored in a SQLite file, so that the loan structs
+    required by the contract calls are available locally. Events are read in block ranges of `batch_size` blocks, each
+    range stored in a single database transaction along with the checkpoint. The hashes of the last `reorg_depth`
+    indexed blocks are kept to detect reorgs, in which case the changes after the common ancestor are rolled back.
+    """
+
+    def __init__(self, path: str | Path, w3, *, batch_size: int = 2000, reorg_depth: int = 128):
+        self.w3 = w3
+        self.batch_size = batch_size
+        self.reorg_depth = reorg_depth
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def checkpoint(self, contract: str) -> tuple[int, bytes] | None:
+        return self.db.execute(
+            "SELECT block_number, block_hash FROM checkpoints WHERE contract = ?", (to_checksum_address(contract),)
+        ).fetchone()
+
+    def sync(self, contract: str, start_block: int = 0, to_block: int | None = None) -> int:
+        # indexes the contract events up to to_block (the latest block by default), returns the last indexed block
+        contract = to_checksum_address(contract)
+        checkpoint = self.checkpoint(contract)
+        from_block = start_block if checkpoint is None else self._rollback_reorg(contract, checkpoint, start_block) + 1
+        last_block = self.w3.eth.block_number if to_block is None else to_block
+
+        for batch_start in range(from_block, last_block + 1, self.batch_size):
+            batch_end = min(batch_start + self.batch_size - 1, last_block)
+            logs, end_hash = self._get_logs(contract, batch_start, batch_end)
+            with self.db:
+                for log in sorted(logs, key=itemgetter("blockNumber", "logIndex")):
+                    self._apply(contract, log)
+                    self._store_block(contract, log["blockNumber"], bytes(log["blockHash"]))
+                self._store_block(contract, batch_end, end_hash)
+                self.db.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?)", (contract, batch_end, end_hash))
+                self.db.execute(
+                    "DELETE FROM blocks WHERE contract = ? AND number < ?", (contract, batch_end - self.reorg_depth)
+                )
+
+        checkpoint = self.checkpoint(contract)
+        return checkpoint[0] if checkpoint else from_block - 1
+
+    def loan(self, contract: str, loan_id: bytes) -> tuple | None:
+        # the current loan struct, as expected by the contract
+        row = self.db.execute(
+            f"SELECT {', '.join(LOAN_COLUMNS)} FROM loans WHERE contract = ? AND id = ? AND closed_block IS NULL",
+            (to_checksum_address(contract), bytes(loan_id)),
+        ).fetchone()
+        return self._loan_struct(row) if row else None
+
+    def loans(self, contract: str, *, borrower: str | None = None, lender: str | None = None) -> list[tuple]:
+        # current loans, optionally of a borrower and/or lender
+        conditions = ["contract = ?", "closed_block IS NULL"]
+        params = [to_checksum_address(contract)]
+        if borrower:
+            conditions.append("borrower = ?")
+            params.append(to_checksum_address(borrower))
+        if lender:
+            conditions.append("lender = ?")
+            params.append(to_checksum_address(lender))
+        rows = self.db.execute(
+            f"SELECT {', '.join(LOAN_COLUMNS)} FROM loans WHERE {' AND '.join(conditions)}",
+            params,
+        )
+        return [self._loan_struct(row) for row in rows]
+
+    def loan_hashes(self, contract: str) -> dict[bytes, bytes | None]:
+        # hashes of the current loans by id, to be compared with P2PLendingNfts.loans
+        rows = self.db.execute(
+            "SELECT id, loan_hash FROM loans WHERE contract = ? AND closed_block IS NULL", (to_checksum_address(contract),)
+        )
+        return dict(rows)
+
+    def lender_nonce(self, contract: str, lender: str) -> int:
+        # same as P2PLendingNfts.lender_nonces(lender), each increment is kept so that it can be rolled back
+        row = self.db.execute(
+            "SELECT MAX(nonce) FROM lender_nonces WHERE contract = ? AND lender = ?",
+            (to_checksum_address(contract), to_checksum_address(lender)),
+        ).fetchone()
+        return row[0] or 0
+
+    def is_offer_revoked(self, contract: str, offer_id: bytes, *, lender: str | None = None, nonce: int | None = None) -> bool:
+        # offers are revoked by themselves or, if the lender and the offer nonce are given, by a change of the lender nonce
+        row = self.db.execute(
+            "SELECT 1 FROM revoked_offers WHERE contract = ? AND offer_id = ?",
+            (to_checksum_address(contract), bytes(offer_id)),
+        ).fetchone()
+        if row is not None:
+            return True
+        return lender is not None and nonce is not None and nonce != self.lender_nonce(contract, lender)
+
+    def _get_logs(self, contract: str, from_block: int, to_block: int) -> tuple[list, bytes]:
+        # the logs are only kept if the last block of the range didn't change while they were read, so that all of them
+        # belong to the chain ending in the block hash returned
+        while True:
+            end_hash = bytes(self.w3.eth.get_block(to_block)["hash"])
+            logs = self.w3.eth.get_logs(
+                {
+                    "address": contract,
+                    "fromBlock": from_block,
+                    "toBlock": to_block,
+                    "topics": [["0x" + topic.hex() for topic in EVENT_TOPICS]],
+                }
+            )
+            if bytes(self.w3.eth.get_block(to_block)["hash"]) == end_hash:
+                return logs, end_hash
+
+    def _rollback_reorg(self, contract: str, checkpoint: tuple[int, bytes], start_block: int) -> int:
+        # returns the last block still in the chain, rolling back the changes indexed after it
+        block_number, block_hash = checkpoint
+        if bytes(self.w3.eth.get_block(block_number)["hash"]) == block_hash:
+            return block_number
+
+        stored_blocks = self.db.execute(
+            "SELECT number, hash FROM blocks WHERE contract = ? AND number < ? ORDER BY number DESC", (contract, block_number)
+        )
+        ancestor = next(
+            (number for number, stored_hash in stored_blocks if bytes(self.w3.eth.get_block(number)["hash"]) == stored_hash),
+            start_block - 1,  # reorg deeper than the blocks kept, everything is indexed again
+        )
+        with self.db:
+            self.db.execute("DELETE FROM loans WHERE contract = ? AND created_block > ?", (contract, ancestor))
+            self.db.execute(
+                "UPDATE loans SET closed_block = NULL, closed_by = NULL WHERE contract = ? AND closed_block > ?",
+                (contract, ancestor),
+            )
+            self.db.execute("DELETE FROM revoked_offers WHERE contract = ? AND block_number > ?", (contract, ancestor))
+            self.db.execute("DELETE FROM lender_nonces WHERE contract = ? AND block_number > ?", (contract, ancestor))
+            self.db.execute("DELETE FROM blocks WHERE contract = ? AND number > ?", (contract, ancestor))
+            row = self.db.execute("SELECT hash FROM blocks WHERE contract = ? AND number = ?", (contract, ancestor)).fetchone()
+            if row:
+                self.db.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?)", (contract, ancestor, row[0]))
+            else:
+                self.db.execute("DELETE FROM checkpoints WHERE contract = ?", (contract,))
+        return ancestor
+
+    def _store_block(self, contract: str, number: int, block_hash: bytes):
+        self.db.execute("INSERT OR REPLACE INTO blocks VALUES (?, ?, ?)", (contract, number, block_hash))
+
+    def _apply(self, contract: str, log: dict):
+        decoded = decode_log(log)
+        if decoded is None:
+            return
+        name, event = decoded
+        block = log["blockNumber"]
+        match name:
+            case "LoanCreated":
+                self._insert_loan(contract, event, event["delegate"], block)
+            case "LoanReplaced" | "LoanReplacedByLender":
+                # the new loan keeps the delegate of the replaced one, which isn't part of the event
+                row = self.db.execute(
+                    "SELECT delegate FROM loans WHERE contract = ? AND id = ? AND closed_block IS NULL",
+                    (contract, event["original_loan_id"]),
+                ).fetchone()
+                self._close_loan(contract, event["original_loan_id"], name, block)
+                self._insert_loan(contract, event, row[0] if row else None, block)
+            case "LoanPaid" | "LoanCollateralClaimed":
+                self._close_loan(contract, event["id"], name, block)
+            case "OfferRevoked":
+                self.db.execute(
+                    "INSERT OR IGNORE INTO revoked_offers VALUES (?, ?, ?, ?, ?, ?)",
+                    (contract, event["offer_id"], event["lender"], event["collection_key_hash"], event["offer_type"], block),
+                )
+            case "LenderNonceIncremented":
+                self.db.execute(
+                    "INSERT OR IGNORE INTO lender_nonces VALUES (?, ?, ?, ?)",
+                    (contract, event["lender"], event["nonce"], block),
+                )
+
+    def _insert_loan(self, contract: str, event: dict, delegate: str | None, block: int):
+        loan = {k: event[k] for k in LOAN_COLUMNS if k != "delegate"} | {"delegate": delegate}
+        # the hash is unknown if the replaced loan was created before the indexing start block
+        _hash = loan_hash(tuple(loan.values())) if delegate is not None else None
+        row = loan | {
+            "amount": str(loan["amount"]),
+            "interest": str(loan["interest"]),
+            "collateral_token_id": str(loan["collateral_token_id"]),
+            "fees": json.dumps([[t, str(upfront), str(bps), wallet] for t, upfront, bps, wallet in loan["fees"]]),
+        }
+        self.db.execute(
+            f"INSERT INTO loans (contract, {', '.join(LOAN_COLUMNS)}, loan_hash, created_block) "
+            f"VALUES ({', '.join('?' * (len(LOAN_COLUMNS) + 3))})",
+            (contract, *row.values(), _hash, block),
+        )
+
+    def _close_loan(self, contract: str, loan_id: bytes, closed_by: str, block: int):
+        self.db.execute(
+            "UPDATE loans SET closed_block = ?, closed_by = ? WHERE contract = ? AND id = ? AND closed_block IS NULL",
+            (block, closed_by, contract, loan_id),
+        )
+
+    @staticmethod
+    def _loan_struct(row: tuple) -> tuple:
+        loan = dict(zip(LOAN_COLUMNS, row))
+        loan |= {
+            "amount": int(loan["amount"]),
+            "interest": int(loan["interest"]),
+            "collateral_token_id": int(loan["collateral_token_id"]),
+            "fees": [(t, int(upfront), int(bps), wallet) for t, upfront, bps, wallet in json.loads(loan["fees"])],
+            "pro_rata": bool(loan["pro_rata"]),
+        }
+        return tuple(loan.values())
@@ -0,0 +1,59 @@
+from collections import OrderedDict
+from pathlib import Path
+
+from .trait_tree import TraitTree
+
+
+class TraitProofServer:
+    """
+    Serves trait proofs from the tree files built by scripts/build_trait_roots.py, keeping the most recently used trees
+    mapped. Trees are found by collection key, from the <collection_key>.tree file names in `tree_dir`, as collections
+    sharing a contract have their own trait roots.
+    """
+
+    def __init__(self, tree_dir: str | Path, max_open_trees: int = 64):
+        self.tree_dir = Path(tree_dir)
+        self.max_open_trees = max_open_trees
+        self._paths: dict[str, Path] = {}
+        self._trees: OrderedDict[str, TraitTree] = OrderedDict()
+        self.refresh()
+
+    def refresh(self):
+        # rebuilt trees replace their files, so trees mapped before the refresh are closed to pick up the new ones
+        self.close()
+        self._paths = {path.stem: path for path in sorted(self.tree_dir.glob("*.tree"))}
+
+    def close(self):
+        while self._trees:
+            self._trees.popitem()[1].close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def collection_keys(self) -> list[str]:
+        return list(self._paths)
+
+    def tree(self, collection_key: str) -> TraitTree | None:
+        tree = self._trees.get(collection_key)
+        if tree is not None:
+            self._trees.move_to_end(collection_key)
+            return tree
+        if collection_key not in self._paths:
+            return None
+
+        tree = TraitTree.open(self._paths[collection_key])
+        self._trees[collection_key] = tree
+        if len(self._trees) > self.max_open_trees:
+            self._trees.popitem(last=False)[1].close()
+        return tree
+
+    def proof(self, collection_key: str, trait_hash: bytes, token_id: int) -> list[bytes] | None:
+        tree = self.tree(collection_key)
+        return tree.token_proof(trait_hash, token_id) if tree is not None else None
+
+    def root(self, collection_key: str) -> bytes | None:
+        tree = self.tree(collection_key)
+        return tree.root() if tree is not None else None
@@ -0,0 +1,447 @@
+"""
+Trait merkle trees, as verified by P2PLendingControl for trait offers.
+
+The leaves are keccak256(abi_encode(collection_contract, trait_hash, token_id)), deduplicated and sorted, and the tree is
+laid out as a heap: node 1 is the root, node i merges nodes 2i and 2i+1 and the n leaves are the nodes n to 2n - 1.
+Trees may have free leaf slots, left as zero hashes, which are used by incremental updates. No token leaf hashes to zero,
+so free slots can't be proven.
+The node array is written to a file, 32 bytes per node, with the file header taking the unused slot 0, and is memory
+mapped when opened, so proofs are served from disk without rebuilding the tree. The node array is followed by the leaf
+index, an open addressing hash table (linear probing, at most half full) of leaf index + 1 by leaf, 0 being empty.
+"""
+
+import json
+import mmap
+import os
+import struct
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache, partial
+from hashlib import sha3_256
+from heapq import heapify, heappop, heappush
+from itertools import islice
+from pathlib import Path
+
+# pycryptodome is used directly instead of eth_utils.keccak, which dispatches to its hash backend on each call
+from Crypto.Hash import keccak as _keccak
+
+TRAIT_ROOT_VERSION_XOR_MERGE = 0
+TRAIT_ROOT_VERSION_SORTED_PAIR = 1
+TRAIT_ROOT_VERSIONS = {"xor_merge": TRAIT_ROOT_VERSION_XOR_MERGE, "sorted_pair": TRAIT_ROOT_VERSION_SORTED_PAIR}
+
+ZERO_HASH = b"\0" * 32
+NODE_SIZE = 32
+CHUNK_SIZE = 16384
+
+# magic, trait root version, index bits, leaf count, collection contract, filling the node size
+FILE_MAGIC = b"ZTT2"
+FILE_HEADER = struct.Struct(">4sBB2xI20s")
+INDEX_ENTRY = struct.Struct(">I")
+
+
+def keccak256(data: bytes) -> bytes:
+    return _keccak.new(data=data, digest_bits=256).digest()
+
+
+@lru_cache(maxsize=4096)
+def trait_hash(trait_name: str, trait_value: str) -> bytes:
+    return sha3_256(sha3_256(trait_name.encode()).digest() + sha3_256(trait_value.encode()).digest()).digest()
+
+
+def token_node(contract: str, trait_name: str, trait_value: str, token_id: int) -> bytes:
+    return keccak256(_leaf_preimage(_encode_address(contract), trait_hash(trait_name, trait_value), token_id))
+
+
+def merge_xor(node1: bytes, node2: bytes) -> bytes:
+    h1 = int.from_bytes(keccak256(node1), "big")
+    h2 = int.from_bytes(keccak256(node2), "big")
+    return keccak256((h1 ^ h2).to_bytes(32, "big"))
+
+
+def merge_sorted_pair(node1: bytes, node2: bytes) -> bytes:
+    return keccak256(node1 + node2 if node1 < node2 else node2 + node1)
+
+
+def merge_function(version: int) -> Callable[[bytes, bytes], bytes]:
+    if version == TRAIT_ROOT_VERSION_SORTED_PAIR:
+        return merge_sorted_pair
+    if version == TRAIT_ROOT_VERSION_XOR_MERGE:
+        return merge_xor
+    raise ValueError(f"Invalid trait root version {version}")
+
+
+# proofs over a tree laid out as a heap, with node(index) returning the node at a tree index, shared with the in memory
+# trees of the contract tests
+def tree_proof(node: Callable[[int], bytes], index: int) -> list[bytes]:
+    proof = []
+    while index > 1:
+        proof.append(node(index ^ 1))
+        index //= 2
+    return proof
+
+
+def tree_multiproof(node: Callable[[int], bytes], indexes: Iterable[int]) -> tuple[list[bytes], list[bytes], int]:
+    # as expected by P2PLendingControl.is_trait_multiproof_valid, with the leaves ordered by descending tree index, so
+    # that each node is merged with the next one when they are siblings
+    indexes = sorted(set(indexes), reverse=True)
+    leaves = [node(index) for index in indexes]
+    queue = deque(indexes)
+    proof = []
+    flags = 0
+    step = 0
+    while queue[0] > 1:
+        index = queue.popleft()
+        if queue and queue[0] == index ^ 1:
+            queue.popleft()
+            flags |= 1 << step
+        else:
+            proof.append(node(index ^ 1))
+        queue.append(index // 2)
+        step += 1
+    return leaves, proof, flags
+
+
+# streams the (token_id, trait_name, trait_value) of a collection from a json lines file with one token per line, in
+# the usual metadata format: {"token_id": 1, "attributes": [{"trait_type": "fur", "value": "gold"}, ...]}
+def read_token_traits(metadata_file: str | Path) -> Iterator[tuple[int, str, str]]:
+    with Path(metadata_file).open(encoding="utf8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            token = json.loads(line)
+            token_id = int(token["token_id"])
+            for attribute in token.get("attributes") or []:
+                yield token_id, str(attribute["trait_type"]), str(attribute["value"])
+
+
+def token_traits_diff(
+    previous_metadata_file: str | Path, metadata_file: str | Path
+) -> tuple[set[tuple[int, str, str]], set[tuple[int, str, str]]]:
+    # (removed, added) token traits between two versions of a collection metadata file
+    previous = set(read_token_traits(previous_metadata_file))
+    current = set(read_token_traits(metadata_file))
+    return previous - current, current - previous
+
+
+@dataclass
+class TraitTreeUpdate:
+    tree: "TraitTree"
+    # tree index to new node for every node changed by the update, including the updated leaves. Proofs served before
+    # the update are brought up to date by replacing their nodes found here, see `patch_proof`. Empty if the tree had
+    # to be rebuilt, in which case leaf indexes changed and proofs must be requested again
+    changed_nodes: dict[int, bytes]
+    rebuilt: bool = False
+
+    def patch_proof(self, leaf_index: int, proof: list[bytes]) -> list[bytes]:
+        if self.rebuilt:
+            raise ValueError("Tree was rebuilt, proofs can't be patched")
+        index = self.tree.size + leaf_index
+        return [self.changed_nodes.get((index >> level) ^ 1, node) for level, node in enumerate(proof)]
+
+
+class TraitTree:
+    """Trait tree backed by a memory mapped node file, see `TraitTree.build`, `TraitTree.open` and `TraitTree.update`."""
+
+    def __init__(self, path: Path, data: mmap.mmap):
+        magic, self.version, self.index_bits, self.size, contract = FILE_HEADER.unpack_from(data)
+        if magic != FILE_MAGIC or len(data) != _file_size(self.size, self.index_bits):
+            data.close()
+            raise ValueError(f"Invalid trait tree file {path}")
+        self.path = path
+        self.contract = "0x" + contract.hex()
+        self._encoded_contract = contract.rjust(32, b"\0")
+        self._index_offset = _index_offset(self.size)
+        self._index_mask = (1 << self.index_bits) - 1
+        self._data = data
+
+    @staticmethod
+    def read_header(path: str | Path) -> tuple[str, int, int]:
+        # contract, version and size of a tree file, without mapping it
+        with Path(path).open("rb") as f:
+            magic, version, _, size, contract = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+        if magic != FILE_MAGIC:
+            raise ValueError(f"Invalid trait tree file {path}")
+        return "0x" + contract.hex(), version, size
+
+    @classmethod
+    def open(cls, path: str | Path) -> "TraitTree":
+        path = Path(path)
+        with path.open("rb") as f:
+            return cls(path, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    @classmethod
+    def build(
+        cls,
+        path: str | Path,
+        contract: str,
+        token_traits: Iterable[tuple[int, str, str]],
+        version: int = TRAIT_ROOT_VERSION_XOR_MERGE,
+        *,
+        workers: int = 1,
+        slack: int = 0,
+    ) -> "TraitTree":
+        # leaves are hashed in chunks as the token traits are consumed and each tree level is merged in chunks, spread
+        # over `workers` processes when more than one is given. `slack` free leaf slots are reserved for leaves added
+        # by later updates, which would otherwise need a rebuild
+        merge_function(version)
+        encoded_contract = _encode_address(contract)
+        preimages = (
+            _leaf_preimage(encoded_contract, trait_hash(trait_name, trait_value), token_id)
+            for token_id, trait_name, trait_value in token_traits
+        )
+
+        with _mapper(workers) as map_chunks:
+            leaves = set()
+            for hashes in map_chunks(_hash_chunk, _chunks(preimages, CHUNK_SIZE)):
+                leaves.update(hashes)
+            return cls._write(
+                Path(path), encoded_contract, sorted(leaves), version=version, slack=slack, map_chunks=map_chunks
+            )
+
+    @classmethod
+    def _write(
+        cls, path: Path, encoded_contract: bytes, leaves: list[bytes], *, version: int, slack: int, map_chunks: Callable
+    ) -> "TraitTree":
+        size = len(leaves) + slack
+        index_bits = (2 * size).bit_length()
+        index = [0] * (1 << index_bits)
+        for leaf_index, leaf in enumerate(leaves):
+            slot = _index_slot(leaf, index_bits)
+            while index[slot]:
+                slot = (slot + 1) % len(index)
+            index[slot] = leaf_index + 1
+
+        with _replace_file(path, _file_size(size, index_bits)) as data:
+            FILE_HEADER.pack_into(data, 0, FILE_MAGIC, version, index_bits, size, encoded_contract[12:])
+            data[NODE_SIZE * size : NODE_SIZE * (size + len(leaves))] = b"".join(leaves)
+            data[_index_offset(size) :] = struct.pack(f">{len(index)}I", *index)
+            del leaves, index
+
+            # nodes [lo, hi) only depend on nodes from hi onwards, which are already set
+            merge_level = partial(_merge_chunk, version)
+            hi = size
+            while hi > 1:
+                lo = (hi + 1) // 2
+                starts = range(lo, hi, CHUNK_SIZE)
+                children = (data[2 * NODE_SIZE * start : 2 * NODE_SIZE * min(start + CHUNK_SIZE, hi)] for start in starts)
+                for start, nodes in zip(starts, map_chunks(merge_level, children)):
+                    data[NODE_SIZE * start : NODE_SIZE * start + len(nodes)] = nodes
+                hi = lo
+
+        return cls.open(path)
+
+    def update(
+        self, removed_leaves: Iterable[bytes], added_leaves: Iterable[bytes], *, workers: int = 1, slack: int = 0
+    ) -> TraitTreeUpdate:
+        # replaces the tree file by one with `removed_leaves` removed and `added_leaves` added. Added leaves take the slots
+        # of removed leaves or free slots and only the paths from the changed slots to the root are merged again. If
+        # there aren't enough free slots, the tree is rebuilt with `slack` free slots. This tree keeps mapping the
+        # previous file, the updated tree is returned along with the changed nodes
+        removed_leaves, added_leaves = set(removed_leaves), set(added_leaves)
+        removed = sorted(i for leaf in removed_leaves - added_leaves if (i := self.leaf_index(leaf)) is not None)
+        added = sorted(leaf for leaf in added_leaves - removed_leaves if self.leaf_index(leaf) is None)
+        slots = removed + self._free_slots(len(added) - len(removed))
+
+        if len(slots) < len(added):
+            removed = set(removed)
+            leaves = [leaf for i in range(self.size) if i not in removed and (leaf := self.leaf(i)) != ZERO_HASH]
+            with _mapper(workers) as map_chunks:
+                tree = self._write(
+                    self.path,
+                    self._encoded_contract,
+                    sorted(leaves + added),
+                    version=self.version,
+                    slack=slack,
+                    map_chunks=map_chunks,
+                )
+            return TraitTreeUpdate(tree, {}, rebuilt=True)
+
+        with _replace_file(self.path, len(self._data), self._data) as data:
+            tree = TraitTree(self.path, data)
+            for leaf_index in removed:
+                tree._index_remove(tree.leaf(leaf_index))
+                tree._set_node(tree.size + leaf_index, ZERO_HASH)
+            for leaf_index, leaf in zip(slots, added):
+                tree._set_node(tree.size + leaf_index, leaf)
+                tree._index_insert(leaf, leaf_index)
+            changed_nodes = tree._merge_paths(set(removed) | set(slots[: len(added)]))
+
+        return TraitTreeUpdate(TraitTree.open(self.path), changed_nodes)
+
+    def close(self):
+        self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def node(self, index: int) -> bytes:
+        if not 0 < index < 2 * self.size:
+            raise IndexError(f"Node {index} out of range")
+        offset = NODE_SIZE * index
+        return self._data[offset : offset + NODE_SIZE]
+
+    def root(self) -> bytes:
+        return self.node(1) if self.size else ZERO_HASH
+
+    def leaf(self, leaf_index: int) -> bytes:
+        if not 0 <= leaf_index < self.size:
+            raise IndexError(f"Leaf {leaf_index} out of range")
+        return self.node(self.size + leaf_index)
+
+    def leaf_index(self, leaf: bytes) -> int | None:
+        return self._index_find(leaf)[1]
+
+    def token_leaf(self, trait_hash: bytes, token_id: int) -> bytes:
+        return keccak256(_leaf_preimage(self._encoded_contract, trait_hash, token_id))
+
+    def token_proof(self, trait_hash: bytes, token_id: int) -> list[bytes] | None:
+        leaf_index = self.leaf_index(self.token_leaf(trait_hash, token_id))
+        return self.proof(leaf_index) if leaf_index is not None else None
+
+    def proof(self, leaf_index: int) -> list[bytes]:
+        if not 0 <= leaf_index < self.size:
+            raise IndexError(f"Leaf {leaf_index} out of range")
+        return tree_proof(self.node, self.size + leaf_index)
+
+    def multiproof(self, leaf_indexes: Iterable[int]) -> tuple[list[bytes], list[bytes], int]:
+        indexes = {self.size + i for i in leaf_indexes}
+        if not indexes or not self.size <= min(indexes) <= max(indexes) < 2 * self.size:
+            raise IndexError("Leaves out of range")
+        return tree_multiproof(self.node, indexes)
+
+    def _set_node(self, index: int, node: bytes):
+        self._data[NODE_SIZE * index : NODE_SIZE * (index + 1)] = node
+
+    def _free_slots(self, count: int) -> list[int]:
+        slots = []
+        start, end = NODE_SIZE * self.size, NODE_SIZE * 2 * self.size
+        position = start
+        while len(slots) < count and (position := self._data.find(ZERO_HASH, position, end)) >= 0:
+            if position % NODE_SIZE:
+                position += NODE_SIZE - position % NODE_SIZE
+                continue
+            slots.append((position - start) // NODE_SIZE)
+            position += NODE_SIZE
+        return slots
+
+    def _merge_paths(self, leaf_indexes: Iterable[int]) -> dict[int, bytes]:
+        # parents have lower indexes than their children, so nodes are merged by descending index
+        merge = merge_function(self.version)
+        changed_nodes = {self.size + i: self.leaf(i) for i in leaf_indexes}
+        queued = {index // 2 for index in changed_nodes if index > 1}
+        queue = [-index for index in queued]
+        heapify(queue)
+        while queue:
+            index = -heappop(queue)
+            node = merge(self.node(2 * index), self.node(2 * index + 1))
+            self._set_node(index, node)
+            changed_nodes[index] = node
+            if index > 1 and index // 2 not in queued:
+                queued.add(index // 2)
+                heappush(queue, -(index // 2))
+        return changed_nodes
+
+    def _index_entry(self, slot: int) -> int:
+        return INDEX_ENTRY.unpack_from(self._data, self._index_offset + INDEX_ENTRY.size * slot)[0]
+
+    def _set_index_entry(self, slot: int, entry: int):
+        INDEX_ENTRY.pack_into(self._data, self._index_offset + INDEX_ENTRY.size * slot, entry)
+
+    def _index_find(self, leaf: bytes) -> tuple[int, int | None]:
+        # slot of the leaf and its index, or the empty slot where it would be inserted and None
+        slot = _index_slot(leaf, self.index_bits)
+        while entry := self._index_entry(slot):
+            if self.leaf(entry - 1) == leaf:
+                return slot, entry - 1
+            slot = (slot + 1) & self._index_mask
+        return slot, None
+
+    def _index_insert(self, leaf: bytes, leaf_index: int):
+        self._set_index_entry(self._index_find(leaf)[0], leaf_index + 1)
+
+    def _index_remove(self, leaf: bytes):
+        # backward shift deletion: entries after the hole are moved into it unless their home slot is after the hole
+        hole, _ = self._index_find(leaf)
+        slot = hole
+        while entry := self._index_entry(slot := (slot + 1) & self._index_mask):
+            home = _index_slot(self.leaf(entry - 1), self.index_bits)
+            if (hole < home <= slot) if hole <= slot else (home > hole or home <= slot):
+                continue
+            self._set_index_entry(hole, entry)
+            hole = slot
+        self._set_index_entry(hole, 0)
+
+
+def _encode_address(address: str) -> bytes:
+    return bytes.fromhex(address.removeprefix("0x")).rjust(32, b"\0")
+
+
+def _leaf_preimage(encoded_contract: bytes, trait_hash: bytes, token_id: int) -> bytes:
+    return encoded_contract + trait_hash + token_id.to_bytes(32, "big")
+
+
+def _index_slot(leaf: bytes, index_bits: int) -> int:
+    return int.from_bytes(leaf[:8], "big") & ((1 << index_bits) - 1)
+
+
+def _index_offset(size: int) -> int:
+    return NODE_SIZE * max(2 * size, 1)
+
+
+def _file_size(size: int, index_bits: int) -> int:
+    return _index_offset(size) + INDEX_ENTRY.size * (1 << index_bits)
+
+
+def _hash_chunk(preimages: list[bytes]) -> list[bytes]:
+    return [keccak256(preimage) for preimage in preimages]
+
+
+def _merge_chunk(version: int, children: bytes) -> bytes:
+    merge = merge_function(version)
+    return b"".join(
+        merge(children[i : i + NODE_SIZE], children[i + NODE_SIZE : i + 2 * NODE_SIZE])
+        for i in range(0, len(children), 2 * NODE_SIZE)
+    )
+
+
+def _chunks(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+@contextmanager
+def _mapper(workers: int):
+    if workers <= 1:
+        yield map
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield executor.map
+
+
+@contextmanager
+def _replace_file(path: Path, file_size: int, content: bytes | mmap.mmap | None = None):
+    # the file is written to a temporary file and moved in place, so that readers mapping the previous file keep a
+    # consistent view of it
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with tmp_path.open("w+b") as f:
+        f.truncate(file_size)
+        data = mmap.mmap(f.fileno(), 0)
+    try:
+        if content is not None:
+            data[:] = content
+        yield data
+        data.flush()
+    except BaseException:
+        data.close()
+        tmp_path.unlink()
+        raise
+    data.close()
+    tmp_path.replace(path)
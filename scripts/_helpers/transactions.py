@@ -1,11 +1,22 @@
-from functools import wraps
+from collections import defaultdict
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
 from typing import Any
 
+from ape import chain
+from ape_ethereum import multicall
+from ape_ethereum.multicall.exceptions import UnsupportedChainError
+from eth_utils import to_hex
 from rich import print
 from rich.markup import escape
 
 from .basetypes import ContractConfig, DeploymentContext
 
+MULTICALL_BATCH_SIZE = 200
+MAX_BATCH_GAS = 10_000_000
+RECEIPT_TIMEOUT = 600
+
 
 def check_owner(f):
     @wraps(f)
@@ -67,6 +78,27 @@ def execute_read(context: DeploymentContext, contract: str, func: str, *args, op
     return result
 
 
+def execute_reads(context: DeploymentContext, contract: str, func: str, args_list: list[tuple]) -> list:
+    # same as execute_read for each args in args_list, aggregated in Multicall3 batches where it is deployed
+    contract_instance = context.contracts[contract].contract
+    print(f"Calling [blue]{escape(contract)}[/blue].{func} for {len(args_list)} arguments", end=" ")
+
+    method = getattr(contract_instance, func)
+    results = []
+    try:
+        for start in range(0, len(args_list), MULTICALL_BATCH_SIZE):
+            call = multicall.Call()
+            for args in args_list[start : start + MULTICALL_BATCH_SIZE]:
+                call.add(method, *args)
+            results.extend(call())
+    except UnsupportedChainError:
+        print("without multicall")
+        return [contract_instance.call_view_method(func, *args) for args in args_list]
+
+    print(f"in {-(-len(args_list) // MULTICALL_BATCH_SIZE)} multicalls")
+    return results
+
+
 def execute(context: DeploymentContext, contract: str, func: str, *args, options=None):
     args_repr = [f"[blue]{escape(c)}[/blue]" if c in context else str(c) for c in args]
     print(f"Executing [blue]{escape(contract)}[/blue].{func}({', '.join(args_repr)})")
@@ -75,7 +107,124 @@ def execute(context: DeploymentContext, contract: str, func: str, *args, options
         function = getattr(contract_instance, func)
         args_values = [context[c] if c in context else c for c in args]  # noqa: SIM401
         args_values = [v.address() if isinstance(v, ContractConfig) else v for v in args_values]
+        # the transaction is prepared (and its gas estimated) before getting a nonce, so that failing calls don't take one
         try:
-            function(*args_values, **({"sender": context.owner} | context.gas_options() | (options or {})))
+            txn = function.as_transaction(
+                *args_values, **({"sender": context.owner} | context.gas_options() | (options or {}))
+            )
         except Exception as e:
             print(f"[bold red]Error executing {contract}.{func} with arguments {args_values}: {e}")
+            return
+        for receipt in send_transactions(context, [txn]):
+            if receipt.failed:
+                print(f"[bold red]Transaction {receipt.txn_hash} failed, {contract}.{func} with arguments {args_values}")
+
+
+def execute_batched(
+    context: DeploymentContext, contract: str, func: str, items: list, *, batch_size: int, max_gas=MAX_BATCH_GAS, options=None
+):
+    # executes func with items split in batches of at most batch_size items and max_gas estimated gas. All the batches
+    # are sent before waiting for their receipts, see send_transactions
+    batches = [items[start : start + batch_size] for start in range(0, len(items), batch_size)]
+    if context.dryrun:
+        for batch in batches:
+            execute(context, contract, func, batch)
+        return
+
+    function = getattr(context.contracts[contract].contract, func)
+    tx_options = {"sender": context.owner} | context.gas_options() | (options or {})
+    not_executed = []
+    batches = [
+        gas_batch for batch in batches for gas_batch in _split_by_gas(function, batch, max_gas, tx_options, not_executed)
+    ]
+    print(f"Executing [blue]{escape(contract)}[/blue].{func} with {len(items)} items in {len(batches)} transactions")
+
+    txns = [function.as_transaction(batch, **tx_options) for batch in batches]
+    receipts = send_transactions(context, txns)
+    for batch, receipt in zip(batches, receipts):
+        status = "[bold red]failed[/]" if receipt.failed else "confirmed"
+        print(f"Transaction {receipt.txn_hash} {status}, [blue]{escape(contract)}[/blue].{func} with {len(batch)} items")
+        if receipt.failed:
+            not_executed.extend(batch)
+    # send_transactions stops at the first error, the batches after it are never sent
+    for batch in batches[len(receipts) :]:
+        print(f"[bold red]Transaction not sent[/], [blue]{escape(contract)}[/blue].{func} with {len(batch)} items")
+        not_executed.extend(batch)
+
+    if not_executed:
+        raise RuntimeError(f"{contract}.{func}: {len(not_executed)} of {len(items)} items not executed: {not_executed}")
+
+
+def send_transactions(context: DeploymentContext, txns: list) -> list:
+    # signs the transactions with consecutive nonces and sends them all before waiting for the receipts in parallel.
+    # Sending stops at the first error, as the following transactions would be stuck behind the missing nonce, so the
+    # receipts returned may be fewer than the transactions
+    nonce = context.allocate_nonces(len(txns))
+    txn_hashes = []
+    for txn in txns:
+        try:
+            txn.nonce = nonce + len(txn_hashes)
+            signed_txn = context.owner.sign_transaction(context.owner.prepare_transaction(txn))
+            txn_hashes.append(to_hex(chain.provider.web3.eth.send_raw_transaction(signed_txn.serialize_transaction())))
+        except Exception as e:
+            print(f"[bold red]Error sending transaction {txn}: {e}")
+            _release_nonces(context, nonce + len(txn_hashes), nonce + len(txns))
+            break
+
+    with ThreadPoolExecutor(max_workers=min(len(txn_hashes), 16) or 1) as executor:
+        return list(executor.map(partial(chain.provider.get_receipt, timeout=RECEIPT_TIMEOUT), txn_hashes))
+
+
+def _release_nonces(context: DeploymentContext, start: int, end: int):
+    # nonces allocated concurrently after the unused ones can't be given back, so the unused nonces are taken by empty
+    # self transfers, otherwise the transactions sent with the later nonces would never be mined
+    if context.release_nonces(start, end):
+        return
+    for nonce in range(start, end):
+        try:
+            context.owner.transfer(context.owner, 0, nonce=nonce, **context.gas_options())
+        except Exception as e:
+            print(f"[bold red]Error filling the gap of nonce {nonce}: {e}")
+
+
+def run_by_contract(tasks: list[tuple[str, Callable[[], Any]]]):
+    # runs (contract, task) pairs, the tasks for the same contract in order and the tasks for different contracts
+    # concurrently. Transactions sent by the tasks get their nonces from context.allocate_nonces
+    groups = defaultdict(list)
+    for contract, task in tasks:
+        groups[contract].append(task)
+
+    def run_group(group: list[Callable[[], Any]]):
+        for task in group:
+            task()
+
+    with ThreadPoolExecutor(max_workers=min(len(groups), 16) or 1) as executor:
+        for future in [executor.submit(run_group, group) for group in groups.values()]:
+            future.result()
+
+
+def task_contract(task: Callable) -> str:
+    # the contract a config task belongs to, and sends its transactions to, for tasks to be grouped by contract in
+    # run_by_contract
+    contract = getattr(task.func if isinstance(task, partial) else task, "__self__", None)
+    return contract.task_target() if isinstance(contract, ContractConfig) else repr(task)
+
+
+def _split_by_gas(function, batch: list, max_gas: int, tx_options: dict, not_executed: list) -> list[list]:
+    # halves the batch until each part is estimated under max_gas. A failing estimation (eg a reverting item, or a batch
+    # over the block gas limit) also halves the batch, so that a single failing item is added to not_executed and the
+    # others are still sent
+    try:
+        gas = function.estimate_gas_cost(batch, **tx_options)
+    except Exception as e:
+        if len(batch) == 1:
+            print(f"[bold red]Error estimating gas with {batch}: {e}")
+            not_executed.extend(batch)
+            return []
+        gas = None
+    if len(batch) > 1 and (gas is None or gas > max_gas):
+        half = len(batch) // 2
+        return _split_by_gas(function, batch[:half], max_gas, tx_options, not_executed) + _split_by_gas(
+            function, batch[half:], max_gas, tx_options, not_executed
+        )
+    return [batch]
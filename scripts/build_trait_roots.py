@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import time
+import warnings
+from pathlib import Path
+
+import click
+
+from ._helpers.deployment import Environment
+from ._helpers.trait_tree import (
+    TRAIT_ROOT_VERSION_XOR_MERGE,
+    TRAIT_ROOT_VERSIONS,
+    TraitTree,
+    TraitTreeUpdate,
+    read_token_traits,
+    token_traits_diff,
+    trait_hash,
+)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.WARNING)
+warnings.filterwarnings("ignore")
+
+
+ENV = Environment[os.environ.get("ENV", "local")]
+CHAIN = os.environ.get("CHAIN", "nochain")
+
+
+def load_collection_contracts(env: Environment, chain: str) -> dict[str, str]:
+    config_file = f"{Path.cwd()}/configs/{env.name}/{chain}/collections.json"
+    with open(config_file, "r") as f:
+        config = json.load(f)
+    return {key: c["contract_address"] for key, c in config.items() if c.get("contract_address")}
+
+
+def store_trait_roots(trait_roots: dict[str, str | dict], env: Environment, chain: str):
+    config_file = f"{Path.cwd()}/configs/{env.name}/{chain}/p2p.json"
+    with open(config_file, "r") as f:
+        config = json.load(f)
+
+    config.setdefault("configs", {}).setdefault("trait_roots", {}).update(trait_roots)
+
+    with open(config_file, "w") as f:
+        f.write(json.dumps(config, indent=4, sort_keys=True))
+
+
+def trait_root_config(tree: TraitTree) -> str | dict:
+    # plain roots are xor merge roots, which is what the configs held before root versions were introduced
+    if tree.version == TRAIT_ROOT_VERSION_XOR_MERGE:
+        return tree.root().hex()
+    return {"root": tree.root().hex(), "version": tree.version}
+
+
+def update_tree(
+    tree_file: Path, previous_metadata_file: Path, metadata_file: Path, workers: int, slack: int
+) -> TraitTreeUpdate:
+    removed, added = token_traits_diff(previous_metadata_file, metadata_file)
+    with TraitTree.open(tree_file) as tree:
+        update = tree.update(
+            [tree.token_leaf(trait_hash(name, value), token_id) for token_id, name, value in removed],
+            [tree.token_leaf(trait_hash(name, value), token_id) for token_id, name, value in added],
+            workers=workers,
+            slack=slack,
+        )
+
+    # changed nodes, for proofs served before the update to be patched instead of requested again
+    diff = {
+        "root": update.tree.root().hex(),
+        "rebuilt": update.rebuilt,
+        "nodes": {index: node.hex() for index, node in sorted(update.changed_nodes.items())},
+    }
+    with open(tree_file.with_suffix(".diff.json"), "w") as f:
+        f.write(json.dumps(diff, indent=4))
+    return update
+
+
+def can_update(tree_file: Path, previous_metadata_file: Path | None, contract: str, version: int) -> bool:
+    if previous_metadata_file is None or not previous_metadata_file.exists() or not tree_file.exists():
+        return False
+    tree_contract, tree_version, _ = TraitTree.read_header(tree_file)
+    return tree_contract == contract.lower() and tree_version == version
+
+
+@click.command()
+@click.option(
+    "--metadata-dir",
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+    required=True,
+    help="directory with a <collection_key>.jsonl metadata file per collection",
+)
+@click.option("--output-dir", type=click.Path(file_okay=False, path_type=Path), default=Path(".cache/trait_trees"))
+@click.option("--root-version", type=click.Choice(list(TRAIT_ROOT_VERSIONS)), default="xor_merge")
+@click.option("--workers", type=int, default=os.cpu_count())
+@click.option("--slack", type=int, default=0, help="free leaf slots reserved in new trees for leaves added by updates")
+@click.option(
+    "--previous-metadata-dir",
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+    help="metadata the existing trees were built from, to update them incrementally instead of rebuilding them",
+)
+@click.argument("collections", nargs=-1)
+def cli(metadata_dir, output_dir, root_version, workers, slack, previous_metadata_dir, collections):  # noqa: PLR0917
+    print(f"Building trait trees in {ENV.name} for {CHAIN}")
+
+    contracts = load_collection_contracts(ENV, CHAIN)
+    trait_roots = {}
+    for metadata_file in sorted(metadata_dir.glob("*.jsonl")):
+        collection = metadata_file.stem
+        if collections and collection not in collections:
+            continue
+        if collection not in contracts:
+            print(f"Skipping {collection}, no contract address in collections config")
+            continue
+
+        start = time.perf_counter()
+        tree_file = output_dir / ENV.name / CHAIN / f"{collection}.tree"
+        previous_metadata_file = previous_metadata_dir / metadata_file.name if previous_metadata_dir else None
+        version = TRAIT_ROOT_VERSIONS[root_version]
+        if can_update(tree_file, previous_metadata_file, contracts[collection], version):
+            update = update_tree(tree_file, previous_metadata_file, metadata_file, workers, slack)
+            tree = update.tree
+            changes = "rebuilt" if update.rebuilt else f"{len(update.changed_nodes)} nodes changed"
+        else:
+            tree = TraitTree.build(
+                tree_file, contracts[collection], read_token_traits(metadata_file), version, workers=workers, slack=slack
+            )
+            changes = "built"
+        with tree:
+            trait_roots[collection] = trait_root_config(tree)
+            print(
+                f"{collection}: {tree.size} leaves, {changes}, root {tree.root().hex()} ({time.perf_counter() - start:.2f}s)"
+            )
+
+    store_trait_roots(trait_roots, ENV, CHAIN)
+
+    print(f"Trait roots built in {ENV.name} for {CHAIN}")
@@ -1,14 +1,13 @@
-import json
 import logging
 import os
 import warnings
-from decimal import Decimal
-from pathlib import Path
+from collections.abc import Iterable, Iterator
 
-import boto3
 import click
 
+from ._helpers.config_loader import config_loader
 from ._helpers.deployment import Environment
+from ._helpers.dynamodb import SCAN_SEGMENTS, dynamodb_client, scan_items
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.WARNING)
@@ -17,43 +16,23 @@ warnings.filterwarnings("ignore")
 
 ENV = Environment[os.environ.get("ENV", "local")]
 CHAIN = os.environ.get("CHAIN")
-DYNAMODB = boto3.resource("dynamodb")
-COLLECTIONS = DYNAMODB.Table(f"collections-{ENV.name}")
+DYNAMODB = dynamodb_client(SCAN_SEGMENTS)
+COLLECTIONS = f"collections-{ENV.name}"
 
 
-def deserialize_values(item):
-    if type(item) is dict:
-        return {k: deserialize_values(v) for k, v in item.items()}
-    if type(item) is list:
-        return [deserialize_values(v) for v in item]
-    if type(item) is Decimal:
-        return int(item)
-    return item
+def get_collections(chain: str) -> Iterator[dict]:
+    return scan_items(DYNAMODB, COLLECTIONS, {"chain": chain}, SCAN_SEGMENTS)
 
 
-def get_collections():
-    collection_items = []
-    response = COLLECTIONS.scan()
-    while "LastEvaluatedKey" in response:
-        collection_items.extend(deserialize_values(i) for i in response["Items"])
-        response = COLLECTIONS.scan(ExclusiveStartKey=response["LastEvaluatedKey"])
-    collection_items.extend(deserialize_values(i) for i in response["Items"])
-    return collection_items
-
-
-def store_collections_config(collections: list[dict], env: Environment, chain: str):
-    config_file = f"{Path.cwd()}/configs/{env.name}/{chain}/collections.json"
-    config = {c["collection_key"]: c for c in collections if c.get("chain") == chain}
-
-    with open(config_file, "w") as f:
-        f.write(json.dumps(config, indent=4, sort_keys=True))
+def store_collections_config(collections: Iterable[dict], env: Environment, chain: str):
+    config_loader(env, chain).store_entries("collections.json", ((c["collection_key"], c) for c in collections))
 
 
 @click.command()
 def cli():
     print(f"Retrieving collection configs in {ENV.name} for {CHAIN}")
 
-    collections = get_collections()
+    collections = get_collections(CHAIN)
     store_collections_config(collections, ENV, CHAIN)
 
     print(f"Collections configs retrieved in {ENV.name} for {CHAIN}")
@@ -0,0 +1,42 @@
+import logging
+import os
+import warnings
+from pathlib import Path
+
+import click
+from ape import chain
+from ape.cli import ConnectedProviderCommand
+from rich import print
+
+from ._helpers.config_loader import config_loader
+from ._helpers.deployment import Environment
+from ._helpers.loan_index import LoanIndex
+
+ENV = Environment[os.environ.get("ENV", "local")]
+CHAIN = os.environ.get("CHAIN", "nochain")
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.WARNING)
+warnings.filterwarnings("ignore")
+
+
+def get_p2p_addresses(env: Environment, chain: str) -> dict[str, str]:
+    p2p_configs = config_loader(env, chain).load("p2p.json")["p2p"]
+    return {k: v["address"] for k, v in p2p_configs.items() if v.get("contract") == "P2PLendingNfts" and v.get("address")}
+
+
+@click.command(cls=ConnectedProviderCommand)
+@click.option("--index-file", type=click.Path(path_type=Path), default=None, help="sqlite file, .cache/loans/<env>-<chain>")
+@click.option("--start-block", type=int, default=0, help="first block to index, usually the contracts deployment block")
+@click.option("--batch-size", type=int, default=2000, help="blocks per eth_getLogs request")
+def cli(network, index_file, start_block, batch_size):
+    print(f"Connected to {network}")
+
+    index_file = index_file or Path.cwd() / ".cache" / "loans" / f"{ENV.name}-{CHAIN}.sqlite"
+    with LoanIndex(index_file, chain.provider.web3, batch_size=batch_size) as index:
+        for key, address in get_p2p_addresses(ENV, CHAIN).items():
+            last_block = index.sync(address, start_block)
+            print(f"Indexed p2p.{key} ({address}) up to block {last_block}, {len(index.loan_hashes(address))} active loans")
+
+    print(f"Loans indexed in {index_file}")
@@ -1,14 +1,13 @@
-import hashlib
-import json
 import logging
 import os
 import warnings
-from pathlib import Path
 
-import boto3
 import click
 
+from ._helpers.config_loader import ConfigLoader, config_loader
 from ._helpers.deployment import DeploymentManager, Environment
+from ._helpers.dynamodb import Update, dynamodb_client, publish
+from ._helpers.trait_tree import TRAIT_ROOT_VERSION_XOR_MERGE
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.WARNING)
@@ -17,215 +16,152 @@ warnings.filterwarnings("ignore")
 
 ENV = Environment[os.environ.get("ENV", "local")]
 CHAIN = os.environ.get("CHAIN", "nochain")
-DYNAMODB = boto3.resource("dynamodb")
-P2P_CONFIGS = DYNAMODB.Table(f"p2p-configs-{ENV.name}")
-P2P_PROXIES = DYNAMODB.Table(f"p2p-proxies-{ENV.name}")
-COLLECTIONS = DYNAMODB.Table(f"collections-{ENV.name}")
-TRACKED_CONTRACTS = DYNAMODB.Table(f"tracked-contracts-{ENV.name}")
-ABI = DYNAMODB.Table(f"abis-{ENV.name}")
-KEY_ATTRIBUTES = ["p2p_config_key"]
-TRACKED_KEY_ATTRIBUTES = ["contract_key"]
+MAX_WORKERS = int(os.environ.get("PUBLISH_WORKERS", "16"))
+DYNAMODB = dynamodb_client(MAX_WORKERS)
+P2P_CONFIGS = f"p2p-configs-{ENV.name}"
+P2P_PROXIES = f"p2p-proxies-{ENV.name}"
+COLLECTIONS = f"collections-{ENV.name}"
+TRACKED_CONTRACTS = f"tracked-contracts-{ENV.name}"
+ABI = f"abis-{ENV.name}"
 EMPTY_BYTES32 = "00" * 32
 
 
-def load_abi(filename: str) -> list:
-    with open(f"contracts/{filename}", "r") as f:
-        return json.load(f)
-
-
-def abi_key(abi: list) -> str:
-    json_dump = json.dumps(abi, sort_keys=True)
-    hash = hashlib.sha1(json_dump.encode("utf8"))
-    return hash.hexdigest()
-
-
-def get_abi_map(context, env: Environment, chain: str) -> dict:
-    config_file = f"{Path.cwd()}/configs/{env.name}/{chain}/p2p.json"
-    with open(config_file, "r") as f:
-        config = json.load(f)
-
+def get_abi_map(context, loader: ConfigLoader) -> dict:
+    config = loader.load("p2p.json")
     contracts = {
-        f"{prefix}.{k}": v
+        f"{prefix}.{k}": dict(v)
         for prefix, contracts in config.items()
         for k, v in contracts.items()
         if prefix in {"common", "p2p", "proxies"} and context[f"{prefix}.{k}"].contract is not None  # FIXME
     }
     for k, config in contracts.items():
-        contract = context[k].contract
-        if not contract:
-            continue
-        config["abi"] = contract.contract_type.dict()["abi"]
-        config["abi_key"] = abi_key(contract.contract_type.dict()["abi"])
-
-    with open(f"{Path.cwd()}/configs/{env.name}/{chain}/tracking.json", "r") as f:
-        tracking_config = json.load(f)
-    tracking_contracts = {f"tracking.{k}": v for k, v in tracking_config.items()}
-    for config in tracking_contracts.values():
-        abi = load_abi(config["abi_file"]) if "abi_file" in config else contract.contract_type.dict()["abi"]
-        config["abi"] = abi
-        config["abi_key"] = abi_key(abi)
+        contract_type = context[k].contract.contract_type
+        config["abi"] = loader.contract_abi(contract_type)
+        config["abi_key"] = loader.contract_abi_key(contract_type)
 
+    tracking_contracts = {f"tracking.{k}": v for k, v in get_tracking_configs(loader).items()}
     return contracts | tracking_contracts
 
 
-def get_p2p_configs(context, env: Environment, chain: str) -> dict:
-    config_file = f"{Path.cwd()}/configs/{env.name}/{chain}/p2p.json"
-    with open(config_file, "r") as f:
-        config = json.load(f)
-
-    p2p_configs = config["p2p"]
+def get_p2p_configs(loader: ConfigLoader, abis: dict) -> dict:
+    p2p_configs = {k: dict(v) for k, v in loader.load("p2p.json")["p2p"].items()}
     for k, config in p2p_configs.items():
-        contract = context[f"p2p.{k}"].contract
         if "abi_key" not in config:
-            config["abi_key"] = abi_key(contract.contract_type.dict()["abi"])
+            config["abi_key"] = abis[f"p2p.{k}"]["abi_key"]
 
     return p2p_configs
 
 
-def get_p2p_proxies(context, env: Environment, chain: str) -> dict:
-    config_file = f"{Path.cwd()}/configs/{env.name}/{chain}/p2p.json"
-    with open(config_file, "r") as f:
-        config = json.load(f)
-
-    p2p_proxies = config["proxies"]
+def get_p2p_proxies(loader: ConfigLoader, abis: dict) -> dict:
+    p2p_proxies = {k: dict(v) for k, v in loader.load("p2p.json")["proxies"].items()}
     for k, config in p2p_proxies.items():
-        contract = context[f"proxies.{k}"].contract
         if "abi_key" not in config:
-            config["abi_key"] = abi_key(contract.contract_type.dict()["abi"])
+            config["abi_key"] = abis[f"proxies.{k}"]["abi_key"]
 
     return p2p_proxies
 
 
-def get_traits_roots(context, env: Environment, chain: str) -> dict:  # noqa: ARG001
-    config_file = f"{Path.cwd()}/configs/{env.name}/{chain}/p2p.json"
-    with open(config_file, "r") as f:
-        config = json.load(f)
-
-    configs = config.get("configs", {})
+def get_traits_roots(loader: ConfigLoader) -> dict:
+    configs = loader.load("p2p.json").get("configs", {})
     return configs.get("trait_roots", {})
 
 
-def get_tracking_configs(context, env: Environment, chain: str) -> dict:  # noqa: ARG001
-    with open(f"{Path.cwd()}/configs/{env.name}/{chain}/tracking.json", "r") as f:
-        tracking_config = json.load(f)
-    tracking_contracts = dict(tracking_config.items())
+def get_tracking_configs(loader: ConfigLoader) -> dict:
+    tracking_contracts = {k: dict(v) for k, v in loader.load("tracking.json").items()}
     for config in tracking_contracts.values():
-        abi = load_abi(config["abi_file"])
-        config["abi"] = abi
-        config["abi_key"] = abi_key(abi)
+        abi_file = f"contracts/{config['abi_file']}"
+        config["abi"] = loader.abi(abi_file)
+        config["abi_key"] = loader.abi_key(abi_file)
 
     return tracking_contracts
 
 
-def update_p2p_config(p2p_config_key: str, p2p_config: dict):
-    indexed_attrs = list(enumerate(p2p_config.items()))
-    p2p_config["p2p_config_key"] = p2p_config_key
-    update_expr = ", ".join(f"{k}=:v{i}" for i, (k, v) in indexed_attrs if k not in KEY_ATTRIBUTES)
-    values = {f":v{i}": v for i, (k, v) in indexed_attrs if k not in KEY_ATTRIBUTES}
-    P2P_CONFIGS.update_item(
-        Key={"p2p_config_key": p2p_config_key}, UpdateExpression=f"SET {update_expr}", ExpressionAttributeValues=values
-    )
+def get_properties_abis(context, abis: dict, config: dict) -> dict:
+    properties_abis = {}
+    for prop, prop_val in config.get("properties", {}).items():
+        if prop_val in abis:
+            properties_abis[prop] = abis[prop_val]["abi_key"]
+        elif prop_val in context and context[prop_val].abi_key:
+            properties_abis[prop] = context[prop_val].abi_key
+    return properties_abis
 
 
-def update_p2p_proxy(p2p_proxy_key: str, p2p_proxy: dict):
-    indexed_attrs = list(enumerate(p2p_proxy.items()))
-    p2p_proxy["p2p_proxy_key"] = p2p_proxy_key
-    update_expr = ", ".join(f"{k}=:v{i}" for i, (k, v) in indexed_attrs if k not in KEY_ATTRIBUTES)
-    values = {f":v{i}": v for i, (k, v) in indexed_attrs if k not in KEY_ATTRIBUTES}
-    P2P_PROXIES.update_item(
-        Key={"p2p_proxy_key": p2p_proxy_key}, UpdateExpression=f"SET {update_expr}", ExpressionAttributeValues=values
-    )
+def p2p_config_update(p2p_config_key: str, p2p_config: dict) -> Update:
+    abi_key = p2p_config["abi_key"]
+    return Update(f"p2p config {p2p_config_key} {abi_key=}", P2P_CONFIGS, {"p2p_config_key": p2p_config_key}, p2p_config)
 
 
-def update_tracking_config(config_key: str, config: dict):
-    config = {k: v for k, v in config.items() if k != "abi"}
-    indexed_attrs = list(enumerate(config.items()))
-    config["contract_key"] = config_key
-    update_expr = ", ".join(f"#k{i}=:v{i}" for i, (k, v) in indexed_attrs if k not in TRACKED_KEY_ATTRIBUTES)
-    names = {f"#k{i}": k for i, (k, v) in indexed_attrs if k not in TRACKED_KEY_ATTRIBUTES}
-    values = {f":v{i}": v for i, (k, v) in indexed_attrs if k not in TRACKED_KEY_ATTRIBUTES}
-    TRACKED_CONTRACTS.update_item(
-        Key={"contract_key": config_key},
-        UpdateExpression=f"SET {update_expr}",
-        ExpressionAttributeNames=names,
-        ExpressionAttributeValues=values,
-    )
-
-
-def update_collection_trait_root(collection_key: str, root: str):
-    COLLECTIONS.update_item(
-        Key={"collection_key": collection_key}, UpdateExpression="SET traits_root=:v", ExpressionAttributeValues={":v": root}
-    )
+def p2p_proxy_update(p2p_proxy_key: str, p2p_proxy: dict) -> Update:
+    abi_key = p2p_proxy["abi_key"]
+    return Update(f"p2p proxy {p2p_proxy_key} {abi_key=}", P2P_PROXIES, {"p2p_proxy_key": p2p_proxy_key}, p2p_proxy)
 
 
-def update_collection_p2p_whitelisted(collection_key: str, *, whitelisted: bool):
-    COLLECTIONS.update_item(
-        Key={"collection_key": collection_key},
-        UpdateExpression="SET p2p_whitelisted=:v",
-        ExpressionAttributeValues={":v": whitelisted},
+def tracking_config_update(config_key: str, config: dict) -> Update:
+    config = {k: v for k, v in config.items() if k != "abi"}
+    return Update(f"tracking config {config_key} {config['name']}", TRACKED_CONTRACTS, {"contract_key": config_key}, config)
+
+
+def collection_update(collection_key: str, trait_root: str | dict) -> Update:
+    # trait roots built with a non default tree format are stored in the configs along with their version. The version
+    # is only stored for those, collections without it use the xor merge, so existing items are left unchanged
+    if isinstance(trait_root, dict):
+        root, version = trait_root["root"], trait_root["version"]
+    else:
+        root, version = trait_root, TRAIT_ROOT_VERSION_XOR_MERGE
+    whitelisted = root != EMPTY_BYTES32
+    return Update(
+        f"collection {collection_key} {root=} {version=} {whitelisted=}",
+        COLLECTIONS,
+        {"collection_key": collection_key},
+        {
+            "traits_root": root,
+            "traits_root_version": version if version != TRAIT_ROOT_VERSION_XOR_MERGE else None,
+            "p2p_whitelisted": whitelisted,
+        },
     )
 
 
-def update_abi(abi_key: str, abi: list[dict]):
-    ABI.update_item(Key={"abi_key": abi_key}, UpdateExpression="SET abi=:v", ExpressionAttributeValues={":v": abi})
+def abi_update(contract_key: str, abi_key: str, abi: list[dict]) -> Update:
+    return Update(f"abi {contract_key=} {abi_key=}", ABI, {"abi_key": abi_key}, {"abi": abi}, content_keyed=True)
 
 
 @click.command()
-def cli():  # noqa: C901
+@click.option("--dry-run", is_flag=True, help="only report the items that would be updated")
+def cli(dry_run):
     dm = DeploymentManager(ENV, CHAIN)
+    loader = config_loader(dm.env, dm.chain)
 
     print(f"Updating p2p configs in {ENV.name} for {CHAIN}")
 
-    abis = get_abi_map(dm.context, dm.env, dm.chain)
-    for contract_key, config in abis.items():
-        abi_key = config["abi_key"]
-        print(f"adding abi {contract_key=} {abi_key=}")
-        update_abi(abi_key, config["abi"])
+    abis = get_abi_map(dm.context, loader)
+    abi_updates = {
+        config["abi_key"]: abi_update(contract_key, config["abi_key"], config["abi"]) for contract_key, config in abis.items()
+    }
 
-    p2p_configs = get_p2p_configs(dm.context, dm.env, dm.chain)
+    updates = []
+    p2p_configs = get_p2p_configs(loader, abis)
     for k, config in p2p_configs.items():
         config["chain"] = CHAIN
-        properties_abis = {}
-        for prop, prop_val in config.get("properties", {}).items():
-            if prop_val in abis:
-                properties_abis[prop] = abis[prop_val]["abi_key"]
-            elif prop_val in dm.context and dm.context[prop_val].abi_key:
-                properties_abis[prop] = dm.context[prop_val].abi_key
-        config["properties_abis"] = properties_abis
-
-        abi_key = config["abi_key"]
-        print(f"updating p2p config {k} {abi_key=}")
-        update_p2p_config(k, config)
-
-    tracking_configs = get_tracking_configs(dm.context, dm.env, dm.chain)
+        config["properties_abis"] = get_properties_abis(dm.context, abis, config)
+        updates.append(p2p_config_update(k, config))
+
+    tracking_configs = get_tracking_configs(loader)
     for k, config in tracking_configs.items():
         config["chain"] = CHAIN
-        print(f"updating tracking config {k} {config['name']}")
-        update_tracking_config(k, config)
+        updates.append(tracking_config_update(k, config))
 
-    p2p_proxies = get_p2p_proxies(dm.context, dm.env, dm.chain)
+    p2p_proxies = get_p2p_proxies(loader, abis)
     for k, config in p2p_proxies.items():
         config["chain"] = CHAIN
-        properties_abis = {}
-        for prop, prop_val in config.get("properties", {}).items():
-            if prop_val in abis:
-                properties_abis[prop] = abis[prop_val]["abi_key"]
-            elif prop_val in dm.context and dm.context[prop_val].abi_key:
-                properties_abis[prop] = dm.context[prop_val].abi_key
-        config["properties_abis"] = properties_abis
-
-        abi_key = config["abi_key"]
-        print(f"updating p2p proxy {k} {abi_key=}")
-        update_p2p_proxy(k, config)
-
-    trait_roots = get_traits_roots(dm.context, dm.env, dm.chain)
-    for collection, root in trait_roots.items():
-        print(f"updating trait root {collection=} {root=}")
-        update_collection_trait_root(collection, root)
+        config["properties_abis"] = get_properties_abis(dm.context, abis, config)
+        updates.append(p2p_proxy_update(k, config))
 
+    trait_roots = get_traits_roots(loader)
     for collection, root in trait_roots.items():
-        whitelisted = root != EMPTY_BYTES32
-        print(f"updating whitelisted {collection=} {whitelisted=}")
-        update_collection_p2p_whitelisted(collection, whitelisted=whitelisted)
+        updates.append(collection_update(collection, root))
+
+    # abis go first, so that no published config refers to a missing abi
+    publish(DYNAMODB, list(abi_updates.values()), dry_run=dry_run, max_workers=MAX_WORKERS)
+    publish(DYNAMODB, updates, dry_run=dry_run, max_workers=MAX_WORKERS)
 
     print(f"P2P configs updated in {ENV.name} for {CHAIN}")
@@ -0,0 +1,304 @@
+import json
+from pathlib import Path
+
+import boa
+import pytest
+import vyper
+from eth_utils import keccak
+
+from scripts._helpers.trait_tree import merge_function
+
+from ..conftest_base import (
+    ZERO_ADDRESS,
+    CreateLoanRequest,
+    Fee,
+    Loan,
+    Offer,
+    OfferType,
+    TokenTraitTree,
+    TraitRoot,
+    TraitRootVersion,
+    get_last_event,
+    sign_offer,
+)
+
+# the deployment of the unit tests, so that the benchmarks measure the contracts the unit tests run against
+from ..unit.conftest import (
+    accounts,
+    boa_env,
+    borrower,
+    borrower_account,
+    cryptopunks,
+    cryptopunks_contract_def,
+    delegation_registry_contract_def,
+    erc721_contract_def,
+    isolated_storage_traces,
+    lender,
+    lender2,
+    lender2_account,
+    lender_account,
+    owner,
+    owner_account,
+    p2p_lending_control_contract_def,
+    p2p_lending_nfts_contract_def,
+    packed_loan_proxy_contract_def,
+    weth9_contract_def,
+)
+from ..unit.p2p_nfts.conftest import (
+    bayc,
+    bayc_key_hash,
+    delegation_registry,
+    p2p_control,
+    p2p_nfts_usdc,
+    punks_key_hash,
+    usdc,
+)
+
+MAX_UINT256 = 2**256 - 1
+TX_BASE_GAS = 21000
+TRAIT_NAME = "fur"
+TRAIT_VALUE = "gold"
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--gas-report", action="store", default="gas-report.json", help="path of the json gas report written by the benchmarks"
+    )
+
+
+def calldata_gas(calldata: bytes) -> int:
+    return sum(4 if b == 0 else 16 for b in calldata)
+
+
+class GasReport:
+    def __init__(self):
+        self.results = []
+
+    def add(self, operation: str, scenario: dict, calldata: bytes, execution_gas: int):
+        self.results.append(
+            {
+                "operation": operation,
+                "scenario": scenario,
+                "calldata_bytes": len(calldata),
+                "calldata_gas": calldata_gas(calldata),
+                "execution_gas": execution_gas,
+                "total_gas": TX_BASE_GAS + calldata_gas(calldata) + execution_gas,
+            }
+        )
+
+    def measure(self, operation: str, scenario: dict, fn, *args, sender: str):
+        calldata = fn.prepare_calldata(*args)
+        gas_before = boa.env.get_gas_used()
+        result = fn(*args, sender=sender)
+        self.add(operation, scenario, calldata, boa.env.get_gas_used() - gas_before)
+        return result
+
+    def to_json(self) -> dict:
+        return {
+            "compiler": vyper.__version__,
+            "notes": "execution_gas excludes intrinsic costs and storage refunds; total_gas adds the base and calldata costs",
+            "results": sorted(self.results, key=lambda r: (r["operation"], json.dumps(r["scenario"], sort_keys=True))),
+        }
+
+
+@pytest.fixture(scope="session")
+def gas_report(request):
+    report = GasReport()
+    yield report
+    path = request.config.getoption("--gas-report", default="gas-report.json")
+    Path(path).write_text(json.dumps(report.to_json(), indent=2) + "\n", encoding="utf-8")
+
+
+@pytest.fixture
+def packed_proxy(packed_loan_proxy_contract_def, p2p_nfts_usdc, owner):
+    proxy = packed_loan_proxy_contract_def.deploy(p2p_nfts_usdc.address)
+    p2p_nfts_usdc.set_proxy_authorization(proxy.address, True, sender=owner)
+    return proxy
+
+
+@pytest.fixture
+def bench(
+    owner,
+    borrower,
+    lender,
+    lender2,
+    owner_account,
+    borrower_account,
+    lender_account,
+    lender2_account,
+    usdc,
+    bayc,
+    cryptopunks,
+    p2p_control,
+    p2p_nfts_usdc,
+    packed_proxy,
+    bayc_key_hash,
+    punks_key_hash,
+):
+    accounts = [owner_account, borrower_account, lender_account, lender2_account]
+    return Benchmark(
+        accounts, usdc, bayc, cryptopunks, p2p_control, p2p_nfts_usdc, packed_proxy, bayc_key_hash, punks_key_hash
+    )
+
+
+class Benchmark:
+    """The contracts of the unit tests, as deployed by their fixtures, with the accounts funded for the benchmarks."""
+
+    def __init__(self, accounts, usdc, bayc, cryptopunks, p2p_control, p2p_nfts, packed_proxy, bayc_key_hash, punks_key_hash):
+        self.owner, self.borrower, self.lender, self.lender2 = accounts
+        self.broker = boa.env.generate_address("broker")
+        self.borrower_broker = boa.env.generate_address("borrower_broker")
+        self.usdc = usdc
+        self.bayc = bayc
+        self.cryptopunks = cryptopunks
+        self.p2p_control = p2p_control
+        self.p2p_nfts = p2p_nfts
+        self.packed_proxy = packed_proxy
+        self.bayc_key_hash = bayc_key_hash
+        self.punks_key_hash = punks_key_hash
+
+        for account in [self.borrower, self.lender, self.lender2]:
+            self.usdc.mint(account.address, 10**15)
+            self.usdc.approve(self.p2p_nfts.address, MAX_UINT256, sender=account.address)
+        self.bayc.setApprovalForAll(self.p2p_nfts.address, True, sender=self.borrower.address)
+        self.next_token_id = 1
+
+    def set_protocol_fees(self, fees: int):
+        if fees > 0:
+            self.p2p_nfts.set_protocol_fee(100, 500)
+
+    def mint_collateral(self, collateral: str) -> tuple[str, int]:
+        token_id = self.next_token_id
+        self.next_token_id += 1
+        if collateral == "punks":
+            self.cryptopunks.mint(self.borrower.address, token_id)
+            self.cryptopunks.offerPunkForSaleToAddress(token_id, 0, self.p2p_nfts.address, sender=self.borrower.address)
+            return self.cryptopunks.address, token_id
+        self.bayc.mint(self.borrower.address, token_id)
+        return self.bayc.address, token_id
+
+    def trait_proof(
+        self, collateral: str, collateral_contract: str, token_id: int, depth: int, version: TraitRootVersion
+    ) -> list[bytes]:
+        node = TokenTraitTree.token_node(collateral_contract, TRAIT_NAME, TRAIT_VALUE, token_id)
+        proof = [keccak(f"sibling-{token_id}-{level}".encode()) for level in range(depth)]
+        merge = merge_function(version)
+        for sibling in proof:
+            node = merge(node, sibling)
+        self.p2p_control.change_collections_trait_roots([TraitRoot(self.key_hash(collateral), node, version)])
+        return proof
+
+    def key_hash(self, collateral: str) -> bytes:
+        return self.punks_key_hash if collateral == "punks" else self.bayc_key_hash
+
+    def offer(
+        self,
+        *,
+        collateral: str = "erc721",
+        offer_type: str = "token",
+        token_id: int = 0,
+        fees: int = 0,
+        pro_rata: bool = False,
+        lender=None,
+        duration: int = 100,
+        size: int = 1,
+        tracing_id: bytes = b"offer",
+    ):
+        lender = lender or self.lender
+        offer = Offer(
+            principal=10**9,
+            interest=10**8,
+            payment_token=self.usdc.address,
+            duration=duration,
+            origination_fee_amount=10**6 if fees > 1 else 0,
+            broker_upfront_fee_amount=10**6 if fees > 2 else 0,
+            broker_settlement_fee_bps=200 if fees > 2 else 0,
+            broker_address=self.broker if fees > 2 else ZERO_ADDRESS,
+            offer_type=OfferType[offer_type.upper()],
+            token_id=token_id if offer_type == "token" else 0,
+            collection_key_hash=self.key_hash(collateral),
+            trait_hash=TokenTraitTree.trait_hash(TRAIT_NAME, TRAIT_VALUE) if offer_type == "trait" else b"\0" * 32,
+            expiration=boa.eval("block.timestamp") + 1000,
+            lender=lender.address,
+            pro_rata=pro_rata,
+            size=size,
+            tracing_id=tracing_id.zfill(32),
+        )
+        return sign_offer(offer, lender.key, self.p2p_nfts.address)
+
+    def borrower_broker_args(self, fees: int) -> tuple[int, int, str]:
+        return (10**6, 300, self.borrower_broker) if fees > 3 else (0, 0, ZERO_ADDRESS)
+
+    def create_loan_args(
+        self,
+        *,
+        collateral: str = "erc721",
+        offer_type: str = "token",
+        fees: int = 0,
+        pro_rata: bool = False,
+        proof_depth: int = 0,
+        trait_root_version: TraitRootVersion = TraitRootVersion.XOR_MERGE,
+        tracing_id: bytes = b"offer",
+    ) -> tuple:
+        self.set_protocol_fees(fees)
+        collateral_contract, token_id = self.mint_collateral(collateral)
+        proof = []
+        if offer_type == "trait":
+            proof = self.trait_proof(collateral, collateral_contract, token_id, proof_depth, trait_root_version)
+        signed_offer = self.offer(
+            collateral=collateral,
+            offer_type=offer_type,
+            token_id=token_id,
+            fees=fees,
+            pro_rata=pro_rata,
+            tracing_id=tracing_id,
+        )
+        return (signed_offer, token_id, proof, self.borrower.address, *self.borrower_broker_args(fees))
+
+    def create_trait_loans_args(
+        self,
+        batch_size: int,
+        *,
+        multiproof: bool,
+        version: TraitRootVersion = TraitRootVersion.XOR_MERGE,
+        tree_size: int = 1024,
+    ) -> tuple:
+        token_ids = [self.mint_collateral("erc721")[1] for _ in range(batch_size)]
+        filler_ids = range(10**9, 10**9 + tree_size - batch_size)
+        tree = TokenTraitTree(
+            [(self.bayc.address, TRAIT_NAME, TRAIT_VALUE, token_id) for token_id in [*token_ids, *filler_ids]], version
+        )
+        self.p2p_control.change_collections_trait_roots([tree.trait_root(self.bayc_key_hash)])
+        signed_offer = self.offer(offer_type="trait", size=batch_size)
+        nodes = {
+            TokenTraitTree.token_node(self.bayc.address, TRAIT_NAME, TRAIT_VALUE, token_id): token_id for token_id in token_ids
+        }
+
+        if not multiproof:
+            return [CreateLoanRequest(signed_offer, token_id, tree.proof(node)) for node, token_id in nodes.items()], [], 0
+        leaves, proof, flags = tree.multiproof(nodes)
+        return [CreateLoanRequest(signed_offer, nodes[leaf]) for leaf in leaves], proof, flags
+
+    def create_loan(self, **kwargs) -> Loan:
+        self.p2p_nfts.create_loan(*self.create_loan_args(**kwargs), sender=self.borrower.address)
+        return self.last_loan()
+
+    def last_loan(self) -> Loan:
+        event = get_last_event(self.p2p_nfts, "LoanCreated")
+        return Loan(
+            id=event.id,
+            offer_id=event.offer_id,
+            offer_tracing_id=event.offer_tracing_id,
+            amount=event.amount,
+            interest=event.interest,
+            payment_token=event.payment_token,
+            maturity=event.maturity,
+            start_time=event.start_time,
+            borrower=event.borrower,
+            lender=event.lender,
+            collateral_contract=event.collateral_contract,
+            collateral_token_id=event.collateral_token_id,
+            fees=[Fee(*fee) for fee in event.fees],
+            pro_rata=event.pro_rata,
+            delegate=event.delegate,
+        )
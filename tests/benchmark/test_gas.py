@@ -0,0 +1,148 @@
+import boa
+import pytest
+
+from ..conftest_base import CreateLoanRequest, TraitRootVersion, pack_loan
+
+COLLATERALS = ["erc721", "punks"]
+FEES = [0, 1, 2, 3, 4]
+PROOF_DEPTHS = [1, 2, 4, 8, 12, 16, 20]
+BATCH_SIZES = [1, 4, 8, 16]
+
+
+@pytest.mark.parametrize("collateral", COLLATERALS)
+@pytest.mark.parametrize("offer_type", ["token", "collection"])
+@pytest.mark.parametrize("fees", FEES)
+def test_create_loan(bench, gas_report, collateral, offer_type, fees):
+    args = bench.create_loan_args(collateral=collateral, offer_type=offer_type, fees=fees)
+    scenario = {"collateral": collateral, "offer_type": offer_type, "fees": fees}
+
+    gas_report.measure("create_loan", scenario, bench.p2p_nfts.create_loan, *args, sender=bench.borrower.address)
+
+
+@pytest.mark.parametrize("collateral", COLLATERALS)
+@pytest.mark.parametrize("proof_depth", PROOF_DEPTHS)
+@pytest.mark.parametrize("version", list(TraitRootVersion))
+def test_create_loan_trait(bench, gas_report, collateral, proof_depth, version):
+    args = bench.create_loan_args(
+        collateral=collateral, offer_type="trait", proof_depth=proof_depth, trait_root_version=version
+    )
+    scenario = {
+        "collateral": collateral,
+        "offer_type": "trait",
+        "fees": 0,
+        "proof_depth": proof_depth,
+        "trait_root_version": int(version),
+    }
+
+    gas_report.measure("create_loan", scenario, bench.p2p_nfts.create_loan, *args, sender=bench.borrower.address)
+
+
+@pytest.mark.parametrize("batch_size", BATCH_SIZES)
+def test_create_loans(bench, gas_report, batch_size):
+    requests = [
+        CreateLoanRequest(*bench.create_loan_args(fees=4, tracing_id=f"offer-{i}".encode())) for i in range(batch_size)
+    ]
+    scenario = {"collateral": "erc721", "offer_type": "token", "fees": 4, "batch_size": batch_size}
+
+    gas_report.measure("create_loans", scenario, bench.p2p_nfts.create_loans, requests, [], 0, sender=bench.borrower.address)
+
+
+@pytest.mark.parametrize("batch_size", BATCH_SIZES)
+@pytest.mark.parametrize("multiproof", [False, True])
+@pytest.mark.parametrize("version", list(TraitRootVersion))
+def test_create_loans_trait(bench, gas_report, batch_size, multiproof, version):
+    requests, proof, flags = bench.create_trait_loans_args(batch_size, multiproof=multiproof, version=version)
+    scenario = {
+        "collateral": "erc721",
+        "offer_type": "trait",
+        "fees": 0,
+        "batch_size": batch_size,
+        "multiproof": multiproof,
+        "trait_root_version": int(version),
+    }
+
+    gas_report.measure(
+        "create_loans", scenario, bench.p2p_nfts.create_loans, requests, proof, flags, sender=bench.borrower.address
+    )
+
+
+@pytest.mark.parametrize("collateral", COLLATERALS)
+@pytest.mark.parametrize("pro_rata", [False, True])
+@pytest.mark.parametrize("fees", FEES)
+def test_settle_loan(bench, gas_report, collateral, pro_rata, fees):
+    loan = bench.create_loan(collateral=collateral, fees=fees, pro_rata=pro_rata)
+    boa.env.time_travel(seconds=50)
+    scenario = {"collateral": collateral, "pro_rata": pro_rata, "fees": fees}
+
+    gas_report.measure("settle_loan", scenario, bench.p2p_nfts.settle_loan, loan, sender=bench.borrower.address)
+
+
+@pytest.mark.parametrize("fees", FEES)
+def test_settle_loan_packed(bench, gas_report, fees):
+    loan = bench.create_loan(fees=fees)
+    scenario = {"collateral": "erc721", "pro_rata": False, "fees": fees, "packed": True}
+
+    gas_report.measure("settle_loan", scenario, bench.packed_proxy.settle_loan, pack_loan(loan), sender=bench.borrower.address)
+
+
+@pytest.mark.parametrize("batch_size", BATCH_SIZES)
+def test_settle_loans(bench, gas_report, batch_size):
+    loans = [bench.create_loan(fees=4, tracing_id=f"offer-{i}".encode()) for i in range(batch_size)]
+    scenario = {"collateral": "erc721", "pro_rata": False, "fees": 4, "batch_size": batch_size}
+
+    gas_report.measure("settle_loans", scenario, bench.p2p_nfts.settle_loans, loans, sender=bench.borrower.address)
+
+
+@pytest.mark.parametrize("collateral", COLLATERALS)
+@pytest.mark.parametrize("fees", FEES)
+def test_replace_loan(bench, gas_report, collateral, fees):
+    loan = bench.create_loan(collateral=collateral, fees=fees)
+    offer = bench.offer(
+        collateral=collateral, token_id=loan.collateral_token_id, fees=fees, lender=bench.lender2, tracing_id=b"replace"
+    )
+    args = (loan, offer, [], *bench.borrower_broker_args(fees))
+    scenario = {"collateral": collateral, "fees": fees}
+
+    gas_report.measure("replace_loan", scenario, bench.p2p_nfts.replace_loan, *args, sender=bench.borrower.address)
+
+
+@pytest.mark.parametrize("collateral", COLLATERALS)
+@pytest.mark.parametrize("fees", FEES)
+def test_replace_loan_lender(bench, gas_report, collateral, fees):
+    loan = bench.create_loan(collateral=collateral, fees=fees)
+    offer = bench.offer(
+        collateral=collateral,
+        token_id=loan.collateral_token_id,
+        fees=fees,
+        lender=bench.lender2,
+        duration=200,
+        tracing_id=b"replace",
+    )
+    scenario = {"collateral": collateral, "fees": fees}
+
+    gas_report.measure(
+        "replace_loan_lender", scenario, bench.p2p_nfts.replace_loan_lender, loan, offer, [], sender=loan.lender
+    )
+
+
+@pytest.mark.parametrize("collateral", COLLATERALS)
+def test_claim_defaulted_loan_collateral(bench, gas_report, collateral):
+    loan = bench.create_loan(collateral=collateral)
+    boa.env.time_travel(seconds=loan.maturity - loan.start_time + 1)
+    scenario = {"collateral": collateral}
+
+    gas_report.measure(
+        "claim_defaulted_loan_collateral",
+        scenario,
+        bench.p2p_nfts.claim_defaulted_loan_collateral,
+        loan,
+        sender=loan.lender,
+    )
+
+
+@pytest.mark.parametrize("offer_type", ["token", "collection", "trait"])
+def test_revoke_offer(bench, gas_report, offer_type):
+    offer = bench.offer(offer_type=offer_type, token_id=1)
+    scenario = {"offer_type": offer_type}
+
+    gas_report.measure("revoke_offer", scenario, bench.p2p_nfts.revoke_offer, offer, sender=bench.lender.address)
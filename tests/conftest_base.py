@@ -3,7 +3,6 @@ from collections import namedtuple
 from dataclasses import field
 from enum import IntEnum
 from functools import cached_property
-from hashlib import sha3_256
 from itertools import starmap
 from textwrap import dedent
 from typing import NamedTuple
@@ -14,12 +13,12 @@ import vyper
 from boa.contracts.event_decoder import RawLogEntry
 from boa.contracts.vyper.vyper_contract import VyperContract
 from eth.exceptions import Revert
-from eth_abi import encode
 from eth_account import Account
 from eth_account.messages import encode_typed_data
-from eth_utils import keccak
 from web3 import Web3
 
+from scripts._helpers import trait_tree
+
 ZERO_ADDRESS = boa.eval("empty(address)")
 ZERO_BYTES32 = boa.eval("empty(bytes32)")
 
@@ -96,6 +95,7 @@ class Offer(NamedTuple):
     pro_rata: bool = False
     size: int = 1
     tracing_id: bytes = ZERO_BYTES32
+    nonce: int = 0
 
 
 Signature = namedtuple("Signature", ["v", "r", "s"], defaults=[0, ZERO_BYTES32, ZERO_BYTES32])
@@ -204,6 +204,32 @@ PunkOffer = namedtuple(
 CollectionContract = namedtuple("CollectionContract", ["collection", "contract"], defaults=[ZERO_BYTES32, ZERO_ADDRESS])
 
 
+class TraitRootVersion(IntEnum):
+    XOR_MERGE = 0
+    SORTED_PAIR = 1
+
+
+TraitRoot = namedtuple(
+    "TraitRoot",
+    ["collection_key_hash", "root_hash", "version"],
+    defaults=[ZERO_BYTES32, ZERO_BYTES32, TraitRootVersion.XOR_MERGE],
+)
+
+CreateLoanRequest = namedtuple(
+    "CreateLoanRequest",
+    [
+        "offer",
+        "collateral_token_id",
+        "collateral_proof",
+        "delegate",
+        "borrower_broker_upfront_fee_amount",
+        "borrower_broker_settlement_fee_bps",
+        "borrower_broker",
+    ],
+    defaults=[[], ZERO_ADDRESS, 0, 0, ZERO_ADDRESS],
+)
+
+
 def compute_loan_hash(loan: Loan):
     print(f"compute_loan_hash {loan=}")
     encoded = eth_abi.encode(
@@ -215,6 +241,39 @@ def compute_loan_hash(loan: Loan):
     return boa.eval(f"""keccak256({encoded})""")
 
 
+def pack_loan(loan: Loan) -> bytes:
+    fee_mask = 0
+    packed_fees = b""
+    for i, fee in enumerate(loan.fees):
+        assert fee.type == 1 << i, "fees must have one entry per type, ordered by type"
+        if fee.upfront_amount or fee.settlement_bps or fee.wallet != ZERO_ADDRESS:
+            fee_mask |= 1 << i
+            packed_fees += (
+                fee.upfront_amount.to_bytes(16, "big")
+                + fee.settlement_bps.to_bytes(2, "big")
+                + Web3.to_bytes(hexstr=str(fee.wallet))
+            )
+
+    has_delegate = loan.delegate != ZERO_ADDRESS
+    flags = int(loan.pro_rata) | int(has_delegate) << 1 | fee_mask << 4
+    return (
+        loan.id
+        + loan.offer_id
+        + loan.offer_tracing_id
+        + loan.amount.to_bytes(16, "big")
+        + loan.interest.to_bytes(16, "big")
+        + loan.maturity.to_bytes(8, "big")
+        + loan.start_time.to_bytes(8, "big")
+        + Web3.to_bytes(hexstr=str(loan.borrower))
+        + Web3.to_bytes(hexstr=str(loan.lender))
+        + Web3.to_bytes(hexstr=str(loan.collateral_contract))
+        + loan.collateral_token_id.to_bytes(32, "big")
+        + flags.to_bytes(1, "big")
+        + (Web3.to_bytes(hexstr=str(loan.delegate)) if has_delegate else b"")
+        + packed_fees
+    )
+
+
 def compute_signed_offer_id(offer: SignedOffer):
     return boa.eval(
         dedent(
@@ -257,6 +316,7 @@ def sign_offer(offer: Offer, lender_key: str, verifying_contract: str) -> Signed
                 {"name": "pro_rata", "type": "bool"},
                 {"name": "size", "type": "uint256"},
                 {"name": "tracing_id", "type": "bytes32"},
+                {"name": "nonce", "type": "uint256"},
             ],
         },
         "primaryType": "Offer",
@@ -320,39 +380,30 @@ def get_loan_mutations(loan):
 
 
 class TokenTraitTree:
-    def __init__(self, token_with_traits: list[tuple[str, str, str, int]]):
+    # in memory version of scripts/_helpers/trait_tree.TraitTree, sharing its hashing and proofs
+    trait_hash = staticmethod(trait_tree.trait_hash)
+    token_node = staticmethod(trait_tree.token_node)
+
+    def __init__(self, token_with_traits: list[tuple[str, str, str, int]], version=TraitRootVersion.XOR_MERGE):
+        self.version = version
+        self.merge = trait_tree.merge_function(version)
         self.token_nodes = sorted(set(starmap(self.token_node, token_with_traits)))
         size = len(self.token_nodes)
         self.proofs = [ZERO_BYTES32] * size + self.token_nodes
         for i in range(size - 1, 0, -1):
-            self.proofs[i] = self._merge(self.proofs[i * 2], self.proofs[i * 2 + 1])
+            self.proofs[i] = self.merge(self.proofs[i * 2], self.proofs[i * 2 + 1])
         self.token_index = dict(zip(self.token_nodes, [size + i for i in range(size)]))
 
     def root(self):
         return self.proofs[1]
 
+    def trait_root(self, collection_key_hash):
+        return TraitRoot(collection_key_hash, self.root(), self.version)
+
     def proof(self, token_node):
         if token_node not in self.token_index:
             return []
-        index = self.token_index[token_node]
-        proof_list = []
-        while index > 1:
-            proof_list.append(self.proofs[index ^ 1])
-            index //= 2
-        return proof_list
-
-    @staticmethod
-    def _merge(b1, b2):
-        h1 = keccak(b1)
-        h2 = keccak(b2)
-        return keccak(bytes(h1[i] ^ h2[i] for i in range(32)))
-
-    @staticmethod
-    def trait_hash(trait_name, trait_value):
-        return sha3_256(sha3_256(trait_name.encode()).digest() + sha3_256(trait_value.encode()).digest()).digest()
-
-    @staticmethod
-    def token_node(contract, trait_name, trait_value, token_id):
-        return keccak(
-            encode(["address", "bytes32", "uint256"], [contract, TokenTraitTree.trait_hash(trait_name, trait_value), token_id])
-        )
+        return trait_tree.tree_proof(self.proofs.__getitem__, self.token_index[token_node])
+
+    def multiproof(self, token_nodes):
+        return trait_tree.tree_multiproof(self.proofs.__getitem__, (self.token_index[node] for node in token_nodes))
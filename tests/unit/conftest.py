@@ -30,6 +30,19 @@ def boa_env():
     return boa
 
 
+@pytest.fixture(autouse=True)
+def isolated_storage_traces():
+    # boa rolls the state back after each test but keeps the storage and sha3 traces it decodes the storage of reverting
+    # contracts from. As addresses are reused between tests, nested mappings written by a test, e.g. ERC721 operator
+    # approvals, would otherwise be decoded with the storage types of the contract deployed at the same address by a
+    # later test
+    sstore_trace = {address: set(slots) for address, slots in boa.env.sstore_trace.items()}
+    sha3_trace = dict(boa.env.sha3_trace)
+    yield
+    boa.env.sstore_trace = sstore_trace
+    boa.env.sha3_trace = sha3_trace
+
+
 @pytest.fixture(scope="session")
 def accounts(boa_env):
     _accounts = [boa.env.generate_address() for _ in range(10)]
@@ -153,6 +166,16 @@ def p2p_lending_nfts_proxy_contract_def(boa_env):
     return boa.load_partial("tests/stubs/P2PNftsProxy.vy")
 
 
+@pytest.fixture(scope="session")
+def packed_loan_proxy_contract_def(boa_env):
+    return boa.load_partial("contracts/PackedLoanProxy.vy")
+
+
+@pytest.fixture(scope="session")
+def p2p_lending_batch_contract_def(boa_env):
+    return boa.load_partial("contracts/P2PLendingBatch.vy")
+
+
 @pytest.fixture(scope="module")
 def empty_contract_def(boa_env):
     return boa.loads_partial(
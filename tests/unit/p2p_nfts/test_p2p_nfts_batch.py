@@ -0,0 +1,250 @@
+import boa
+import pytest
+
+from ...conftest_base import (
+    ZERO_ADDRESS,
+    ZERO_BYTES32,
+    Fee,
+    Loan,
+    Offer,
+    OfferType,
+    compute_loan_hash,
+    compute_signed_offer_id,
+    get_events,
+    sign_offer,
+)
+
+
+@pytest.fixture(autouse=True)
+def lender_funds(lender, usdc):
+    usdc.mint(lender, 10**12)
+
+
+@pytest.fixture(autouse=True)
+def borrower_funds(borrower, usdc):
+    usdc.mint(borrower, 10**12)
+
+
+@pytest.fixture
+def p2p_batch(p2p_nfts_usdc, p2p_lending_batch_contract_def, owner):
+    batch = p2p_lending_batch_contract_def.deploy(p2p_nfts_usdc.address)
+    p2p_nfts_usdc.set_proxy_authorization(batch.address, True, sender=owner)
+    return batch
+
+
+@pytest.fixture
+def token_offers(now, lender, lender_key, p2p_nfts_usdc, usdc, bayc_key_hash):
+    return [
+        sign_offer(
+            Offer(
+                principal=1000,
+                interest=100,
+                payment_token=usdc.address,
+                duration=100,
+                collection_key_hash=bayc_key_hash,
+                token_id=token_id,
+                expiration=now + 100,
+                lender=lender,
+                tracing_id=f"offer_{token_id}".encode().zfill(32),
+            ),
+            lender_key,
+            p2p_nfts_usdc.address,
+        )
+        for token_id in range(3)
+    ]
+
+
+@pytest.fixture
+def offer_bayc(now, lender, lender_key, p2p_nfts_usdc, usdc, bayc_key_hash):
+    offer = Offer(
+        principal=1000,
+        interest=100,
+        payment_token=usdc.address,
+        duration=100,
+        offer_type=OfferType.COLLECTION,
+        collection_key_hash=bayc_key_hash,
+        expiration=now + 100,
+        lender=lender,
+        size=3,
+        tracing_id=b"offer_bayc".zfill(32),
+    )
+    return sign_offer(offer, lender_key, p2p_nfts_usdc.address)
+
+
+@pytest.fixture
+def ongoing_loans(p2p_nfts_usdc, offer_bayc, usdc, borrower, lender, bayc, now):
+    offer = offer_bayc.offer
+    loans = []
+    for token_id in range(2):
+        bayc.mint(borrower, token_id)
+        bayc.approve(p2p_nfts_usdc.address, token_id, sender=borrower)
+        usdc.approve(p2p_nfts_usdc.address, offer.principal, sender=lender)
+
+        loan_id = p2p_nfts_usdc.create_loan(offer_bayc, token_id, [], borrower, 0, 0, ZERO_ADDRESS, sender=borrower)
+
+        loan = Loan(
+            id=loan_id,
+            offer_id=compute_signed_offer_id(offer_bayc),
+            offer_tracing_id=offer.tracing_id,
+            amount=offer.principal,
+            interest=offer.interest,
+            payment_token=offer.payment_token,
+            maturity=now + offer.duration,
+            start_time=now,
+            borrower=borrower,
+            lender=lender,
+            collateral_contract=bayc.address,
+            collateral_token_id=token_id,
+            fees=[
+                Fee.protocol(p2p_nfts_usdc, offer.principal),
+                Fee.origination(offer),
+                Fee.lender_broker(offer),
+                Fee.borrower_broker(ZERO_ADDRESS),
+            ],
+            pro_rata=offer.pro_rata,
+            delegate=borrower,
+        )
+        assert compute_loan_hash(loan) == p2p_nfts_usdc.loans(loan_id)
+        loans.append(loan)
+    return loans
+
+
+def test_initial_state(p2p_batch, p2p_nfts_usdc):
+    assert p2p_batch.p2p_lending_nfts() == p2p_nfts_usdc.address
+
+
+def test_loan_hashes(p2p_batch, ongoing_loans):
+    loan_ids = [loan.id for loan in ongoing_loans]
+
+    assert p2p_batch.loan_hashes(loan_ids) == [compute_loan_hash(loan) for loan in ongoing_loans]
+    assert p2p_batch.loan_hashes(loan_ids[::-1]) == [compute_loan_hash(loan) for loan in ongoing_loans[::-1]]
+
+
+def test_loan_hashes_empty(p2p_batch):
+    assert p2p_batch.loan_hashes([]) == []
+
+
+def test_loan_hashes_unknown_loans(p2p_batch, ongoing_loans):
+    unknown_id = boa.env.generate_address().canonical_address.rjust(32, b"\0")
+
+    assert p2p_batch.loan_hashes([unknown_id, ongoing_loans[0].id]) == [ZERO_BYTES32, compute_loan_hash(ongoing_loans[0])]
+
+
+def test_loan_hashes_settled_loan(p2p_batch, p2p_nfts_usdc, ongoing_loans, usdc):
+    loan = ongoing_loans[0]
+    usdc.approve(p2p_nfts_usdc.address, loan.amount + loan.interest, sender=loan.borrower)
+    p2p_nfts_usdc.settle_loan(loan, sender=loan.borrower)
+
+    assert p2p_batch.loan_hashes([loan.id for loan in ongoing_loans]) == [ZERO_BYTES32, compute_loan_hash(ongoing_loans[1])]
+
+
+def test_loan_hashes_max_batch(p2p_batch, ongoing_loans):
+    hashes = [compute_loan_hash(loan) for loan in ongoing_loans]
+    loan_ids = [ongoing_loans[i % 2].id for i in range(1024)]
+
+    assert p2p_batch.loan_hashes(loan_ids) == [hashes[i % 2] for i in range(1024)]
+
+
+def test_offer_states(p2p_batch, p2p_nfts_usdc, offer_bayc, ongoing_loans, lender, lender_key):
+    offer = offer_bayc.offer
+    offer_id = compute_signed_offer_id(offer_bayc)
+    other_offer = sign_offer(offer._replace(size=5, tracing_id=b"other".zfill(32)), lender_key, p2p_nfts_usdc.address)
+    other_offer_id = compute_signed_offer_id(other_offer)
+    requests = [
+        (offer_id, offer.tracing_id, offer.size, lender, 0),
+        (other_offer_id, b"other".zfill(32), 5, lender, 0),
+    ]
+
+    assert p2p_batch.offer_states(requests) == [(False, 1), (False, 5)]
+
+    p2p_nfts_usdc.revoke_offer(other_offer, sender=lender)
+
+    assert p2p_batch.offer_states(requests[::-1]) == [(True, 5), (False, 1)]
+
+
+def test_offer_states_fully_utilized(p2p_batch, offer_bayc, ongoing_loans, lender):
+    offer = offer_bayc.offer
+    offer_id = compute_signed_offer_id(offer_bayc)
+    requests = [(offer_id, offer.tracing_id, 2, lender, 0), (offer_id, offer.tracing_id, 1, lender, 0)]
+
+    assert p2p_batch.offer_states(requests) == [(False, 0), (False, 0)]
+
+
+def test_offer_states_lender_nonce(p2p_batch, p2p_nfts_usdc, offer_bayc, lender, lender2):
+    offer = offer_bayc.offer
+    offer_id = compute_signed_offer_id(offer_bayc)
+    requests = [
+        (offer_id, offer.tracing_id, offer.size, lender, 0),
+        (offer_id, offer.tracing_id, offer.size, lender, 1),
+        (offer_id, offer.tracing_id, offer.size, lender2, 0),
+    ]
+
+    p2p_nfts_usdc.increment_lender_nonce(lender, sender=lender)
+
+    assert p2p_batch.offer_states(requests) == [(True, 3), (False, 3), (False, 3)]
+
+
+def test_offer_states_empty(p2p_batch):
+    assert p2p_batch.offer_states([]) == []
+
+
+def test_revoke_offers(p2p_batch, p2p_nfts_usdc, token_offers, lender):
+    p2p_batch.revoke_offers(token_offers[:2], sender=lender)
+
+    assert [p2p_nfts_usdc.revoked_offers(compute_signed_offer_id(offer)) for offer in token_offers] == [True, True, False]
+
+
+def test_revoke_offers_logs_events(p2p_batch, token_offers, lender, bayc_key_hash):
+    p2p_batch.revoke_offers(token_offers, sender=lender)
+
+    events = get_events(p2p_batch, "OfferRevoked")
+    assert [event.offer_id for event in events] == [compute_signed_offer_id(offer) for offer in token_offers]
+    for event in events:
+        assert event.lender == lender
+        assert event.collection_key_hash == bayc_key_hash
+        assert event.offer_type == OfferType.TOKEN
+
+
+def test_revoke_offers_empty(p2p_batch, lender):
+    p2p_batch.revoke_offers([], sender=lender)
+
+
+def test_revoke_offers_reverts_if_sender_is_not_lender(p2p_batch, token_offers, borrower):
+    with boa.reverts("not lender"):
+        p2p_batch.revoke_offers(token_offers, sender=borrower)
+
+
+def test_revoke_offers_reverts_if_proxy_not_authorized(p2p_batch, p2p_nfts_usdc, token_offers, lender, owner):
+    p2p_nfts_usdc.set_proxy_authorization(p2p_batch.address, False, sender=owner)
+
+    with boa.reverts("not lender"):
+        p2p_batch.revoke_offers(token_offers, sender=lender)
+
+
+def test_revoke_offers_reverts_if_not_called_by_eoa(p2p_batch, token_offers, lender):
+    relay = boa.loads(
+        """
+@external
+def relay(target: address, data: Bytes[16384]):
+    raw_call(target, data)
+"""
+    )
+
+    with boa.reverts("not EOA"):
+        relay.relay(p2p_batch.address, p2p_batch.revoke_offers.prepare_calldata(token_offers), sender=lender)
+
+
+def test_revoke_offers_reverts_if_offer_not_signed_by_lender(p2p_batch, p2p_nfts_usdc, token_offers, lender, borrower_key):
+    unsigned_offer = sign_offer(token_offers[2].offer, borrower_key, p2p_nfts_usdc.address)
+
+    with boa.reverts("offer not signed by lender"):
+        p2p_batch.revoke_offers([*token_offers[:2], unsigned_offer], sender=lender)
+
+
+def test_revoke_offers_reverts_if_any_offer_already_revoked(p2p_batch, p2p_nfts_usdc, token_offers, lender):
+    p2p_nfts_usdc.revoke_offer(token_offers[1], sender=lender)
+
+    with boa.reverts("offer already revoked"):
+        p2p_batch.revoke_offers(token_offers, sender=lender)
+
+    assert not p2p_nfts_usdc.revoked_offers(compute_signed_offer_id(token_offers[0]))
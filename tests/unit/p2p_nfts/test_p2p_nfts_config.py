@@ -4,7 +4,15 @@ from itertools import starmap
 import boa
 import pytest
 
-from ...conftest_base import ZERO_ADDRESS, CollectionContract, get_last_event
+from ...conftest_base import (
+    ZERO_ADDRESS,
+    ZERO_BYTES32,
+    CollectionContract,
+    TokenTraitTree,
+    TraitRoot,
+    TraitRootVersion,
+    get_last_event,
+)
 
 FOREVER = 2**256 - 1
 
@@ -273,13 +281,86 @@ def test_change_trait_roots(p2p_control, owner):
     collection_roots = {
         sha3_256(f"collection_{i}".encode()).digest(): sha3_256(f"root_{i}".encode()).digest() for i in range(128)
     }
-    p2p_control.change_collections_trait_roots(list(collection_roots.items()), sender=owner)
+    p2p_control.change_collections_trait_roots(list(starmap(TraitRoot, collection_roots.items())), sender=owner)
     for key, root in collection_roots.items():
         assert p2p_control.trait_roots(key) == root
 
     collection_roots = {
         sha3_256(f"collection_{i}".encode()).digest(): sha3_256(f"root_{i}".encode()).digest() for i in range(1)
     }
-    p2p_control.change_collections_trait_roots(list(collection_roots.items()), sender=owner)
+    p2p_control.change_collections_trait_roots(list(starmap(TraitRoot, collection_roots.items())), sender=owner)
     for key, root in collection_roots.items():
         assert p2p_control.trait_roots(key) == root
+
+
+def test_change_trait_roots_versions(p2p_control, owner, bayc, bayc_key_hash):
+    root = sha3_256(b"root").digest()
+    p2p_control.change_collections_contracts([CollectionContract(bayc_key_hash, bayc.address)], sender=owner)
+
+    p2p_control.change_collections_trait_roots([TraitRoot(bayc_key_hash, root, TraitRootVersion.SORTED_PAIR)], sender=owner)
+    assert p2p_control.trait_root_versions(bayc_key_hash) == TraitRootVersion.SORTED_PAIR
+    assert p2p_control.get_collection_status(bayc_key_hash) == (bayc.address, root, TraitRootVersion.SORTED_PAIR)
+
+    p2p_control.change_collections_trait_roots([TraitRoot(bayc_key_hash, root)], sender=owner)
+    assert p2p_control.trait_root_versions(bayc_key_hash) == TraitRootVersion.XOR_MERGE
+    assert p2p_control.get_collection_status(bayc_key_hash) == (bayc.address, root, TraitRootVersion.XOR_MERGE)
+
+
+def test_get_collection_statuses(p2p_control, owner, bayc, bayc_key_hash):
+    keys = [sha3_256(f"collection_{i}".encode()).digest() for i in range(127)] + [bayc_key_hash]
+    roots = [TraitRoot(key, sha3_256(key).digest(), i % 2) for i, key in enumerate(keys)]
+    p2p_control.change_collections_contracts([CollectionContract(bayc_key_hash, bayc.address)], sender=owner)
+    p2p_control.change_collections_trait_roots(roots, sender=owner)
+
+    statuses = p2p_control.get_collection_statuses(keys)
+
+    assert statuses == [p2p_control.get_collection_status(key) for key in keys]
+    assert statuses[-1] == (bayc.address, roots[-1].root_hash, roots[-1].version)
+
+
+def test_get_collection_statuses_of_unknown_collections(p2p_control):
+    keys = [sha3_256(b"unknown").digest(), sha3_256(b"unknown").digest()]
+
+    assert p2p_control.get_collection_statuses(keys) == [(ZERO_ADDRESS, ZERO_BYTES32, 0)] * 2
+    assert p2p_control.get_collection_statuses([]) == []
+
+
+def test_change_trait_roots_reverts_if_invalid_version(p2p_control, owner, bayc_key_hash):
+    with boa.reverts("invalid root version"):
+        p2p_control.change_collections_trait_roots([TraitRoot(bayc_key_hash, sha3_256(b"root").digest(), 2)], sender=owner)
+
+
+@pytest.fixture(params=list(TraitRootVersion))
+def trait_tree(p2p_control, owner, bayc, bayc_key_hash, request):
+    tree = TokenTraitTree([(bayc.address, "fur", "gold", token_id) for token_id in range(1, 41)], request.param)
+    p2p_control.change_collections_trait_roots([tree.trait_root(bayc_key_hash)], sender=owner)
+    return tree
+
+
+@pytest.mark.parametrize("token_ids", [[1], [1, 2], [5, 17, 18, 33], list(range(1, 33))])
+def test_is_trait_multiproof_valid(p2p_control, trait_tree, bayc, bayc_key_hash, token_ids):
+    nodes = [TokenTraitTree.token_node(bayc.address, "fur", "gold", token_id) for token_id in token_ids]
+    leaves, proof, flags = trait_tree.multiproof(nodes)
+
+    assert p2p_control.is_trait_multiproof_valid(bayc_key_hash, leaves, proof, flags)
+
+
+def test_is_trait_multiproof_valid_matches_single_proof(p2p_control, trait_tree, bayc, bayc_key_hash):
+    node = TokenTraitTree.token_node(bayc.address, "fur", "gold", 7)
+    _, proof, _ = trait_tree.multiproof([node])
+
+    assert proof == trait_tree.proof(node)
+
+
+def test_is_trait_multiproof_invalid(p2p_control, trait_tree, bayc, bayc_key_hash):
+    nodes = [TokenTraitTree.token_node(bayc.address, "fur", "gold", token_id) for token_id in [5, 17, 18, 33]]
+    leaves, proof, flags = trait_tree.multiproof(nodes)
+    other_leaf = TokenTraitTree.token_node(bayc.address, "fur", "gold", 41)
+
+    assert not p2p_control.is_trait_multiproof_valid(bayc_key_hash, [], proof, flags)
+    assert not p2p_control.is_trait_multiproof_valid(bayc_key_hash, leaves[::-1], proof, flags)
+    assert not p2p_control.is_trait_multiproof_valid(bayc_key_hash, [other_leaf, *leaves[1:]], proof, flags)
+    assert not p2p_control.is_trait_multiproof_valid(bayc_key_hash, leaves, [*proof, proof[0]], flags)
+    assert not p2p_control.is_trait_multiproof_valid(bayc_key_hash, leaves, proof, flags ^ 1)
+    assert not p2p_control.is_trait_multiproof_valid(bayc_key_hash, leaves, proof, 0)
+    assert not p2p_control.is_trait_multiproof_valid(sha3_256(b"other").digest(), leaves, proof, flags)
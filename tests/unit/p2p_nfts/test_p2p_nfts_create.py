@@ -2,18 +2,23 @@ from textwrap import dedent
 
 import boa
 import pytest
+from eth_utils import keccak
 
 from ...conftest_base import (
     ZERO_ADDRESS,
+    ZERO_BYTES32,
     CollateralStatus,
+    CreateLoanRequest,
     Fee,
     Loan,
     Offer,
     OfferType,
     SignedOffer,
     TokenTraitTree,
+    TraitRootVersion,
     compute_loan_hash,
     compute_signed_offer_id,
+    get_events,
     get_last_event,
     replace_namedtuple_field,
     sign_offer,
@@ -278,6 +283,55 @@ def test_create_loan_reverts_if_offer_is_revoked(p2p_nfts_usdc, borrower, now, l
         p2p_nfts_usdc.create_loan(signed_offer, token_id, [], ZERO_ADDRESS, 0, 0, ZERO_ADDRESS, sender=borrower)
 
 
+@pytest.mark.parametrize("nonce", [0, 2])
+def test_create_loan_reverts_if_offer_nonce_is_not_lender_nonce(
+    p2p_nfts_usdc, borrower, now, lender, lender_key, bayc, bayc_key_hash, usdc, nonce
+):
+    token_id = 1
+    offer = Offer(
+        principal=1000,
+        interest=100,
+        payment_token=usdc.address,
+        duration=100,
+        collection_key_hash=bayc_key_hash,
+        token_id=token_id,
+        expiration=now + 100,
+        lender=lender,
+        nonce=nonce,
+    )
+    signed_offer = sign_offer(offer, lender_key, p2p_nfts_usdc.address)
+    bayc.mint(borrower, token_id)
+
+    p2p_nfts_usdc.increment_lender_nonce(lender, sender=lender)
+
+    with boa.reverts("offer revoked"):
+        p2p_nfts_usdc.create_loan(signed_offer, token_id, [], ZERO_ADDRESS, 0, 0, ZERO_ADDRESS, sender=borrower)
+
+
+def test_create_loan_with_lender_nonce(p2p_nfts_usdc, borrower, now, lender, lender_key, bayc, bayc_key_hash, usdc):
+    token_id = 1
+    p2p_nfts_usdc.increment_lender_nonce(lender, sender=lender)
+    offer = Offer(
+        principal=1000,
+        interest=100,
+        payment_token=usdc.address,
+        duration=100,
+        collection_key_hash=bayc_key_hash,
+        token_id=token_id,
+        expiration=now + 100,
+        lender=lender,
+        nonce=1,
+    )
+    signed_offer = sign_offer(offer, lender_key, p2p_nfts_usdc.address)
+
+    bayc.mint(borrower, token_id)
+    bayc.approve(p2p_nfts_usdc.address, token_id, sender=borrower)
+    usdc.approve(p2p_nfts_usdc.address, offer.principal, sender=lender)
+    loan_id = p2p_nfts_usdc.create_loan(signed_offer, token_id, [], ZERO_ADDRESS, 0, 0, ZERO_ADDRESS, sender=borrower)
+
+    assert p2p_nfts_usdc.loans(loan_id) != ZERO_BYTES32
+
+
 def test_create_loan_reverts_if_offer_exceeds_count(
     p2p_nfts_usdc, borrower, now, lender, lender_key, bayc, bayc_key_hash, usdc
 ):
@@ -477,8 +531,9 @@ def test_create_loan_reverts_if_lender_funds_not_approved(
         p2p_nfts_usdc.create_loan(signed_offer, token_id, [], ZERO_ADDRESS, 0, 0, ZERO_ADDRESS, sender=borrower)
 
 
+@pytest.mark.parametrize("version", list(TraitRootVersion))
 def test_create_loan_reverts_if_token_not_in_trait(
-    p2p_nfts_usdc, p2p_control, borrower, now, lender, lender_key, bayc, usdc, traits, bayc_key_hash
+    p2p_nfts_usdc, p2p_control, borrower, now, lender, lender_key, bayc, usdc, traits, bayc_key_hash, version
 ):
     token_id = 1
     tree = TokenTraitTree(
@@ -487,7 +542,8 @@ def test_create_loan_reverts_if_token_not_in_trait(
             for i in range(10)
             for trait_name, trait_values in traits.items()
             for trait_value in trait_values
-        ]
+        ],
+        version,
     )
     trait_name, trait_value = next((k, v[0]) for k, v in traits.items())
     principal = 1000
@@ -510,7 +566,7 @@ def test_create_loan_reverts_if_token_not_in_trait(
     )
     signed_offer = sign_offer(offer, lender_key, p2p_nfts_usdc.address)
 
-    p2p_control.change_collections_trait_roots([(bayc_key_hash, tree.root())], sender=p2p_nfts_usdc.owner())
+    p2p_control.change_collections_trait_roots([tree.trait_root(bayc_key_hash)], sender=p2p_nfts_usdc.owner())
 
     bayc.mint(borrower, token_id)
     bayc.approve(p2p_nfts_usdc.address, token_id, sender=borrower)
@@ -628,8 +684,9 @@ def test_create_loan(p2p_nfts_usdc, borrower, now, lender, lender_key, bayc, bay
     assert compute_loan_hash(loan) == p2p_nfts_usdc.loans(loan_id)
 
 
+@pytest.mark.parametrize("version", list(TraitRootVersion))
 def test_create_loan_with_trait_offer(
-    p2p_nfts_usdc, p2p_control, borrower, now, lender, lender_key, bayc, usdc, traits, bayc_key_hash
+    p2p_nfts_usdc, p2p_control, borrower, now, lender, lender_key, bayc, usdc, traits, bayc_key_hash, version
 ):
     token_id = 1
     tree = TokenTraitTree(
@@ -638,7 +695,8 @@ def test_create_loan_with_trait_offer(
             for i in range(100)
             for trait_name, trait_values in traits.items()
             for trait_value in trait_values
-        ]
+        ],
+        version,
     )
     trait_name, trait_value = next((k, v[0]) for k, v in traits.items())
     principal = 1000
@@ -665,7 +723,7 @@ def test_create_loan_with_trait_offer(
     bayc.approve(p2p_nfts_usdc.address, token_id, sender=borrower)
     usdc.approve(p2p_nfts_usdc.address, principal, sender=lender)
 
-    p2p_control.change_collections_trait_roots([(bayc_key_hash, tree.root())], sender=p2p_nfts_usdc.owner())
+    p2p_control.change_collections_trait_roots([tree.trait_root(bayc_key_hash)], sender=p2p_nfts_usdc.owner())
     proof = tree.proof(TokenTraitTree.token_node(bayc.address, trait_name, trait_value, token_id))
 
     loan_id = p2p_nfts_usdc.create_loan(signed_offer, token_id, proof, ZERO_ADDRESS, 0, 0, ZERO_ADDRESS, sender=borrower)
@@ -970,3 +1028,301 @@ def test_create_loan_for_collection_offer_does_not_revoke_offer(
     p2p_nfts_usdc.create_loan(signed_offer, token_id, [], ZERO_ADDRESS, 0, 0, ZERO_ADDRESS, sender=borrower)
 
     assert not p2p_nfts_usdc.revoked_offers(offer_id)
+
+
+def test_create_loans(p2p_nfts_usdc, borrower, now, lender, lender_key, bayc, bayc_key_hash, usdc):
+    principal = 1000
+    token_ids = [1, 2, 3]
+    offer = Offer(
+        principal=principal,
+        interest=100,
+        payment_token=usdc.address,
+        duration=100,
+        origination_fee_amount=0,
+        broker_upfront_fee_amount=0,
+        broker_settlement_fee_bps=0,
+        broker_address=ZERO_ADDRESS,
+        collection_key_hash=bayc_key_hash,
+        offer_type=OfferType.COLLECTION,
+        expiration=now + 100,
+        lender=lender,
+        pro_rata=False,
+        size=len(token_ids),
+    )
+    signed_offer = sign_offer(offer, lender_key, p2p_nfts_usdc.address)
+
+    for token_id in token_ids:
+        bayc.mint(borrower, token_id)
+        bayc.approve(p2p_nfts_usdc.address, token_id, sender=borrower)
+    usdc.approve(p2p_nfts_usdc.address, principal * len(token_ids), sender=lender)
+
+    loan_ids = p2p_nfts_usdc.create_loans(
+        [CreateLoanRequest(signed_offer, token_id) for token_id in token_ids], [], 0, sender=borrower
+    )
+
+    assert len(loan_ids) == len(token_ids)
+    assert [e.id for e in get_events(p2p_nfts_usdc, "LoanCreated")] == loan_ids
+    for loan_id, token_id in zip(loan_ids, token_ids):
+        loan = Loan(
+            id=loan_id,
+            offer_id=compute_signed_offer_id(signed_offer),
+            amount=offer.principal,
+            interest=offer.interest,
+            payment_token=offer.payment_token,
+            maturity=now + offer.duration,
+            start_time=now,
+            borrower=borrower,
+            lender=lender,
+            collateral_contract=bayc.address,
+            collateral_token_id=token_id,
+            fees=[
+                Fee.protocol(p2p_nfts_usdc, principal),
+                Fee.origination(offer),
+                Fee.lender_broker(offer),
+                Fee.borrower_broker(ZERO_ADDRESS),
+            ],
+            pro_rata=offer.pro_rata,
+        )
+        assert compute_loan_hash(loan) == p2p_nfts_usdc.loans(loan_id)
+        assert bayc.ownerOf(token_id) == p2p_nfts_usdc.address
+
+    assert usdc.balanceOf(borrower) == principal * len(token_ids)
+
+
+def test_create_loans_multiple_collections(
+    p2p_nfts_usdc, borrower, now, lender, lender_key, bayc, bayc_key_hash, usdc, cryptopunks, punks_key_hash
+):
+    principal = 1000
+    offers = [
+        sign_offer(
+            Offer(
+                principal=principal,
+                interest=100,
+                payment_token=usdc.address,
+                duration=100,
+                collection_key_hash=key_hash,
+                token_id=token_id,
+                expiration=now + 100,
+                lender=lender,
+                pro_rata=False,
+                tracing_id=tracing_id.zfill(32),
+            ),
+            lender_key,
+            p2p_nfts_usdc.address,
+        )
+        for key_hash, token_id, tracing_id in [
+            (bayc_key_hash, 1, b"bayc1"),
+            (punks_key_hash, 1, b"punks1"),
+            (bayc_key_hash, 2, b"bayc2"),
+        ]
+    ]
+
+    bayc.mint(borrower, 1)
+    bayc.mint(borrower, 2)
+    bayc.setApprovalForAll(p2p_nfts_usdc.address, True, sender=borrower)
+    cryptopunks.mint(borrower, 1)
+    cryptopunks.offerPunkForSaleToAddress(1, 0, p2p_nfts_usdc.address, sender=borrower)
+    usdc.approve(p2p_nfts_usdc.address, principal * 3, sender=lender)
+
+    loan_ids = p2p_nfts_usdc.create_loans(
+        [CreateLoanRequest(offers[0], 1), CreateLoanRequest(offers[1], 1), CreateLoanRequest(offers[2], 2)],
+        [],
+        0,
+        sender=borrower,
+    )
+
+    events = get_events(p2p_nfts_usdc, "LoanCreated")
+    assert [e.id for e in events] == loan_ids
+    assert [e.collateral_contract for e in events] == [bayc.address, cryptopunks.address, bayc.address]
+    assert bayc.ownerOf(1) == p2p_nfts_usdc.address
+    assert bayc.ownerOf(2) == p2p_nfts_usdc.address
+    assert cryptopunks.punkIndexToAddress(1) == p2p_nfts_usdc.address
+
+
+def test_create_loans_reverts_if_any_request_invalid(
+    p2p_nfts_usdc, borrower, now, lender, lender_key, bayc, bayc_key_hash, usdc
+):
+    principal = 1000
+    offer = Offer(
+        principal=principal,
+        interest=100,
+        payment_token=usdc.address,
+        duration=100,
+        collection_key_hash=bayc_key_hash,
+        offer_type=OfferType.COLLECTION,
+        expiration=now + 100,
+        lender=lender,
+        pro_rata=False,
+        size=2,
+    )
+    signed_offer = sign_offer(offer, lender_key, p2p_nfts_usdc.address)
+    expired_offer = sign_offer(replace_namedtuple_field(offer, expiration=now), lender_key, p2p_nfts_usdc.address)
+
+    for token_id in [1, 2]:
+        bayc.mint(borrower, token_id)
+        bayc.approve(p2p_nfts_usdc.address, token_id, sender=borrower)
+    usdc.approve(p2p_nfts_usdc.address, principal * 2, sender=lender)
+
+    with boa.reverts("offer expired"):
+        p2p_nfts_usdc.create_loans(
+            [CreateLoanRequest(signed_offer, 1), CreateLoanRequest(expired_offer, 2)], [], 0, sender=borrower
+        )
+
+    assert bayc.ownerOf(1) == borrower
+    assert usdc.balanceOf(borrower) == 0
+
+
+@pytest.fixture(params=list(TraitRootVersion))
+def trait_offer_multiproof(
+    p2p_control, p2p_nfts_usdc, borrower, now, lender, lender_key, bayc, usdc, traits, bayc_key_hash, request
+):
+    trait_name, trait_value = next((k, v[0]) for k, v in traits.items())
+    tree = TokenTraitTree([(bayc.address, trait_name, trait_value, token_id) for token_id in range(1, 101)], request.param)
+    p2p_control.change_collections_trait_roots([tree.trait_root(bayc_key_hash)], sender=p2p_nfts_usdc.owner())
+
+    principal = 1000
+    offer = Offer(
+        principal=principal,
+        interest=100,
+        payment_token=usdc.address,
+        duration=100,
+        collection_key_hash=bayc_key_hash,
+        offer_type=OfferType.TRAIT,
+        trait_hash=TokenTraitTree.trait_hash(trait_name, trait_value),
+        expiration=now + 100,
+        lender=lender,
+        pro_rata=False,
+        size=20,
+    )
+    signed_offer = sign_offer(offer, lender_key, p2p_nfts_usdc.address)
+
+    token_ids = [3, 7, 8, 21, 42, 55, 56, 57, 70, 99, 100]
+    bayc.setApprovalForAll(p2p_nfts_usdc.address, True, sender=borrower)
+    for token_id in token_ids:
+        bayc.mint(borrower, token_id)
+    usdc.approve(p2p_nfts_usdc.address, principal * len(token_ids), sender=lender)
+
+    nodes = {TokenTraitTree.token_node(bayc.address, trait_name, trait_value, token_id): token_id for token_id in token_ids}
+    leaves, proof, flags = tree.multiproof(nodes)
+    return signed_offer, [nodes[leaf] for leaf in leaves], proof, flags, tree
+
+
+def test_create_loans_with_trait_multiproof(p2p_nfts_usdc, trait_offer_multiproof, borrower, bayc):
+    signed_offer, token_ids, proof, flags, _ = trait_offer_multiproof
+
+    loan_ids = p2p_nfts_usdc.create_loans(
+        [CreateLoanRequest(signed_offer, token_id) for token_id in token_ids], proof, flags, sender=borrower
+    )
+
+    assert len(loan_ids) == len(token_ids)
+    assert [e.collateral_token_id for e in get_events(p2p_nfts_usdc, "LoanCreated")] == token_ids
+    for token_id in token_ids:
+        assert bayc.ownerOf(token_id) == p2p_nfts_usdc.address
+
+
+def test_create_loans_trait_multiproof_shares_nodes(trait_offer_multiproof):
+    _, token_ids, proof, _, _ = trait_offer_multiproof
+    tree_depth = 7
+
+    assert len(proof) < len(token_ids) * tree_depth / 2
+
+
+def test_create_loans_with_trait_multiproof_and_single_proofs(p2p_nfts_usdc, trait_offer_multiproof, borrower, bayc, traits):
+    signed_offer, token_ids, _, _, tree = trait_offer_multiproof
+    trait_name, trait_value = next((k, v[0]) for k, v in traits.items())
+    single_token_id, *multiproof_token_ids = token_ids
+    nodes = {
+        TokenTraitTree.token_node(bayc.address, trait_name, trait_value, token_id): token_id
+        for token_id in multiproof_token_ids
+    }
+    leaves, proof, flags = tree.multiproof(nodes)
+    single_proof = tree.proof(TokenTraitTree.token_node(bayc.address, trait_name, trait_value, single_token_id))
+
+    loan_ids = p2p_nfts_usdc.create_loans(
+        [CreateLoanRequest(signed_offer, single_token_id, single_proof)]
+        + [CreateLoanRequest(signed_offer, nodes[leaf]) for leaf in leaves],
+        proof,
+        flags,
+        sender=borrower,
+    )
+
+    assert len(loan_ids) == len(token_ids)
+
+
+def test_create_loans_reverts_if_trait_multiproof_invalid(p2p_nfts_usdc, trait_offer_multiproof, borrower):
+    signed_offer, token_ids, proof, flags, _ = trait_offer_multiproof
+    requests = [CreateLoanRequest(signed_offer, token_id) for token_id in token_ids]
+
+    with boa.reverts("proof invalid"):
+        p2p_nfts_usdc.create_loans(requests, [proof[0], *proof], flags, sender=borrower)
+
+    with boa.reverts("proof invalid"):
+        p2p_nfts_usdc.create_loans(requests, [keccak(b"invalid"), *proof[1:]], flags, sender=borrower)
+
+    with boa.reverts("proof invalid"):
+        p2p_nfts_usdc.create_loans(requests[:-1], proof, flags, sender=borrower)
+
+    with boa.reverts():
+        p2p_nfts_usdc.create_loans(requests[::-1], proof, flags, sender=borrower)
+
+
+def test_create_loans_reverts_if_trait_multiproof_mixes_collections(
+    p2p_control,
+    p2p_nfts_usdc,
+    borrower,
+    now,
+    lender,
+    lender_key,
+    bayc,
+    cryptopunks,
+    usdc,
+    traits,
+    bayc_key_hash,
+    punks_key_hash,
+):
+    trait_name, trait_value = next((k, v[0]) for k, v in traits.items())
+    tree = TokenTraitTree([(contract.address, trait_name, trait_value, 1) for contract in [bayc, cryptopunks]])
+    p2p_control.change_collections_trait_roots(
+        [tree.trait_root(bayc_key_hash), tree.trait_root(punks_key_hash)], sender=p2p_nfts_usdc.owner()
+    )
+
+    principal = 1000
+    offers = {
+        contract.address: sign_offer(
+            Offer(
+                principal=principal,
+                interest=100,
+                payment_token=usdc.address,
+                duration=100,
+                collection_key_hash=key_hash,
+                offer_type=OfferType.TRAIT,
+                trait_hash=TokenTraitTree.trait_hash(trait_name, trait_value),
+                expiration=now + 100,
+                lender=lender,
+                pro_rata=False,
+                tracing_id=tracing_id.zfill(32),
+            ),
+            lender_key,
+            p2p_nfts_usdc.address,
+        )
+        for contract, key_hash, tracing_id in [(bayc, bayc_key_hash, b"bayc"), (cryptopunks, punks_key_hash, b"punks")]
+    }
+
+    bayc.mint(borrower, 1)
+    bayc.approve(p2p_nfts_usdc.address, 1, sender=borrower)
+    cryptopunks.mint(borrower, 1)
+    cryptopunks.offerPunkForSaleToAddress(1, 0, p2p_nfts_usdc.address, sender=borrower)
+    usdc.approve(p2p_nfts_usdc.address, principal * 2, sender=lender)
+
+    nodes = {
+        TokenTraitTree.token_node(contract.address, trait_name, trait_value, 1): contract.address
+        for contract in [bayc, cryptopunks]
+    }
+    leaves, proof, flags = tree.multiproof(nodes)
+    requests = [CreateLoanRequest(offers[nodes[leaf]], 1) for leaf in leaves]
+
+    with boa.reverts("multiproof collection mismatch"):
+        p2p_nfts_usdc.create_loans(requests, proof, flags, sender=borrower)
+
+    assert bayc.ownerOf(1) == borrower
+    assert cryptopunks.punkIndexToAddress(1) == borrower
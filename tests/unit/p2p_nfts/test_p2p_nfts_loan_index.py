@@ -0,0 +1,212 @@
+import boa
+import pytest
+from eth_utils import keccak, to_checksum_address
+
+from scripts._helpers.loan_index import LoanIndex, settle_loan_calldata
+
+from ...conftest_base import ZERO_ADDRESS, ZERO_BYTES32, Offer, compute_signed_offer_id, sign_offer
+
+
+class FakeChain:
+    # the w3 calls used by LoanIndex, over blocks holding the logs of the transactions mined in them
+    def __init__(self):
+        self.eth = self
+        self.blocks = []
+        self.mine()
+
+    @property
+    def block_number(self):
+        return len(self.blocks) - 1
+
+    def mine(self, computation=None, fork: bytes = b""):
+        number = len(self.blocks)
+        block_hash = keccak(number.to_bytes(32, "big") + fork)
+        entries = sorted(computation.get_raw_log_entries()) if computation is not None else []
+        logs = [
+            {
+                "address": to_checksum_address(address),
+                "topics": [topic.to_bytes(32, "big") for topic in topics],
+                "data": data,
+                "blockNumber": number,
+                "blockHash": block_hash,
+                "logIndex": log_index,
+            }
+            for log_index, (_, address, topics, data) in enumerate(entries)
+        ]
+        self.blocks.append((block_hash, logs))
+
+    def reorg(self, number: int):
+        # drops the blocks from number on, to be replaced by the ones mined in the fork
+        del self.blocks[number:]
+
+    def get_block(self, number):
+        return {"hash": self.blocks[number][0]}
+
+    def get_logs(self, log_filter):
+        topics = {bytes.fromhex(topic[2:]) for topic in log_filter["topics"][0]}
+        return [
+            log
+            for _, logs in self.blocks[log_filter["fromBlock"] : log_filter["toBlock"] + 1]
+            for log in logs
+            if log["address"] == to_checksum_address(log_filter["address"]) and log["topics"][0] in topics
+        ]
+
+
+@pytest.fixture
+def chain():
+    return FakeChain()
+
+
+@pytest.fixture
+def index(tmp_path, chain):
+    with LoanIndex(tmp_path / "loans.sqlite", chain, batch_size=2) as index:
+        yield index
+
+
+@pytest.fixture
+def signed_offer(p2p_nfts_usdc, usdc, bayc_key_hash, lender, lender_key, now):
+    def _signed_offer(token_id, tracing_id, nonce=0):
+        offer = Offer(
+            principal=1000,
+            interest=100,
+            payment_token=usdc.address,
+            duration=100,
+            collection_key_hash=bayc_key_hash,
+            token_id=token_id,
+            expiration=now + 100,
+            lender=lender,
+            tracing_id=tracing_id.zfill(32),
+            nonce=nonce,
+        )
+        return sign_offer(offer, lender_key, p2p_nfts_usdc.address)
+
+    return _signed_offer
+
+
+@pytest.fixture
+def create_loan(p2p_nfts_usdc, usdc, bayc, lender, borrower, chain, signed_offer):
+    def _create_loan(token_id, fork=b""):
+        offer = signed_offer(token_id, f"offer_{token_id}".encode())
+        bayc.mint(borrower, token_id)
+        bayc.approve(p2p_nfts_usdc.address, token_id, sender=borrower)
+        usdc.deposit(value=offer.offer.principal, sender=lender)
+        usdc.approve(p2p_nfts_usdc.address, offer.offer.principal, sender=lender)
+        loan_id = p2p_nfts_usdc.create_loan(offer, token_id, [], borrower, 0, 0, ZERO_ADDRESS, sender=borrower)
+        chain.mine(p2p_nfts_usdc._computation, fork)
+        return loan_id
+
+    return _create_loan
+
+
+def assert_index_matches_contract(index, p2p_nfts_usdc, loan_ids):
+    loan_hashes = index.loan_hashes(p2p_nfts_usdc.address)
+    assert set(loan_hashes) <= set(loan_ids)
+    for loan_id in loan_ids:
+        assert loan_hashes.get(loan_id, ZERO_BYTES32) == p2p_nfts_usdc.loans(loan_id)
+
+
+def test_loan_index_follows_loans(p2p_nfts_usdc, usdc, lender, borrower, chain, index, create_loan, signed_offer):
+    contract = p2p_nfts_usdc.address
+    loan_ids = [create_loan(token_id) for token_id in range(1, 4)]
+
+    assert index.sync(contract) == chain.block_number
+    assert len(index.loan_hashes(contract)) == 3
+    assert_index_matches_contract(index, p2p_nfts_usdc, loan_ids)
+
+    # the replacing loan would have the same id if started in the same block
+    boa.env.time_travel(seconds=10)
+    offer = signed_offer(1, b"offer_4")
+    usdc.deposit(value=offer.offer.principal, sender=lender)
+    usdc.approve(contract, offer.offer.principal, sender=lender)
+    usdc.deposit(value=100, sender=borrower)
+    usdc.approve(contract, 1100, sender=borrower)
+    loan = index.loan(contract, loan_ids[0])
+    loan_ids.append(p2p_nfts_usdc.replace_loan(loan, offer, [], 0, 0, ZERO_ADDRESS, sender=borrower))
+    chain.mine(p2p_nfts_usdc._computation)
+
+    usdc.deposit(value=100, sender=borrower)
+    usdc.approve(contract, 1100, sender=borrower)
+    loan = index.loan(contract, loan_ids[1])
+    chain.mine(boa.env.raw_call(contract, sender=borrower, data=settle_loan_calldata(loan)))
+
+    assert index.sync(contract) == chain.block_number
+    assert len(index.loan_hashes(contract)) == 2
+    assert index.loan(contract, loan_ids[0]) is None
+    assert index.loan(contract, loan_ids[1]) is None
+    assert_index_matches_contract(index, p2p_nfts_usdc, loan_ids)
+
+    boa.env.time_travel(seconds=91)
+    loan = index.loan(contract, loan_ids[2])
+    p2p_nfts_usdc.claim_defaulted_loan_collateral(loan, sender=lender)
+    chain.mine(p2p_nfts_usdc._computation)
+
+    assert index.sync(contract) == chain.block_number
+    assert list(index.loan_hashes(contract)) == [loan_ids[3]]
+    assert index.loans(contract, borrower=borrower) == [index.loan(contract, loan_ids[3])]
+    assert_index_matches_contract(index, p2p_nfts_usdc, loan_ids)
+
+
+def test_loan_index_tracks_revoked_offers(p2p_nfts_usdc, lender, chain, index, signed_offer):
+    contract = p2p_nfts_usdc.address
+    offer = signed_offer(1, b"offer_1")
+    offer_id = compute_signed_offer_id(offer)
+    p2p_nfts_usdc.revoke_offer(offer, sender=lender)
+    chain.mine(p2p_nfts_usdc._computation)
+    index.sync(contract)
+
+    assert index.is_offer_revoked(contract, offer_id)
+    assert not index.is_offer_revoked(contract, compute_signed_offer_id(signed_offer(2, b"offer_2")))
+    assert not index.is_offer_revoked(contract, compute_signed_offer_id(signed_offer(2, b"offer_2")), lender=lender, nonce=0)
+
+    p2p_nfts_usdc.increment_lender_nonce(lender, sender=lender)
+    chain.mine(p2p_nfts_usdc._computation)
+    index.sync(contract)
+
+    assert index.lender_nonce(contract, lender) == p2p_nfts_usdc.lender_nonces(lender) == 1
+    assert index.is_offer_revoked(contract, compute_signed_offer_id(signed_offer(2, b"offer_2")), lender=lender, nonce=0)
+    assert not index.is_offer_revoked(
+        contract, compute_signed_offer_id(signed_offer(2, b"offer_2", nonce=1)), lender=lender, nonce=1
+    )
+
+
+def test_loan_index_rolls_back_reorg(p2p_nfts_usdc, usdc, lender, borrower, chain, index, create_loan, signed_offer):
+    contract = p2p_nfts_usdc.address
+    loan_ids = [create_loan(1)]
+    index.sync(contract)
+    fork_block = chain.block_number + 1
+    loan_hashes = index.loan_hashes(contract)
+    offer_id = compute_signed_offer_id(signed_offer(5, b"offer_5"))
+
+    with boa.env.anchor():
+        loan_ids.append(create_loan(2))
+
+        usdc.deposit(value=100, sender=borrower)
+        usdc.approve(contract, 1100, sender=borrower)
+        p2p_nfts_usdc.settle_loan(index.loan(contract, loan_ids[0]), sender=borrower)
+        chain.mine(p2p_nfts_usdc._computation)
+
+        p2p_nfts_usdc.revoke_offer(signed_offer(5, b"offer_5"), sender=lender)
+        chain.mine(p2p_nfts_usdc._computation)
+        p2p_nfts_usdc.increment_lender_nonce(lender, sender=lender)
+        chain.mine(p2p_nfts_usdc._computation)
+
+        index.sync(contract)
+        assert list(index.loan_hashes(contract)) == [loan_ids[1]]
+        assert index.is_offer_revoked(contract, offer_id)
+        assert index.lender_nonce(contract, lender) == 1
+
+    # the fork is longer than the dropped blocks but doesn't include their transactions
+    chain.reorg(fork_block)
+    for _ in range(5):
+        chain.mine(fork=b"fork")
+
+    assert index.sync(contract) == chain.block_number
+    assert index.loan_hashes(contract) == loan_hashes
+    assert not index.is_offer_revoked(contract, offer_id)
+    assert index.lender_nonce(contract, lender) == 0
+    assert_index_matches_contract(index, p2p_nfts_usdc, loan_ids)
+
+    loan_ids.append(create_loan(3, fork=b"fork"))
+    index.sync(contract)
+    assert len(index.loan_hashes(contract)) == 2
+    assert_index_matches_contract(index, p2p_nfts_usdc, loan_ids)
@@ -0,0 +1,254 @@
+import boa
+import eth_abi
+import pytest
+
+from ...conftest_base import (
+    ZERO_ADDRESS,
+    ZERO_BYTES32,
+    Fee,
+    FeeType,
+    Loan,
+    Offer,
+    compute_loan_hash,
+    compute_signed_offer_id,
+    get_last_event,
+    pack_loan,
+    sign_offer,
+)
+
+
+@pytest.fixture(autouse=True)
+def lender_funds(lender, lender2, usdc):
+    usdc.mint(lender, 10**12)
+    usdc.mint(lender2, 10**12)
+
+
+@pytest.fixture(autouse=True)
+def borrower_funds(borrower, usdc):
+    usdc.mint(borrower, 10**12)
+
+
+@pytest.fixture
+def packed_proxy(p2p_nfts_usdc, packed_loan_proxy_contract_def, owner):
+    proxy = packed_loan_proxy_contract_def.deploy(p2p_nfts_usdc.address)
+    p2p_nfts_usdc.set_proxy_authorization(proxy.address, True, sender=owner)
+    return proxy
+
+
+@pytest.fixture
+def relay_contract():
+    return boa.loads(
+        """
+@external
+def relay(target: address, data: Bytes[4096]):
+    raw_call(target, data)
+"""
+    )
+
+
+@pytest.fixture
+def broker():
+    return boa.env.generate_address()
+
+
+@pytest.fixture
+def offer_bayc(now, lender, lender_key, bayc, broker, p2p_nfts_usdc, usdc, bayc_key_hash):
+    offer = Offer(
+        principal=1000,
+        interest=100,
+        payment_token=usdc.address,
+        duration=100,
+        origination_fee_amount=10,
+        broker_upfront_fee_amount=15,
+        broker_settlement_fee_bps=2000,
+        broker_address=broker,
+        collection_key_hash=bayc_key_hash,
+        token_id=1,
+        expiration=now + 100,
+        lender=lender,
+        pro_rata=False,
+        size=1,
+        tracing_id=b"offer_bayc".zfill(32),
+    )
+    return sign_offer(offer, lender_key, p2p_nfts_usdc.address)
+
+
+@pytest.fixture
+def offer_bayc2(now, lender2, lender2_key, bayc, p2p_nfts_usdc, usdc, bayc_key_hash):
+    offer = Offer(
+        principal=1000,
+        interest=100,
+        payment_token=usdc.address,
+        duration=150,
+        collection_key_hash=bayc_key_hash,
+        token_id=1,
+        expiration=now + 100,
+        lender=lender2,
+        pro_rata=False,
+        size=1,
+        tracing_id=b"offer_bayc2".zfill(32),
+    )
+    return sign_offer(offer, lender2_key, p2p_nfts_usdc.address)
+
+
+@pytest.fixture
+def ongoing_loan_bayc(p2p_nfts_usdc, offer_bayc, usdc, borrower, lender, bayc, now):
+    offer = offer_bayc.offer
+    token_id = offer.token_id
+
+    bayc.mint(borrower, token_id)
+    bayc.approve(p2p_nfts_usdc.address, token_id, sender=borrower)
+    usdc.approve(
+        p2p_nfts_usdc.address, offer.principal - offer.origination_fee_amount + offer.broker_upfront_fee_amount, sender=lender
+    )
+
+    loan_id = p2p_nfts_usdc.create_loan(offer_bayc, token_id, [], borrower, 0, 0, ZERO_ADDRESS, sender=borrower)
+
+    loan = Loan(
+        id=loan_id,
+        offer_id=compute_signed_offer_id(offer_bayc),
+        offer_tracing_id=offer.tracing_id,
+        amount=offer.principal,
+        interest=offer.interest,
+        payment_token=offer.payment_token,
+        maturity=now + offer.duration,
+        start_time=now,
+        borrower=borrower,
+        lender=lender,
+        collateral_contract=bayc.address,
+        collateral_token_id=token_id,
+        fees=[
+            Fee.protocol(p2p_nfts_usdc, offer.principal),
+            Fee.origination(offer),
+            Fee.lender_broker(offer),
+            Fee.borrower_broker(ZERO_ADDRESS),
+        ],
+        pro_rata=offer.pro_rata,
+        delegate=borrower,
+    )
+    assert compute_loan_hash(loan) == p2p_nfts_usdc.loans(loan_id)
+    return loan
+
+
+def test_unpack_loan(packed_proxy, ongoing_loan_bayc):
+    loan = ongoing_loan_bayc
+
+    assert packed_proxy.unpack_loan(pack_loan(loan)) == loan
+
+
+def test_unpack_loan_without_delegate_and_fees(packed_proxy, ongoing_loan_bayc):
+    loan = ongoing_loan_bayc._replace(
+        delegate=ZERO_ADDRESS,
+        pro_rata=True,
+        fees=[Fee(FeeType.PROTOCOL), *ongoing_loan_bayc.fees[1:3], Fee.borrower_broker(ZERO_ADDRESS)],
+    )
+
+    packed_loan = pack_loan(loan)
+
+    assert len(packed_loan) == 237 + 2 * 38
+    assert packed_proxy.unpack_loan(packed_loan) == loan
+
+
+def test_packed_loan_is_smaller_than_abi_encoded(ongoing_loan_bayc):
+    loan = ongoing_loan_bayc
+    abi_encoded = eth_abi.encode(
+        [
+            "(bytes32,bytes32,bytes32,uint256,uint256,address,uint256,uint256,address,address,address,uint256,(uint256,uint256,uint256,address)[],bool,address)"
+        ],
+        [loan],
+    )
+
+    assert len(pack_loan(loan)) * 2 < len(abi_encoded)
+
+
+def test_unpack_loan_reverts_if_invalid_length(packed_proxy, ongoing_loan_bayc):
+    packed_loan = pack_loan(ongoing_loan_bayc)
+
+    with boa.reverts("invalid packed loan"):
+        packed_proxy.unpack_loan(packed_loan[:-1])
+
+    with boa.reverts("invalid packed loan"):
+        packed_proxy.unpack_loan(packed_loan + b"\x00")
+
+
+def test_settle_loan(packed_proxy, p2p_nfts_usdc, ongoing_loan_bayc, usdc, bayc):
+    loan = ongoing_loan_bayc
+    settlement_fees = loan.get_settlement_fees()
+    initial_lender_balance = usdc.balanceOf(loan.lender)
+
+    usdc.approve(p2p_nfts_usdc.address, loan.amount + loan.interest, sender=loan.borrower)
+    packed_proxy.settle_loan(pack_loan(loan), sender=loan.borrower)
+
+    assert p2p_nfts_usdc.loans(loan.id) == ZERO_BYTES32
+    assert bayc.ownerOf(loan.collateral_token_id) == loan.borrower
+    assert usdc.balanceOf(loan.lender) == initial_lender_balance + loan.amount + loan.interest - settlement_fees
+    assert get_last_event(packed_proxy, "LoanPaid").id == loan.id
+
+
+def test_settle_loan_reverts_if_loan_invalid(packed_proxy, ongoing_loan_bayc):
+    loan = ongoing_loan_bayc._replace(interest=ongoing_loan_bayc.interest + 1)
+
+    with boa.reverts("invalid loan"):
+        packed_proxy.settle_loan(pack_loan(loan), sender=loan.borrower)
+
+
+def test_settle_loan_reverts_if_not_borrower(packed_proxy, ongoing_loan_bayc):
+    loan = ongoing_loan_bayc
+
+    with boa.reverts("not borrower"):
+        packed_proxy.settle_loan(pack_loan(loan), sender=loan.lender)
+
+
+def test_claim_defaulted_loan_collateral(packed_proxy, p2p_nfts_usdc, ongoing_loan_bayc, bayc, now):
+    loan = ongoing_loan_bayc
+    boa.env.time_travel(seconds=loan.maturity - now + 1)
+
+    packed_proxy.claim_defaulted_loan_collateral(pack_loan(loan), sender=loan.lender)
+
+    assert p2p_nfts_usdc.loans(loan.id) == ZERO_BYTES32
+    assert bayc.ownerOf(loan.collateral_token_id) == loan.lender
+
+
+def test_replace_loan(packed_proxy, p2p_nfts_usdc, ongoing_loan_bayc, offer_bayc2, usdc):
+    loan = ongoing_loan_bayc
+    offer = offer_bayc2.offer
+
+    usdc.approve(p2p_nfts_usdc.address, offer.principal, sender=offer.lender)
+    usdc.approve(p2p_nfts_usdc.address, loan.amount + loan.interest, sender=loan.borrower)
+    loan_id = packed_proxy.replace_loan(pack_loan(loan), offer_bayc2, [], 0, 0, ZERO_ADDRESS, sender=loan.borrower)
+
+    event = get_last_event(packed_proxy, "LoanReplaced")
+    assert event.id == loan_id
+    assert event.original_loan_id == loan.id
+    assert event.borrower == loan.borrower
+    assert event.lender == offer.lender
+    assert p2p_nfts_usdc.loans(loan.id) == ZERO_BYTES32
+
+
+def test_replace_loan_lender(packed_proxy, p2p_nfts_usdc, ongoing_loan_bayc, offer_bayc2, usdc):
+    loan = ongoing_loan_bayc
+    offer = offer_bayc2.offer
+
+    usdc.approve(p2p_nfts_usdc.address, offer.principal, sender=offer.lender)
+    loan_id = packed_proxy.replace_loan_lender(pack_loan(loan), offer_bayc2, [], sender=loan.lender)
+
+    event = get_last_event(packed_proxy, "LoanReplacedByLender")
+    assert event.id == loan_id
+    assert event.original_loan_id == loan.id
+    assert event.lender == offer.lender
+    assert p2p_nfts_usdc.loans(loan.id) == ZERO_BYTES32
+
+
+def test_entry_points_revert_if_not_called_by_eoa(packed_proxy, ongoing_loan_bayc, offer_bayc2, relay_contract):
+    loan = ongoing_loan_bayc
+    packed_loan = pack_loan(loan)
+    calls = [
+        packed_proxy.settle_loan.prepare_calldata(packed_loan),
+        packed_proxy.claim_defaulted_loan_collateral.prepare_calldata(packed_loan),
+        packed_proxy.replace_loan.prepare_calldata(packed_loan, offer_bayc2, [], 0, 0, ZERO_ADDRESS),
+        packed_proxy.replace_loan_lender.prepare_calldata(packed_loan, offer_bayc2, []),
+    ]
+
+    for calldata in calls:
+        with boa.reverts("not EOA"):
+            relay_contract.relay(packed_proxy.address, calldata, sender=loan.borrower)
@@ -12,6 +12,7 @@ from ...conftest_base import (
     SignedOffer,
     compute_loan_hash,
     compute_signed_offer_id,
+    get_events,
     get_last_event,
     get_loan_mutations,
     replace_namedtuple_field,
@@ -1286,3 +1287,28 @@ def test_replace_loan_settles_amounts(  # noqa: PLR0914
         assert usdc.balanceOf(lender2) == initial_lender2_balance + new_lender_delta
     else:
         assert usdc.balanceOf(lender) == initial_lender_balance + new_lender_delta + current_lender_delta
+
+
+def test_replace_loan_sends_one_transfer_per_wallet(p2p_nfts_usdc, ongoing_loan_bayc, offer_bayc2, usdc):
+    loan = ongoing_loan_bayc
+    offer = offer_bayc2.offer
+    borrower = loan.borrower
+    broker_address = loan.get_lender_broker_fee().wallet
+    amount_to_settle = loan.amount + loan.interest + loan.calc_borrower_broker_settlement_fee(loan.maturity)
+
+    usdc.approve(
+        p2p_nfts_usdc.address,
+        offer.principal - offer.origination_fee_amount + offer.broker_upfront_fee_amount,
+        sender=offer.lender,
+    )
+    usdc.approve(p2p_nfts_usdc.address, amount_to_settle, sender=borrower)
+    p2p_nfts_usdc.replace_loan(loan, offer_bayc2, [], 0, 0, ZERO_ADDRESS, sender=borrower)
+
+    transfers = [
+        event
+        for event in get_events(p2p_nfts_usdc, "Transfer")
+        if event.address == usdc.address and event.sender == p2p_nfts_usdc.address
+    ]
+    receivers = [transfer.receiver for transfer in transfers]
+    assert len(receivers) == len(set(receivers))
+    assert broker_address in receivers
@@ -198,3 +198,48 @@ def test_revoke_offer_works_with_proxy(p2p_nfts_usdc, borrower, now, lender, len
     p2p_nfts_proxy.revoke_offer(signed_offer, sender=lender)
 
     assert p2p_nfts_usdc.revoked_offers(compute_signed_offer_id(signed_offer))
+
+
+def test_increment_lender_nonce(p2p_nfts_usdc, lender, lender2):
+    assert p2p_nfts_usdc.lender_nonces(lender) == 0
+
+    p2p_nfts_usdc.increment_lender_nonce(lender, sender=lender)
+    p2p_nfts_usdc.increment_lender_nonce(lender, sender=lender)
+
+    assert p2p_nfts_usdc.lender_nonces(lender) == 2
+    assert p2p_nfts_usdc.lender_nonces(lender2) == 0
+
+
+def test_increment_lender_nonce_logs_event(p2p_nfts_usdc, lender):
+    p2p_nfts_usdc.increment_lender_nonce(lender, sender=lender)
+
+    event = get_last_event(p2p_nfts_usdc, "LenderNonceIncremented")
+    assert event.lender == lender
+    assert event.nonce == 1
+
+
+def test_increment_lender_nonce_reverts_if_sender_is_not_lender(p2p_nfts_usdc, lender, borrower):
+    with boa.reverts("not lender"):
+        p2p_nfts_usdc.increment_lender_nonce(lender, sender=borrower)
+
+
+def test_increment_lender_nonce_works_with_proxy(p2p_nfts_usdc, lender, borrower):
+    proxy = boa.loads(
+        """
+@external
+def relay(target: address, data: Bytes[1024]):
+    raw_call(target, data)
+"""
+    )
+    calldata = p2p_nfts_usdc.increment_lender_nonce.prepare_calldata(lender)
+
+    with boa.reverts("not lender"):
+        proxy.relay(p2p_nfts_usdc.address, calldata, sender=lender)
+
+    p2p_nfts_usdc.set_proxy_authorization(proxy.address, True, sender=p2p_nfts_usdc.owner())
+    with boa.reverts("not lender"):
+        proxy.relay(p2p_nfts_usdc.address, calldata, sender=borrower)
+
+    proxy.relay(p2p_nfts_usdc.address, calldata, sender=lender)
+
+    assert p2p_nfts_usdc.lender_nonces(lender) == 1
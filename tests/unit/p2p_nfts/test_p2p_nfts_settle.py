@@ -7,13 +7,16 @@ from ...conftest_base import (
     ZERO_ADDRESS,
     ZERO_BYTES32,
     CollectionContract,
+    CreateLoanRequest,
     Fee,
     FeeAmount,
     FeeType,
     Loan,
     Offer,
+    OfferType,
     compute_loan_hash,
     compute_signed_offer_id,
+    get_events,
     get_last_event,
     get_loan_mutations,
     sign_offer,
@@ -289,6 +292,82 @@ def ongoing_loan_prorata(p2p_nfts_usdc, offer_bayc, usdc, borrower, lender, bayc
     return loan
 
 
+@pytest.fixture
+def ongoing_loans_bayc(
+    p2p_nfts_usdc, usdc, borrower, lender, lender_key, bayc, broker, now, protocol_fees, borrower_broker_fee, bayc_key_hash
+):
+    token_ids = [1, 2, 3]
+    offer = Offer(
+        principal=1000,
+        interest=100,
+        payment_token=usdc.address,
+        duration=100,
+        origination_fee_amount=10,
+        broker_upfront_fee_amount=15,
+        broker_settlement_fee_bps=200,
+        broker_address=broker,
+        collection_key_hash=bayc_key_hash,
+        offer_type=OfferType.COLLECTION,
+        expiration=now + 100,
+        lender=lender,
+        pro_rata=False,
+        size=len(token_ids),
+    )
+    signed_offer = sign_offer(offer, lender_key, p2p_nfts_usdc.address)
+
+    for token_id in token_ids:
+        bayc.mint(borrower, token_id)
+    bayc.setApprovalForAll(p2p_nfts_usdc.address, True, sender=borrower)
+    lender_approval = (offer.principal - offer.origination_fee_amount + offer.broker_upfront_fee_amount) * len(token_ids)
+    usdc.approve(p2p_nfts_usdc.address, lender_approval, sender=lender)
+
+    loan_ids = p2p_nfts_usdc.create_loans(
+        [
+            CreateLoanRequest(
+                signed_offer,
+                token_id,
+                [],
+                borrower,
+                borrower_broker_fee.upfront_amount,
+                borrower_broker_fee.settlement_bps,
+                borrower_broker_fee.wallet,
+            )
+            for token_id in token_ids
+        ],
+        [],
+        0,
+        sender=borrower,
+    )
+
+    loans = [
+        Loan(
+            id=loan_id,
+            offer_id=compute_signed_offer_id(signed_offer),
+            amount=offer.principal,
+            interest=offer.interest,
+            payment_token=offer.payment_token,
+            maturity=now + offer.duration,
+            start_time=now,
+            borrower=borrower,
+            lender=lender,
+            collateral_contract=bayc.address,
+            collateral_token_id=token_id,
+            fees=[
+                Fee.protocol(p2p_nfts_usdc, offer.principal),
+                Fee.origination(offer),
+                Fee.lender_broker(offer),
+                borrower_broker_fee,
+            ],
+            pro_rata=offer.pro_rata,
+            delegate=borrower,
+        )
+        for loan_id, token_id in zip(loan_ids, token_ids)
+    ]
+    for loan in loans:
+        assert compute_loan_hash(loan) == p2p_nfts_usdc.loans(loan.id)
+    return loans
+
+
 def test_settle_loan_reverts_if_loan_invalid(p2p_nfts_usdc, ongoing_loan_bayc):
     for loan in get_loan_mutations(ongoing_loan_bayc):
         print(f"{loan=}")
@@ -581,6 +660,20 @@ def test_settle_loan_transfers_collateral_to_borrower_erc721(p2p_nfts_usdc, ongo
     assert bayc.ownerOf(loan.collateral_token_id) == loan.borrower
 
 
+def test_settle_loan_transfers_collateral_after_funds(p2p_nfts_usdc, ongoing_loan_bayc, usdc, bayc):
+    loan = ongoing_loan_bayc
+    amount_to_settle = loan.amount + loan.interest + loan.calc_borrower_broker_settlement_fee(loan.maturity)
+
+    usdc.approve(p2p_nfts_usdc.address, amount_to_settle, sender=loan.borrower)
+    p2p_nfts_usdc.settle_loan(loan, sender=loan.borrower)
+
+    events = get_events(p2p_nfts_usdc)
+    funds_transfers = [i for i, e in enumerate(events) if e.event_name == "Transfer" and e.address == usdc.address]
+    collateral_transfer = next(i for i, e in enumerate(events) if e.event_name == "Transfer" and e.address == bayc.address)
+    loan_paid = next(i for i, e in enumerate(events) if e.event_name == "LoanPaid")
+    assert max(funds_transfers) < collateral_transfer < loan_paid
+
+
 def test_settle_loan_transfers_collateral_to_borrower_punks(p2p_nfts_usdc, ongoing_loan_punk, usdc, cryptopunks, now):
     loan = ongoing_loan_punk
     borrower_broker_fee = loan.calc_borrower_broker_settlement_fee(now)
@@ -854,3 +947,178 @@ def test_claim_pending_transactions(p2p_nfts_usdc, usdc):
 
     with boa.reverts("no pending transfers"):
         p2p_nfts_usdc.claim_pending_transfers(sender=user)
+
+
+def test_settle_loans(p2p_nfts_usdc, delegation_registry, ongoing_loans_bayc, usdc, bayc):
+    loans = ongoing_loans_bayc
+    borrower = loans[0].borrower
+    amount_to_settle = sum(
+        loan.amount + loan.interest + loan.calc_borrower_broker_settlement_fee(loan.maturity) for loan in loans
+    )
+
+    usdc.approve(p2p_nfts_usdc.address, amount_to_settle, sender=borrower)
+    p2p_nfts_usdc.settle_loans(loans, sender=borrower)
+
+    for loan in loans:
+        assert p2p_nfts_usdc.loans(loan.id) == ZERO_BYTES32
+        assert bayc.ownerOf(loan.collateral_token_id) == borrower
+        assert not delegation_registry.checkDelegateForERC721(
+            loan.delegate, p2p_nfts_usdc.address, loan.collateral_contract, loan.collateral_token_id, ZERO_BYTES32
+        )
+    assert usdc.balanceOf(p2p_nfts_usdc.address) == 0
+
+
+def test_settle_loans_logs_events(p2p_nfts_usdc, ongoing_loans_bayc, usdc):
+    loans = ongoing_loans_bayc
+    borrower = loans[0].borrower
+    amount_to_settle = sum(
+        loan.amount + loan.interest + loan.calc_borrower_broker_settlement_fee(loan.maturity) for loan in loans
+    )
+
+    usdc.approve(p2p_nfts_usdc.address, amount_to_settle, sender=borrower)
+    p2p_nfts_usdc.settle_loans(loans, sender=borrower)
+
+    events = get_events(p2p_nfts_usdc, "LoanPaid")
+    assert [event.id for event in events] == [loan.id for loan in loans]
+    for event, loan in zip(events, loans):
+        assert event.paid_interest == loan.interest
+        assert event.paid_settlement_fees == [
+            FeeAmount(fee.type, loan.interest * fee.settlement_bps // 10000, fee.wallet)
+            for fee in loan.fees
+            if fee.settlement_bps > 0
+        ]
+
+
+def test_settle_loans_nets_transfers_per_wallet(p2p_nfts_usdc, ongoing_loans_bayc, usdc):
+    loans = ongoing_loans_bayc
+    borrower = loans[0].borrower
+    amount_to_settle = sum(
+        loan.amount + loan.interest + loan.calc_borrower_broker_settlement_fee(loan.maturity) for loan in loans
+    )
+    expected_payouts = {}
+    for loan in loans:
+        settlement_fees = loan.get_settlement_fees()
+        borrower_broker_fee = loan.calc_borrower_broker_settlement_fee(loan.maturity)
+        expected_payouts[loan.lender] = (
+            expected_payouts.get(loan.lender, 0) + loan.amount + loan.interest - settlement_fees + borrower_broker_fee
+        )
+        for fee in loan.fees:
+            if fee.settlement_bps > 0:
+                expected_payouts[fee.wallet] = (
+                    expected_payouts.get(fee.wallet, 0) + loan.interest * fee.settlement_bps // 10000
+                )
+    initial_balances = {wallet: usdc.balanceOf(wallet) for wallet in expected_payouts}
+    initial_borrower_balance = usdc.balanceOf(borrower)
+
+    usdc.approve(p2p_nfts_usdc.address, amount_to_settle, sender=borrower)
+    p2p_nfts_usdc.settle_loans(loans, sender=borrower)
+
+    transfers = [e for e in get_events(p2p_nfts_usdc, "Transfer") if e.address == usdc.address]
+    assert [(t.sender, t.receiver) for t in transfers if t.sender == borrower] == [(borrower, p2p_nfts_usdc.address)]
+    assert len([t for t in transfers if t.sender == p2p_nfts_usdc.address]) == len(expected_payouts)
+    assert usdc.balanceOf(borrower) == initial_borrower_balance - amount_to_settle
+    for wallet, amount in expected_payouts.items():
+        assert usdc.balanceOf(wallet) == initial_balances[wallet] + amount
+
+
+def test_settle_loans_transfers_collateral_after_funds(p2p_nfts_usdc, ongoing_loans_bayc, usdc, bayc):
+    loans = ongoing_loans_bayc
+    borrower = loans[0].borrower
+    amount_to_settle = sum(
+        loan.amount + loan.interest + loan.calc_borrower_broker_settlement_fee(loan.maturity) for loan in loans
+    )
+
+    usdc.approve(p2p_nfts_usdc.address, amount_to_settle, sender=borrower)
+    p2p_nfts_usdc.settle_loans(loans, sender=borrower)
+
+    events = get_events(p2p_nfts_usdc)
+    funds_transfers = [i for i, e in enumerate(events) if e.event_name == "Transfer" and e.address == usdc.address]
+    collateral_transfers = [i for i, e in enumerate(events) if e.event_name == "Transfer" and e.address == bayc.address]
+    loans_paid = [i for i, e in enumerate(events) if e.event_name == "LoanPaid"]
+    assert len(collateral_transfers) == len(loans_paid) == len(loans)
+    assert max(funds_transfers) < min(collateral_transfers)
+    assert all(transfer < paid for transfer, paid in zip(collateral_transfers, loans_paid))
+
+
+def test_settle_loans_reverts_if_any_loan_invalid(p2p_nfts_usdc, ongoing_loans_bayc, usdc, bayc):
+    loans = ongoing_loans_bayc
+    borrower = loans[0].borrower
+    invalid_loans = [*loans[:-1], loans[-1]._replace(amount=loans[-1].amount + 1)]
+    amount_to_settle = sum(
+        loan.amount + loan.interest + loan.calc_borrower_broker_settlement_fee(loan.maturity) for loan in loans
+    )
+
+    usdc.approve(p2p_nfts_usdc.address, amount_to_settle, sender=borrower)
+    with boa.reverts("invalid loan"):
+        p2p_nfts_usdc.settle_loans(invalid_loans, sender=borrower)
+
+    for loan in loans:
+        assert p2p_nfts_usdc.loans(loan.id) == compute_loan_hash(loan)
+        assert bayc.ownerOf(loan.collateral_token_id) == p2p_nfts_usdc.address
+
+
+def test_settle_loans_reverts_if_not_borrower(p2p_nfts_usdc, ongoing_loans_bayc, usdc):
+    loans = ongoing_loans_bayc
+
+    with boa.reverts("not borrower"):
+        p2p_nfts_usdc.settle_loans(loans, sender=loans[0].lender)
+
+
+def test_settle_loan_sends_one_transfer_per_wallet(
+    p2p_nfts_usdc, borrower, lender, lender_key, bayc, bayc_key_hash, usdc, now
+):
+    token_id = 1
+    offer = Offer(
+        principal=1000,
+        interest=100,
+        payment_token=usdc.address,
+        duration=100,
+        broker_settlement_fee_bps=200,
+        broker_address=lender,
+        collection_key_hash=bayc_key_hash,
+        token_id=token_id,
+        expiration=now + 100,
+        lender=lender,
+        pro_rata=False,
+    )
+    signed_offer = sign_offer(offer, lender_key, p2p_nfts_usdc.address)
+
+    bayc.mint(borrower, token_id)
+    bayc.approve(p2p_nfts_usdc.address, token_id, sender=borrower)
+    usdc.approve(p2p_nfts_usdc.address, offer.principal, sender=lender)
+    loan_id = p2p_nfts_usdc.create_loan(signed_offer, token_id, [], ZERO_ADDRESS, 0, 0, lender, sender=borrower)
+    loan = Loan(
+        id=loan_id,
+        offer_id=compute_signed_offer_id(signed_offer),
+        amount=offer.principal,
+        interest=offer.interest,
+        payment_token=offer.payment_token,
+        maturity=now + offer.duration,
+        start_time=now,
+        borrower=borrower,
+        lender=lender,
+        collateral_contract=bayc.address,
+        collateral_token_id=token_id,
+        fees=[
+            Fee.protocol(p2p_nfts_usdc, offer.principal),
+            Fee.origination(offer),
+            Fee.lender_broker(offer),
+            Fee.borrower_broker(lender),
+        ],
+        pro_rata=offer.pro_rata,
+    )
+    initial_lender_balance = usdc.balanceOf(lender)
+
+    usdc.approve(p2p_nfts_usdc.address, loan.amount + loan.interest, sender=borrower)
+    p2p_nfts_usdc.settle_loan(loan, sender=borrower)
+
+    transfers = [
+        event
+        for event in get_events(p2p_nfts_usdc, "Transfer")
+        if event.address == usdc.address and event.sender == p2p_nfts_usdc.address
+    ]
+    assert [(transfer.receiver, transfer.value) for transfer in transfers] == [(lender, loan.amount + loan.interest)]
+    assert usdc.balanceOf(lender) == initial_lender_balance + loan.amount + loan.interest
+    assert get_last_event(p2p_nfts_usdc, "LoanPaid").paid_settlement_fees == [
+        FeeAmount(FeeType.LENDER_BROKER, loan.interest * 200 // 10000, lender)
+    ]
@@ -0,0 +1,124 @@
+from types import SimpleNamespace
+
+import boa
+import pytest
+
+from ...conftest_base import ZERO_ADDRESS, CollectionContract, TraitRoot, TraitRootVersion
+
+pytest.importorskip("ape")
+
+from scripts._helpers import contracts, transactions  # noqa: E402
+from scripts._helpers.basetypes import ContractConfig, DeploymentContext, Environment  # noqa: E402
+from scripts._helpers.contracts import CHANGE_BATCH, P2PLendingControl  # noqa: E402
+
+ROOT = "11" * 32
+OTHER_ROOT = "22" * 32
+EMPTY_ROOT = "00" * 32
+
+
+@pytest.fixture
+def p2p_control(p2p_lending_control_contract_def, owner):
+    return p2p_lending_control_contract_def.deploy()
+
+
+@pytest.fixture
+def collections():
+    return {key: boa.env.generate_address(key) for key in ["bayc", "punks", "mayc"]}
+
+
+@pytest.fixture
+def context(collections):
+    control = P2PLendingControl(key="p2p.control", abi_key="abi", trait_roots_key="trait_roots")
+    trait_roots = {"bayc": ROOT, "punks": {"root": OTHER_ROOT, "version": TraitRootVersion.SORTED_PAIR}, "mayc": EMPTY_ROOT}
+    collection_configs = {
+        key: ContractConfig(key, SimpleNamespace(address=address), None) for key, address in collections.items()
+    }
+    return DeploymentContext(
+        {"p2p.control": control} | collection_configs, Environment.local, "test", None, config={"trait_roots": trait_roots}
+    )
+
+
+def key_hash(collection: str) -> str:
+    return P2PLendingControl.get_collection_hash(collection)
+
+
+def to_bytes(hex_str: str) -> bytes:
+    return bytes.fromhex(hex_str.removeprefix("0x"))
+
+
+def test_change_batch_is_the_contract_bound(p2p_control, owner):
+    collections = [i.to_bytes(32, "big") for i in range(CHANGE_BATCH + 1)]
+    roots = [TraitRoot(collection, b"\x01" * 32) for collection in collections]
+
+    p2p_control.change_collections_trait_roots(roots[:CHANGE_BATCH], sender=owner)
+    assert len(p2p_control.get_collection_statuses(collections[:CHANGE_BATCH])) == CHANGE_BATCH
+
+    with boa.reverts():
+        p2p_control.change_collections_trait_roots(roots, sender=owner)
+    with boa.reverts():
+        p2p_control.get_collection_statuses(collections)
+
+
+def test_set_trait_roots_dry_run(context, collections, monkeypatch):
+    # in dry runs execute_batched passes each batch to execute, and nothing is read
+    executed = []
+    monkeypatch.setattr(transactions, "execute", lambda _context, *args: executed.append(args))
+    monkeypatch.setattr(contracts, "execute_reads", pytest.fail)
+    context.dryrun = True
+
+    context["p2p.control"].set_trait_roots(context)
+
+    assert executed == [
+        (
+            "p2p.control",
+            "change_collections_trait_roots",
+            [
+                (key_hash("bayc"), "0x" + ROOT, TraitRootVersion.XOR_MERGE),
+                (key_hash("punks"), "0x" + OTHER_ROOT, TraitRootVersion.SORTED_PAIR),
+                (key_hash("mayc"), "0x" + EMPTY_ROOT, TraitRootVersion.XOR_MERGE),
+            ],
+        ),
+        (
+            "p2p.control",
+            "change_collections_contracts",
+            [
+                (key_hash("bayc"), collections["bayc"]),
+                (key_hash("punks"), collections["punks"]),
+                (key_hash("mayc"), ZERO_ADDRESS),
+            ],
+        ),
+    ]
+
+
+def test_set_trait_roots_skips_up_to_date_collections(context, collections, p2p_control, owner, monkeypatch):
+    # bayc is up to date, punks has a new root version and mayc was removed
+    p2p_control.change_collections_trait_roots(
+        [TraitRoot(to_bytes(key_hash("bayc")), to_bytes(ROOT)), TraitRoot(to_bytes(key_hash("punks")), to_bytes(OTHER_ROOT))],
+        sender=owner,
+    )
+    p2p_control.change_collections_contracts(
+        [CollectionContract(to_bytes(key_hash(key)), address) for key, address in collections.items()], sender=owner
+    )
+    reads = []
+    batches = []
+
+    def execute_reads(_context, contract, func, args_list):
+        # the reads served by the contract, which takes the hashes as bytes
+        reads.append((contract, func, [len(hashes) for (hashes,) in args_list]))
+        return [getattr(p2p_control, func)([to_bytes(h) for h in hashes]) for (hashes,) in args_list]
+
+    monkeypatch.setattr(contracts, "CHANGE_BATCH", 2)
+    monkeypatch.setattr(contracts, "execute_reads", execute_reads)
+    monkeypatch.setattr(contracts, "execute_batched", lambda _context, *args, **_kwargs: batches.append(args))
+
+    context["p2p.control"].set_trait_roots(context)
+
+    assert reads == [("p2p.control", "get_collection_statuses", [2, 1])]
+    assert batches == [
+        (
+            "p2p.control",
+            "change_collections_trait_roots",
+            [(key_hash("punks"), "0x" + OTHER_ROOT, TraitRootVersion.SORTED_PAIR)],
+        ),
+        ("p2p.control", "change_collections_contracts", [(key_hash("mayc"), ZERO_ADDRESS)]),
+    ]
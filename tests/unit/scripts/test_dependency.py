@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("ape")
+
+from scripts._helpers.basetypes import ContractConfig, DeploymentContext, Environment  # noqa: E402
+from scripts._helpers.dependency import DependencyManager, dependency_levels, topological_sort  # noqa: E402
+
+
+def deployment_context(
+    dependencies: dict[str, set[str]], deployed: set[str] | frozenset[str] = frozenset()
+) -> DeploymentContext:
+    contracts = {
+        key: ContractConfig(key, SimpleNamespace(address=f"0x{key}") if key in deployed else None, None, deployment_deps=deps)
+        for key, deps in dependencies.items()
+    }
+    return DeploymentContext(contracts, Environment.local, "test", None, config={"trait_roots": {}})
+
+
+def level_keys(manager: DependencyManager) -> list[list[str]]:
+    return [[contract.key for contract in level] for level in manager.build_contract_deploy_levels()]
+
+
+P2P_DEPENDENCIES = {
+    "usdc": set(),
+    "control": set(),
+    "p2p": {"usdc", "control"},
+    "proxy": {"p2p"},
+    "batch": {"p2p", "usdc"},
+}
+
+
+def test_dependency_levels():
+    # nodes map to the nodes depending on them, and are leveled by the longest path leading to them
+    dependencies = {"a": {"b", "c"}, "b": {"c"}, "c": set(), "d": set()}
+
+    assert dependency_levels(dependencies) == [{"a", "d"}, {"b"}, {"c"}]
+    assert dependency_levels({"a": {"b"}}) == [{"a"}, {"b"}]
+    assert dependency_levels({}) == []
+
+
+@pytest.mark.parametrize(
+    "dependencies", [{"a": {"a"}}, {"a": {"b"}, "b": {"c"}, "c": {"a"}}, {"x": {"a"}, "a": {"b"}, "b": {"a"}}]
+)
+def test_dependency_cycles_raise(dependencies):
+    with pytest.raises(ValueError, match="Dependency cycle"):
+        topological_sort(dependencies)
+    with pytest.raises(ValueError, match="Dependency cycle"):
+        dependency_levels(dependencies)
+
+
+def test_build_contract_deploy_levels():
+    manager = DependencyManager(deployment_context(P2P_DEPENDENCIES), set())
+
+    assert level_keys(manager) == [["control", "usdc"], ["p2p"], ["batch", "proxy"]]
+
+
+def test_build_contract_deploy_levels_skips_deployed_contracts():
+    context = deployment_context(P2P_DEPENDENCIES, deployed={"usdc", "control", "p2p", "batch"})
+
+    assert level_keys(DependencyManager(context, set())) == [["proxy"]]
+    # changed contracts are redeployed along with the contracts depending on them
+    assert level_keys(DependencyManager(context, {"p2p"})) == [["p2p"], ["batch", "proxy"]]
+    assert level_keys(DependencyManager(context, {"usdc"})) == [["usdc"], ["p2p"], ["batch", "proxy"]]
+
+
+def test_build_contract_deploy_levels_with_config_dependencies():
+    context = deployment_context(P2P_DEPENDENCIES | {"control": {"trait_roots"}})
+
+    assert level_keys(DependencyManager(context, set())) == [["usdc"], ["control"], ["p2p"], ["batch", "proxy"]]
+
+
+def test_deployment_cycles_raise():
+    with pytest.raises(ValueError, match="Dependency cycle"):
+        DependencyManager(deployment_context(P2P_DEPENDENCIES | {"usdc": {"proxy"}}), set())
+
+
+def test_missing_deployment_dependencies_raise():
+    with pytest.raises(ValueError, match=r"\[\('proxy', 'p2p_v2'\)\]"):
+        DependencyManager(deployment_context(P2P_DEPENDENCIES | {"proxy": {"p2p_v2"}}), set())
@@ -0,0 +1,241 @@
+import time
+
+import boto3
+import pytest
+from botocore.awsrequest import AWSResponse
+from botocore.stub import ANY, Stubber
+
+from scripts._helpers.dynamodb import (
+    BATCH_GET_MAX_ATTEMPTS,
+    SERIALIZER,
+    Update,
+    changed_attributes,
+    dynamodb_client,
+    publish,
+    read_items,
+    run_updates,
+)
+
+COLLECTIONS = "collections-test"
+ABI = "abis-test"
+ROOT = "11" * 32
+NEW_ROOT = "22" * 32
+EMPTY_ROOT = "00" * 32
+COLLECTION_NAMES = {"#p0": "collection_key", "#p1": "p2p_whitelisted", "#p2": "traits_root", "#p3": "traits_root_version"}
+
+
+def collection_update(collection_key: str, root: str, version: int | None = None) -> Update:
+    return Update(
+        f"collection {collection_key}",
+        COLLECTIONS,
+        {"collection_key": collection_key},
+        {"traits_root": root, "traits_root_version": version, "p2p_whitelisted": root != EMPTY_ROOT},
+    )
+
+
+def abi_update(abi_key: str) -> Update:
+    return Update(f"abi {abi_key}", ABI, {"abi_key": abi_key}, {"abi": [{"type": "function"}]}, content_keyed=True)
+
+
+def stored_item(update: Update) -> dict:
+    return {k: SERIALIZER.serialize(v) for k, v in (update.key | update.item_attributes()).items() if v is not None}
+
+
+def batch_get_params(collection_keys: list[str]) -> dict:
+    return {
+        "RequestItems": {
+            COLLECTIONS: {
+                "Keys": [{"collection_key": {"S": key}} for key in collection_keys],
+                "ProjectionExpression": "#p0, #p1, #p2, #p3",
+                "ExpressionAttributeNames": COLLECTION_NAMES,
+            }
+        }
+    }
+
+
+def update_item_params(update: Update) -> dict:
+    # collection updates without a trait root version, which is the last attribute
+    attributes = update.item_attributes()
+    return {
+        "TableName": update.table,
+        "Key": {k: SERIALIZER.serialize(v) for k, v in update.key.items()},
+        "UpdateExpression": "SET #k0=:v0, #k2=:v2 REMOVE #k1" if "traits_root" in attributes else "SET #k0=:v0",
+        "ExpressionAttributeNames": {f"#k{i}": k for i, k in enumerate(attributes)},
+        "ExpressionAttributeValues": {
+            f":v{i}": SERIALIZER.serialize(v) for i, v in enumerate(attributes.values()) if v is not None
+        },
+    }
+
+
+@pytest.fixture
+def aws_env(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("DYNAMODB_ENDPOINT", "http://localhost:8000")
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # backoff delays, both of read_items and of the client retries, are recorded instead of slept
+    _sleeps = []
+    monkeypatch.setattr(time, "sleep", _sleeps.append)
+    return _sleeps
+
+
+@pytest.fixture
+def client(aws_env):
+    return boto3.client("dynamodb")
+
+
+@pytest.fixture
+def stubber(client):
+    with Stubber(client) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def test_changed_attributes():
+    update = collection_update("bayc", ROOT)
+
+    assert changed_attributes(update, None) == ["traits_root", "traits_root_version", "p2p_whitelisted"]
+    assert not changed_attributes(update, stored_item(update))
+    assert changed_attributes(update, stored_item(collection_update("bayc", NEW_ROOT))) == ["traits_root"]
+    # attributes set to None only change items having them
+    assert changed_attributes(update, stored_item(collection_update("bayc", ROOT, 1))) == ["traits_root_version"]
+    assert changed_attributes(collection_update("bayc", ROOT, 1), stored_item(update)) == ["traits_root_version"]
+    assert not changed_attributes(abi_update("abi1"), {"abi_key": {"S": "abi1"}})
+
+
+def test_publish_skips_unchanged_items(client, stubber):
+    unchanged = collection_update("bayc", ROOT)
+    changed = collection_update("punks", ROOT)
+    missing = collection_update("mayc", ROOT)
+    stubber.add_response(
+        "batch_get_item",
+        {"Responses": {COLLECTIONS: [stored_item(unchanged), stored_item(collection_update("punks", NEW_ROOT))]}},
+        batch_get_params(["bayc", "punks", "mayc"]),
+    )
+    stubber.add_response("update_item", {}, update_item_params(changed))
+    stubber.add_response("update_item", {}, update_item_params(missing))
+
+    assert publish(client, [unchanged, changed, missing], dry_run=False, max_workers=1) == [changed, missing]
+
+
+def test_publish_reads_only_the_keys_of_content_keyed_items(client, stubber):
+    stored, missing = abi_update("abi1"), abi_update("abi2")
+    stubber.add_response(
+        "batch_get_item",
+        {"Responses": {ABI: [{"abi_key": {"S": "abi1"}}]}},
+        {
+            "RequestItems": {
+                ABI: {
+                    "Keys": [{"abi_key": {"S": "abi1"}}, {"abi_key": {"S": "abi2"}}],
+                    "ProjectionExpression": "#p0",
+                    "ExpressionAttributeNames": {"#p0": "abi_key"},
+                }
+            }
+        },
+    )
+    stubber.add_response("update_item", {}, update_item_params(missing))
+
+    assert publish(client, [stored, missing], dry_run=False) == [missing]
+
+
+def test_publish_updates_trait_root_and_whitelist_together(client, stubber):
+    whitelisted = collection_update("bayc", NEW_ROOT, 1)
+    stubber.add_response(
+        "batch_get_item",
+        {"Responses": {COLLECTIONS: [stored_item(collection_update("bayc", EMPTY_ROOT))]}},
+        batch_get_params(["bayc"]),
+    )
+    stubber.add_response(
+        "update_item",
+        {},
+        {
+            "TableName": COLLECTIONS,
+            "Key": {"collection_key": {"S": "bayc"}},
+            "UpdateExpression": "SET #k0=:v0, #k1=:v1, #k2=:v2",
+            "ExpressionAttributeNames": {"#k0": "traits_root", "#k1": "traits_root_version", "#k2": "p2p_whitelisted"},
+            "ExpressionAttributeValues": {":v0": {"S": NEW_ROOT}, ":v1": {"N": "1"}, ":v2": {"BOOL": True}},
+        },
+    )
+
+    assert publish(client, [whitelisted], dry_run=False) == [whitelisted]
+
+
+def test_publish_removes_default_trait_root_version(client, stubber):
+    update = collection_update("bayc", ROOT)
+    stubber.add_response(
+        "batch_get_item",
+        {"Responses": {COLLECTIONS: [stored_item(collection_update("bayc", ROOT, 1))]}},
+        batch_get_params(["bayc"]),
+    )
+    stubber.add_response("update_item", {}, update_item_params(update))
+
+    assert publish(client, [update], dry_run=False) == [update]
+
+
+def test_publish_dry_run_only_reads(client, stubber):
+    update = collection_update("bayc", NEW_ROOT)
+    stubber.add_response("batch_get_item", {"Responses": {COLLECTIONS: []}}, batch_get_params(["bayc"]))
+
+    assert publish(client, [update], dry_run=True) == [update]
+
+
+def test_read_items_retries_unprocessed_keys(client, stubber, sleeps):
+    bayc, punks = collection_update("bayc", ROOT), collection_update("punks", ROOT)
+    unprocessed = batch_get_params(["punks"])["RequestItems"]
+    stubber.add_response(
+        "batch_get_item",
+        {"Responses": {COLLECTIONS: [stored_item(bayc)]}, "UnprocessedKeys": unprocessed},
+        batch_get_params(["bayc", "punks"]),
+    )
+    stubber.add_response(
+        "batch_get_item", {"Responses": {COLLECTIONS: []}, "UnprocessedKeys": unprocessed}, {"RequestItems": unprocessed}
+    )
+    stubber.add_response("batch_get_item", {"Responses": {COLLECTIONS: [stored_item(punks)]}}, {"RequestItems": unprocessed})
+
+    items = read_items(client, [bayc, punks])
+
+    assert items == {bayc.item_id(): stored_item(bayc), punks.item_id(): stored_item(punks)}
+    assert sleeps == [0.05, 0.1]
+
+
+def test_read_items_fails_after_max_attempts(client, stubber, sleeps):
+    unprocessed = batch_get_params(["bayc"])["RequestItems"]
+    for _ in range(BATCH_GET_MAX_ATTEMPTS):
+        stubber.add_response("batch_get_item", {"Responses": {}, "UnprocessedKeys": unprocessed}, {"RequestItems": ANY})
+
+    with pytest.raises(RuntimeError, match="unprocessed keys"):
+        read_items(client, [collection_update("bayc", ROOT)])
+    assert len(sleeps) == BATCH_GET_MAX_ATTEMPTS
+
+
+def test_run_updates_retries_throttled_requests(aws_env, sleeps):
+    # the stubber answers before the retry handler runs, so the responses are injected at the http level instead
+    class RawResponse:
+        def __init__(self, body: bytes):
+            self.body = body
+
+        def stream(self, **_kwargs):
+            yield self.body
+
+    throttled = (
+        b'{"__type": "com.amazonaws.dynamodb.v20120810#ProvisionedThroughputExceededException", "message": "throttled"}'
+    )
+    requests = []
+
+    def send(request, **kwargs):
+        requests.append(request)
+        if len(requests) <= 2:
+            return AWSResponse(request.url, 400, {}, RawResponse(throttled))
+        return AWSResponse(request.url, 200, {}, RawResponse(b"{}"))
+
+    client = dynamodb_client()
+    client.meta.events.register("before-send.dynamodb.UpdateItem", send)
+
+    run_updates(client, [collection_update("bayc", ROOT)])
+
+    assert len(requests) == 3
+    assert len(sleeps) == 2
@@ -0,0 +1,68 @@
+import pytest
+
+from scripts._helpers.trait_proofs import TraitProofServer
+from scripts._helpers.trait_tree import TraitTree, trait_hash
+
+from ...conftest_base import TokenTraitTree, TraitRootVersion
+
+CONTRACT = "0x" + "ab" * 20
+OTHER_CONTRACT = "0x" + "cd" * 20
+
+
+@pytest.fixture
+def tree_dir(tmp_path):
+    # two collections sharing a contract, with different trait roots
+    TraitTree.build(tmp_path / "bayc.tree", CONTRACT, [(1, "fur", "gold"), (2, "fur", "red")]).close()
+    TraitTree.build(tmp_path / "bayc_gold.tree", CONTRACT, [(1, "fur", "gold")], TraitRootVersion.SORTED_PAIR).close()
+    TraitTree.build(tmp_path / "punks.tree", OTHER_CONTRACT, [(1, "hat", "cap"), (2, "hat", "cap")]).close()
+    return tmp_path
+
+
+def test_collection_keys(tree_dir):
+    with TraitProofServer(tree_dir) as server:
+        assert server.collection_keys() == ["bayc", "bayc_gold", "punks"]
+
+
+def test_proofs_by_collection_key(tree_dir):
+    reference = TokenTraitTree([(CONTRACT, "fur", "gold", 1), (CONTRACT, "fur", "red", 2)])
+    node = TokenTraitTree.token_node(CONTRACT, "fur", "gold", 1)
+
+    with TraitProofServer(tree_dir) as server:
+        assert server.root("bayc") == reference.root()
+        assert server.proof("bayc", trait_hash("fur", "gold"), 1) == reference.proof(node)
+        assert server.root("bayc_gold") == node
+        assert server.proof("bayc_gold", trait_hash("fur", "gold"), 1) == []
+        assert server.proof("bayc_gold", trait_hash("fur", "red"), 2) is None
+
+
+def test_unknown_collection_key(tree_dir):
+    with TraitProofServer(tree_dir) as server:
+        assert server.tree("mayc") is None
+        assert server.root("mayc") is None
+        assert server.proof("mayc", trait_hash("fur", "gold"), 1) is None
+        assert server.tree(CONTRACT) is None
+
+
+def test_keeps_most_recently_used_trees_open(tree_dir):
+    with TraitProofServer(tree_dir, max_open_trees=2) as server:
+        bayc = server.tree("bayc")
+        server.tree("bayc_gold")
+        assert server.tree("bayc") is bayc
+
+        server.tree("punks")
+
+        assert server.tree("bayc") is bayc
+        assert list(server._trees) == ["punks", "bayc"]
+
+
+def test_refresh_picks_up_rebuilt_trees(tree_dir):
+    with TraitProofServer(tree_dir) as server:
+        root = server.root("bayc")
+        TraitTree.build(tree_dir / "bayc.tree", CONTRACT, [(1, "fur", "gold")]).close()
+        TraitTree.build(tree_dir / "mayc.tree", OTHER_CONTRACT, [(1, "fur", "gold")]).close()
+        assert server.root("bayc") == root
+
+        server.refresh()
+
+        assert server.root("bayc") == TokenTraitTree.token_node(CONTRACT, "fur", "gold", 1)
+        assert server.root("mayc") == TokenTraitTree.token_node(OTHER_CONTRACT, "fur", "gold", 1)
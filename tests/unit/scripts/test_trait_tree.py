@@ -0,0 +1,193 @@
+import json
+from hashlib import sha3_256
+
+import pytest
+from eth_abi import encode
+from eth_utils import keccak
+
+from scripts._helpers.trait_tree import ZERO_HASH, TraitTree, read_token_traits, token_node, token_traits_diff, trait_hash
+
+from ...conftest_base import TokenTraitTree, TraitRootVersion
+
+CONTRACT = "0x" + "ab" * 20
+TOKEN_TRAITS = [
+    (token_id, trait_name, trait_value)
+    for token_id in range(1, 41)
+    for trait_name, trait_value in [("fur", ["gold", "red", "blue"][token_id % 3]), ("eyes", ["bored", "sad"][token_id % 2])]
+]
+
+
+@pytest.fixture(params=list(TraitRootVersion))
+def version(request):
+    return request.param
+
+
+def token_trait_tree(token_traits, version):
+    return TokenTraitTree([(CONTRACT, name, value, token_id) for token_id, name, value in token_traits], version)
+
+
+# reference implementations of the hashing, independent of scripts/_helpers/trait_tree which the contract tests use
+def reference_trait_hash(trait_name, trait_value):
+    return sha3_256(sha3_256(trait_name.encode()).digest() + sha3_256(trait_value.encode()).digest()).digest()
+
+
+def reference_token_node(contract, trait_name, trait_value, token_id):
+    return keccak(
+        encode(["address", "bytes32", "uint256"], [contract, reference_trait_hash(trait_name, trait_value), token_id])
+    )
+
+
+def reference_merge(version):
+    if version == TraitRootVersion.SORTED_PAIR:
+        return lambda b1, b2: keccak(min(b1, b2) + max(b1, b2))
+    return lambda b1, b2: keccak(bytes(x ^ y for x, y in zip(keccak(b1), keccak(b2))))
+
+
+def heap_nodes(leaves, version):
+    # the nodes of a tree with the given leaf slots
+    merge = reference_merge(version)
+    nodes = [ZERO_HASH] * len(leaves) + list(leaves)
+    for i in range(len(leaves) - 1, 0, -1):
+        nodes[i] = merge(nodes[2 * i], nodes[2 * i + 1])
+    return nodes
+
+
+def assert_tree_nodes(tree, version):
+    leaves = [tree.leaf(i) for i in range(tree.size)]
+    nodes = heap_nodes(leaves, version)
+    assert tree.root() == nodes[1]
+    assert [tree.node(i) for i in range(1, 2 * tree.size)] == nodes[1:]
+    for leaf_index, leaf in enumerate(leaves):
+        if leaf != ZERO_HASH:
+            assert tree.leaf_index(leaf) == leaf_index
+
+
+def test_token_node_matches_reference():
+    assert trait_hash("fur", "gold") == reference_trait_hash("fur", "gold")
+    assert token_node(CONTRACT, "fur", "gold", 7) == reference_token_node(CONTRACT, "fur", "gold", 7)
+
+
+def test_token_trait_tree_matches_reference(version):
+    # the in memory tree of the contract tests
+    tree = token_trait_tree(TOKEN_TRAITS, version)
+    leaves = sorted({reference_token_node(CONTRACT, name, value, token_id) for token_id, name, value in TOKEN_TRAITS})
+
+    assert tree.token_nodes == leaves
+    assert tree.proofs[1:] == heap_nodes(leaves, version)[1:]
+
+
+def test_build_matches_reference(tmp_path, version):
+    reference = token_trait_tree(TOKEN_TRAITS, version)
+
+    with TraitTree.build(tmp_path / "bayc.tree", CONTRACT, TOKEN_TRAITS, version) as tree:
+        assert tree.contract == CONTRACT
+        assert tree.version == version
+        assert tree.size == len(reference.token_nodes)
+        assert tree.root() == reference.root()
+        for token_id, name, value in TOKEN_TRAITS:
+            node = reference_token_node(CONTRACT, name, value, token_id)
+            assert tree.token_proof(trait_hash(name, value), token_id) == reference.proof(node)
+
+
+def test_build_multiproof_matches_reference(tmp_path, version):
+    reference = token_trait_tree(TOKEN_TRAITS, version)
+    nodes = [reference_token_node(CONTRACT, "fur", "gold", token_id) for token_id in [3, 6, 9, 30]]
+
+    with TraitTree.build(tmp_path / "bayc.tree", CONTRACT, TOKEN_TRAITS, version) as tree:
+        assert tree.multiproof(tree.leaf_index(node) for node in nodes) == reference.multiproof(nodes)
+
+
+def test_empty_tree(tmp_path, version):
+    with TraitTree.build(tmp_path / "empty.tree", CONTRACT, [], version) as tree:
+        assert tree.size == 0
+        assert tree.root() == ZERO_HASH
+        assert tree.token_proof(trait_hash("fur", "gold"), 1) is None
+
+
+def test_open_rejects_invalid_file(tmp_path):
+    path = tmp_path / "invalid.tree"
+    path.write_bytes(b"\0" * 64)
+
+    with pytest.raises(ValueError, match="Invalid trait tree file"):
+        TraitTree.open(path)
+
+
+def test_build_with_slack_leaves_free_slots(tmp_path, version):
+    with TraitTree.build(tmp_path / "bayc.tree", CONTRACT, TOKEN_TRAITS, version, slack=5) as tree:
+        assert tree.size == len(TOKEN_TRAITS) + 5
+        assert [tree.leaf(i) for i in range(tree.size - 5, tree.size)] == [ZERO_HASH] * 5
+        assert_tree_nodes(tree, version)
+
+
+def test_update_in_place(tmp_path, version):
+    removed, added = TOKEN_TRAITS[:3], [(41, "fur", "gold"), (42, "fur", "red"), (43, "eyes", "sad"), (44, "eyes", "bored")]
+    with TraitTree.build(tmp_path / "bayc.tree", CONTRACT, TOKEN_TRAITS, version, slack=2) as tree:
+        leaf_index = tree.leaf_index(tree.token_leaf(trait_hash(*TOKEN_TRAITS[-1][1:]), TOKEN_TRAITS[-1][0]))
+        proof = tree.proof(leaf_index)
+        update = tree.update(
+            [tree.token_leaf(trait_hash(name, value), token_id) for token_id, name, value in removed],
+            [tree.token_leaf(trait_hash(name, value), token_id) for token_id, name, value in added],
+        )
+        previous_root = tree.root()
+
+    with update.tree as updated:
+        assert not update.rebuilt
+        assert updated.size == tree.size
+        assert updated.root() != previous_root
+        assert_tree_nodes(updated, version)
+        for token_id, name, value in removed:
+            assert updated.token_proof(trait_hash(name, value), token_id) is None
+        for token_id, name, value in added:
+            assert updated.token_proof(trait_hash(name, value), token_id) is not None
+        assert update.patch_proof(leaf_index, proof) == updated.proof(leaf_index)
+
+
+def test_update_rebuilds_without_free_slots(tmp_path, version):
+    added = [(41, "fur", "gold"), (42, "fur", "red")]
+    with TraitTree.build(tmp_path / "bayc.tree", CONTRACT, TOKEN_TRAITS, version) as tree:
+        update = tree.update([], [tree.token_leaf(trait_hash(name, value), token_id) for token_id, name, value in added])
+
+    assert update.rebuilt
+    assert update.changed_nodes == {}
+    with update.tree as updated:
+        assert updated.root() == token_trait_tree(TOKEN_TRAITS + added, version).root()
+        with pytest.raises(ValueError, match="rebuilt"):
+            update.patch_proof(0, updated.proof(0))
+
+
+def test_update_empty_tree(tmp_path, version):
+    with TraitTree.build(tmp_path / "empty.tree", CONTRACT, [], version) as tree:
+        update = tree.update(
+            [], [tree.token_leaf(trait_hash(name, value), token_id) for token_id, name, value in TOKEN_TRAITS]
+        )
+
+    assert update.rebuilt
+    with update.tree:
+        assert update.tree.root() == token_trait_tree(TOKEN_TRAITS, version).root()
+
+
+def test_token_traits_diff(tmp_path):
+    def write_metadata(path, tokens):
+        path.write_text("\n".join(json.dumps(token) for token in tokens) + "\n", encoding="utf8")
+
+    write_metadata(
+        tmp_path / "previous.jsonl",
+        [
+            {"token_id": 1, "attributes": [{"trait_type": "fur", "value": "gold"}]},
+            {"token_id": 2, "attributes": [{"trait_type": "fur", "value": "red"}]},
+        ],
+    )
+    write_metadata(
+        tmp_path / "current.jsonl",
+        [
+            {"token_id": 1, "attributes": [{"trait_type": "fur", "value": "gold"}]},
+            {"token_id": 2, "attributes": [{"trait_type": "fur", "value": "blue"}]},
+            {"token_id": 3, "attributes": None},
+        ],
+    )
+
+    assert list(read_token_traits(tmp_path / "current.jsonl")) == [(1, "fur", "gold"), (2, "fur", "blue")]
+    assert token_traits_diff(tmp_path / "previous.jsonl", tmp_path / "current.jsonl") == (
+        {(2, "fur", "red")},
+        {(2, "fur", "blue")},
+    )
@@ -0,0 +1,217 @@
+import threading
+from functools import partial
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("ape")
+
+from scripts._helpers import transactions  # noqa: E402
+from scripts._helpers.basetypes import ContractConfig, DeploymentContext, Environment  # noqa: E402
+from scripts._helpers.transactions import (  # noqa: E402
+    _split_by_gas,
+    execute,
+    execute_batched,
+    run_by_contract,
+    task_contract,
+)
+
+
+class Network:
+    # the provider calls made by send_transactions, recording the nonces of the transactions sent
+    def __init__(self):
+        self.sent = {}
+        self.lock = threading.Lock()
+        self.eth = self
+        self.web3 = self
+        self.on_send = None
+
+    def send_raw_transaction(self, txn):
+        if self.on_send is not None:
+            self.on_send(txn)
+        with self.lock:
+            assert txn.nonce not in self.sent
+            self.sent[txn.nonce] = txn
+        return txn.nonce.to_bytes(32, "big")
+
+    def get_receipt(self, txn_hash, timeout):  # noqa: ARG002, PLR6301
+        return SimpleNamespace(txn_hash=txn_hash, failed=False)
+
+
+class Owner:
+    nonce = 0
+
+    def __init__(self, network: Network):
+        self.network = network
+
+    def prepare_transaction(self, txn):  # noqa: PLR6301
+        return txn
+
+    def sign_transaction(self, txn):  # noqa: PLR6301
+        return SimpleNamespace(serialize_transaction=lambda: txn)
+
+    def transfer(self, account, value, *, nonce, **kwargs):  # noqa: ARG002
+        self.network.send_raw_transaction(SimpleNamespace(func="transfer", args=(account, value), nonce=nonce))
+
+
+class Function:
+    def __init__(self, name: str):
+        self.name = name
+
+    def as_transaction(self, *args, **kwargs):  # noqa: ARG002
+        # gas estimation fails, as for calls that would revert
+        if args and args[0] == "revert":
+            raise ValueError("execution reverted")
+        return SimpleNamespace(func=self.name, args=args, nonce=None)
+
+    def estimate_gas_cost(self, items, **kwargs):  # noqa: ARG002, PLR6301
+        if "revert" in items:
+            raise ValueError("execution reverted")
+        return 100 * len(items)
+
+
+@pytest.fixture
+def network(monkeypatch):
+    _network = Network()
+    monkeypatch.setattr(transactions, "chain", SimpleNamespace(provider=_network))
+    return _network
+
+
+def contract_config(key: str, address: str) -> ContractConfig:
+    return ContractConfig(key, SimpleNamespace(address=address, set_value=Function("set_value")), None)
+
+
+@pytest.fixture
+def context(network):
+    contracts = {f"contract{i}": contract_config(f"contract{i}", f"0x{i:040x}") for i in range(8)}
+    return DeploymentContext(contracts, Environment.local, "test", Owner(network))
+
+
+def test_failing_tasks_take_no_nonce(context, network):
+    tasks = [
+        (key, partial(execute, context, key, "set_value", "revert" if i % 3 == 0 else i))
+        for i, key in enumerate(context.contracts)
+    ]
+
+    run_by_contract(tasks)
+
+    assert sorted(network.sent) == list(range(5))
+    assert sorted(txn.args[0] for txn in network.sent.values()) == [1, 2, 4, 5, 7]
+
+
+def test_unused_nonce_is_released(context, network):
+    def fail_once(txn):
+        network.on_send = None
+        raise ConnectionError("connection lost")
+
+    network.on_send = fail_once
+    execute(context, "contract0", "set_value", 1)
+    execute(context, "contract1", "set_value", 2)
+
+    assert list(network.sent) == [0]
+    assert network.sent[0].args == (2,)
+
+
+def test_unused_nonce_is_filled_if_later_nonces_were_allocated(context, network):
+    def fail_once(txn):
+        # another task gets the following nonce while this transaction is being sent
+        network.on_send = None
+        execute(context, "contract1", "set_value", 2)
+        raise ConnectionError("connection lost")
+
+    network.on_send = fail_once
+    execute(context, "contract0", "set_value", 1)
+
+    assert sorted(network.sent) == [0, 1]
+    assert network.sent[0].func == "transfer"
+    assert network.sent[0].args == (context.owner, 0)
+    assert network.sent[1].args == (2,)
+
+
+def test_split_by_gas():
+    not_executed = []
+
+    assert _split_by_gas(Function("set_values"), list(range(6)), 250, {}, not_executed) == [[0], [1, 2], [3], [4, 5]]
+    assert _split_by_gas(Function("set_values"), [7], 50, {}, not_executed) == [[7]]
+    assert not not_executed
+
+
+def test_split_by_gas_isolates_failing_items():
+    not_executed = []
+
+    batches = _split_by_gas(Function("set_values"), [1, "revert", 3, 4], 1000, {}, not_executed)
+
+    assert batches == [[1], [3, 4]]
+    assert not_executed == ["revert"]
+
+
+def test_execute_batched(context, network):
+    execute_batched(context, "contract0", "set_value", list(range(7)), batch_size=3, max_gas=250)
+
+    assert [network.sent[nonce].args for nonce in sorted(network.sent)] == [([0],), ([1, 2],), ([3],), ([4, 5],), ([6],)]
+
+
+def test_execute_batched_raises_if_items_fail(context, network, monkeypatch):
+    # the transaction of item 0 reverts, item "revert" fails the gas estimation and is never sent
+    def get_receipt(txn_hash, timeout):  # noqa: ARG001
+        return SimpleNamespace(txn_hash=txn_hash, failed=network.sent[int(txn_hash, 16)].args == ([0],))
+
+    monkeypatch.setattr(network, "get_receipt", get_receipt)
+
+    with pytest.raises(RuntimeError, match=r"2 of 3 items not executed: \['revert', 0\]"):
+        execute_batched(context, "contract0", "set_value", [0, "revert", 2], batch_size=2)
+
+    assert [txn.args for txn in network.sent.values()] == [([0],), ([2],)]
+
+
+def test_execute_batched_raises_if_batches_not_sent(context, network):
+    def fail_second(txn):
+        if txn.nonce == 1:
+            raise ConnectionError("connection lost")
+
+    network.on_send = fail_second
+
+    with pytest.raises(RuntimeError, match=r"3 of 5 items not executed: \[2, 3, 4\]"):
+        execute_batched(context, "contract0", "set_value", list(range(5)), batch_size=2)
+
+    assert [txn.args for txn in network.sent.values()] == [([0, 1],)]
+    # the nonces of the unsent transactions are given back
+    network.on_send = None
+    execute(context, "contract1", "set_value", 1)
+    assert sorted(network.sent) == [0, 1]
+
+
+def test_task_contract_is_the_target_address(context):
+    p2p = context.contracts["contract0"]
+    alias = contract_config("alias", p2p.address())
+    context.contracts["alias"] = alias
+
+    assert task_contract(partial(p2p.after_deploy, context)) == p2p.address()
+    assert task_contract(alias.after_deploy) == task_contract(p2p.after_deploy)
+    assert task_contract(ContractConfig("undeployed", None, None).after_deploy) == "undeployed"
+
+
+def test_run_by_contract_serializes_tasks_of_the_same_contract():
+    running = set()
+    overlaps = []
+    order = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(2)
+
+    def task(contract: str, i: int):
+        with lock:
+            if contract in running:
+                overlaps.append(contract)
+            running.add(contract)
+        if i == 0:
+            # the first tasks of both contracts run at the same time
+            barrier.wait(timeout=5)
+        with lock:
+            running.discard(contract)
+            order.append((contract, i))
+
+    run_by_contract([(contract, partial(task, contract, i)) for i in range(4) for contract in ("p2p", "control")])
+
+    assert not overlaps
+    assert [i for contract, i in order if contract == "p2p"] == [0, 1, 2, 3]
+    assert [i for contract, i in order if contract == "control"] == [0, 1, 2, 3]